@@ -1,89 +1,173 @@
+"""
+Churn trend reports per segment.
+
+Scores every customer once, with the serving model and feature pipeline
+(app.score_customers), then plots the monthly predicted churners and churn
+rate, by month of last purchase, for all customers and for every country,
+gender and age band. The plots render in a process pool.
+
+Rendered plots are cached in REPORT_DIR: the manifest records the data and
+model versions of the last run and a digest of each segment's series. A run
+at the same versions does nothing, without scoring; otherwise only the
+segments whose series (or the model) changed are drawn again.
+
+Usage:
+    python analyze_churn.py [workers] [--force]
+"""
+
+import os
+import sys
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
-import psycopg2
-import joblib
-from datetime import datetime
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-
-# --- Database Connection Details ---
-DB_NAME = "hackathon"
-DB_USER = "postgres"
-DB_PASS = "Post@7070" # <-- IMPORTANT: Change this
-DB_HOST = "localhost"
-DB_PORT = "5432"
-
-# --- Helper Functions (copied from app.py) ---
-def get_data_for_modeling():
-    conn = psycopg2.connect(database=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT)
-    sql_query = """
-        SELECT
-            c.customer_id, c.age, c.gender, c.country, c.signup_date,
-            MAX(o.last_purchase_date) as last_seen,
-            COUNT(o.order_id) as total_orders,
-            SUM(o.quantity) as total_items_purchased,
-            SUM(o.unit_price * o.quantity) as total_spend,
-            AVG(o.ratings) as average_rating,
-            SUM(o.cancellations_count) as total_cancellations
-        FROM customers c JOIN orders o ON c.customer_id = o.customer_id
-        GROUP BY c.customer_id;
-    """
-    df = pd.read_sql(sql_query, conn)
-    conn.close()
-    return df
-
-def feature_engineering(df):
-    df['signup_date'] = pd.to_datetime(df['signup_date'])
-    df['last_seen'] = pd.to_datetime(df['last_seen'])
-    today = datetime.now()
-    df['days_since_last_purchase'] = (today - df['last_seen']).dt.days
-    df['customer_tenure'] = (df['last_seen'] - df['signup_date']).dt.days
-    df['avg_order_value'] = df['total_spend'] / df['total_orders']
-    df.fillna(0, inplace=True)
-    df.replace([float('inf'), float('-inf')], 0, inplace=True)
-    return df
-
-# --- Main Analysis Function ---
-def analyze_and_plot_churn_trends():
-    """Analyzes and plots churn trends over time."""
-    # 1. Load Model
-    model_data = joblib.load('churn_model.pkl')
-    churn_model = model_data['model']
-    model_columns = model_data['columns']
-    
-    # 2. Fetch and prepare data
-    customer_df = get_data_for_modeling()
-    customer_df_featured = feature_engineering(customer_df)
-    
-    # 3. Predict churn for all customers
-    df_predict = pd.get_dummies(customer_df_featured, columns=['gender', 'country'], drop_first=True)
-    df_predict_aligned = df_predict.reindex(columns=model_columns, fill_value=0)
-    
-    # Use predict() to get the final 0 or 1 label
-    customer_df_featured['predicted_churn'] = churn_model.predict(df_predict_aligned[model_columns])
-    
-    # 4. Analyze trends
-    # Set the 'last_seen' as the index for time-series analysis
-    df_time = customer_df_featured.set_index('last_seen')
-    
-    # Resample by month and sum the number of churners
-    monthly_churn = df_time['predicted_churn'].resample('M').sum()
-    
-    # 5. Plot the results
+
+REPORT_DIR = os.path.join('reports', 'churn')
+MANIFEST_PATH = os.path.join(REPORT_DIR, 'manifest.json')
+
+# Same buckets as the sales-by-age endpoint (SALES_BY_AGE_SQL, age_group()):
+# ages outside them, under 18 included, fall in '60+'. Missing ages, which
+# the SQL also puts in '60+', get their own 'Unknown' segment here.
+AGE_BANDS = [('18-25', 18, 25), ('26-35', 26, 35), ('36-45', 36, 45), ('46-60', 46, 60)]
+SEGMENT_COLUMNS = {'country': 'Country', 'gender': 'Gender', 'age_band': 'Age'}
+
+def age_band(ages):
+    ages = pd.to_numeric(ages, errors='coerce')
+    bands = np.select(
+        [ages.between(low, high) for _, low, high in AGE_BANDS],
+        [label for label, _, _ in AGE_BANDS],
+        default='60+'
+    )
+    return pd.Series(np.where(ages.isna(), 'Unknown', bands), index=ages.index)
+
+def slug(value):
+    return ''.join(ch if ch.isalnum() else '_' for ch in str(value).replace('+', ' plus')).strip('_').lower() or 'unknown'
+
+def score_frame():
+    """One row per customer: segments, month of last purchase and predicted label, plus the model version."""
+    import app
+    scores = app.score_customers(app.get_aggregated_data())
+    customers = scores['customers']
+    frame = pd.DataFrame({
+        'country': customers['country'].astype(object).fillna('Unknown').astype(str),
+        'gender': customers['gender'].astype(object).fillna('Unknown').astype(str),
+        'age_band': age_band(customers['age']),
+        'month': customers['last_purchase_date'].dt.to_period('M'),
+        'churned': np.asarray(scores['predicted_churn'], dtype=np.int64),
+    })
+    return frame.dropna(subset=['month']), scores['model_version']
+
+def segment_series(frame):
+    """(name, title, months, churners, customers) for all customers and every segment value."""
+    months = pd.period_range(frame['month'].min(), frame['month'].max(), freq='M')
+    labels = [str(month) for month in months]
+
+    def monthly(group):
+        counts = group.groupby('month')['churned'].agg(['sum', 'count']).reindex(months, fill_value=0)
+        return counts['sum'].to_numpy(), counts['count'].to_numpy()
+
+    series = [('overall', 'All customers', labels, *monthly(frame))]
+    for column, heading in SEGMENT_COLUMNS.items():
+        for value, group in frame.groupby(column, sort=True):
+            series.append((f"{column}_{slug(value)}", f"{heading}: {value}", labels, *monthly(group)))
+    return series
+
+def series_digest(model_version, title, months, churners, customers):
+    digest = hashlib.sha256(repr((model_version, title, months)).encode())
+    digest.update(np.asarray(churners, dtype=np.int64).tobytes())
+    digest.update(np.asarray(customers, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+def render_segment(task):
+    """Draws one segment's plot to a PNG. Runs in a worker process, so it only takes plain values."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    path, title, months, churners, customers = task
+    dates = pd.PeriodIndex(months, freq='M').to_timestamp()
+    rate = np.divide(churners, customers, out=np.zeros(len(churners)), where=np.asarray(customers) > 0) * 100
+
     plt.style.use('seaborn-v0_8-whitegrid')
     fig, ax = plt.subplots(figsize=(12, 6))
-    
-    ax.plot(monthly_churn.index, monthly_churn.values, marker='o', linestyle='-', color='crimson')
-    
-    # Formatting the plot
-    ax.set_title('Monthly Customer Churn Trends', fontsize=16)
-    ax.set_ylabel('Number of Churned Customers')
-    ax.xaxis.set_major_formatter(mdates.DateFormatter('%b %Y'))
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    
-    # Save the plot to a file
-    plt.savefig('churn_trends.png')
-    print("\nSuccess: Churn trend analysis complete. Plot saved to 'churn_trends.png'")
+    ax.plot(dates, churners, marker='o', linestyle='-', color='crimson', label='Predicted churners')
+    ax.set_ylabel('Predicted churners')
+    rate_ax = ax.twinx()
+    rate_ax.plot(dates, rate, linestyle='--', color='steelblue', label='Churn rate (%)')
+    rate_ax.set_ylabel('Churn rate (%)')
+    rate_ax.grid(False)
+    ax.set_title(f"Monthly Customer Churn Trends - {title}", fontsize=16)
+    ax.set_xlabel('Month of last purchase')
+    fig.legend(loc='upper left', bbox_to_anchor=(0.08, 0.92))
+    fig.autofmt_xdate()
+    fig.tight_layout()
+    tmp_path = path + '.tmp.png'
+    fig.savefig(tmp_path)
+    plt.close(fig)
+    os.replace(tmp_path, path)
+    return path
+
+def load_manifest():
+    try:
+        with open(MANIFEST_PATH) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {'segments': {}}
+
+def generate_reports(max_workers=None, force=False):
+    """Renders the plots that are missing or out of date. Returns the manifest."""
+    import app
+    manifest = load_manifest()
+    data_version = app.current_data_version()
+    model_version = app.current_model_version() or app.require_churn_model()['version']
+    if not force and manifest.get('data_version') == data_version and manifest.get('model_version') == model_version:
+        print(f"Success: Reports are up to date (data version {data_version}, model {model_version}).")
+        return manifest
+
+    # 1. Score everyone once
+    frame, model_version = score_frame()
+
+    # 2. Work out which segments changed
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    previous = manifest.get('segments', {})
+    segments, tasks = {}, []
+    for name, title, months, churners, customers in segment_series(frame):
+        digest = series_digest(model_version, title, months, churners, customers)
+        path = os.path.join(REPORT_DIR, f"{name}.png")
+        segments[name] = {
+            'title': title,
+            'file': path,
+            'digest': digest,
+            'customers': int(customers.sum()),
+            'churners': int(churners.sum()),
+        }
+        if force or previous.get(name, {}).get('digest') != digest or not os.path.exists(path):
+            tasks.append((path, title, months, churners.tolist(), customers.tolist()))
+
+    # 3. Draw them across worker processes
+    if tasks:
+        print(f"Rendering {len(tasks)} of {len(segments)} segment plots across worker processes...")
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            list(pool.map(render_segment, tasks, chunksize=max(1, len(tasks) // (4 * (os.cpu_count() or 1)))))
+
+    # Plots of segments that no longer exist
+    for name, entry in previous.items():
+        if name not in segments and os.path.exists(entry['file']):
+            os.remove(entry['file'])
+
+    manifest = {'data_version': data_version, 'model_version': model_version, 'segments': segments}
+    tmp_path = MANIFEST_PATH + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, MANIFEST_PATH)
+    print(f"Success: {len(tasks)} plots rendered, {len(segments) - len(tasks)} unchanged, in '{REPORT_DIR}'.")
+    return manifest
 
+# --- Main Execution Block ---
 if __name__ == '__main__':
-    analyze_and_plot_churn_trends()
\ No newline at end of file
+    args = sys.argv[1:]
+    force = '--force' in args
+    args = [arg for arg in args if arg != '--force']
+    workers = int(args[0]) if args else None
+    generate_reports(max_workers=workers, force=force)
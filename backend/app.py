@@ -1,13 +1,34 @@
-import psycopg2
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
 import joblib
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
 from decimal import Decimal
 import datetime
-from statsmodels.tsa.holtwinters import ExponentialSmoothing
-from data_importer import insert_data_from_df
+from psycopg2 import pool as pg_pool
+from data_importer import insert_chunks, upsert_chunks, get_data_version, UPSERT_CONNECTIONS
+import excel_stream
+import events
+import train_forcaster
+import hierarchical_forecaster
+import churn_history
+import churn_cube
+import cohorts
+import rfm
+import approximate
+import columnar
+import model_registry
+import coalescing
+import query_cache
+import churn_explainer
+import batch_scoring
+import profiling
+from profiling import profiler
+import db_router
 
 
 # from pyngrok import ngrok
@@ -22,52 +43,259 @@ DB_PASS = "Post@7070" # <-- IMPORTANT: Change this
 DB_HOST = "localhost"
 DB_PORT = "5432"
 
-# --- Load the saved model package ---
-try:
-    model_package = joblib.load('churn_model.pkl')
-    churn_model = model_package['model']
-    scaler = model_package['scaler']
-    numeric_columns = model_package['numeric_columns']
-    model_columns = model_package['model_columns']
-    print("Success: New Random Forest model package loaded.")
-except FileNotFoundError:
-    print("Error: 'churn_model.pkl' not found. Please run the train_model.py script first.")
-    exit()
-
-try:
-    sales_forecaster = joblib.load('sales_forecaster.pkl')
-    print("Success: SARIMAX (Sales) model loaded.")
-except FileNotFoundError:
-    print("Warning: 'sales_forecaster.pkl' not found. Sales forecasting will not work.")
-    sales_forecaster = None
+# --- Startup ---
+# eager: load the models at import. background: import returns at once and a
+# warm-up thread loads them. lazy: load them on first use (or /readyz).
+# Requests needing a model wait for the warm-up; /readyz reports when it is done.
+STARTUP_MODE = os.environ.get('STARTUP_MODE', 'eager')
+
+# --- Scoring ---
+# memory: score all customers in one DataFrame. chunked: stream them in
+# batches with bounded memory and keep only the top churners, segment counts
+# and churn rate (batch_scoring.py). A section's `chunked` parameter
+# overrides the mode for one request.
+SCORING_MODE = os.environ.get('SCORING_MODE', 'memory')
+
+# --- Read Replicas ---
+# Reads made while serving GET requests go to the replicas in DB_REPLICAS
+# once they have the data the request needs; the rest goes to DB_HOST
+# (see db_router.py).
+router = db_router.from_environment()
+
+def connect_db(write=False):
+    """A connection to the primary, or to a replica for the reads of a read-only request."""
+    return router.connect(
+        {'database': DB_NAME, 'user': DB_USER, 'password': DB_PASS, 'host': DB_HOST, 'port': DB_PORT}, write=write
+    )
+
+artifact_cache = {}
+artifact_lock = threading.Lock()
+
+def load_artifact(path):
+    """Returns the joblib artifact at `path`, reloading it whenever the file changes."""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return artifact_cache.get(path, (None, None))[1]
+    cached_mtime, artifact = artifact_cache.get(path, (None, None))
+    if mtime != cached_mtime:
+        with artifact_lock:
+            cached_mtime, artifact = artifact_cache.get(path, (None, None))
+            if mtime != cached_mtime:
+                artifact = joblib.load(path)
+                artifact_cache[path] = (mtime, artifact)
+    return artifact
+
+def get_sales_forecaster():
+    """Returns the sales forecaster, reloading it whenever the saved file changes."""
+    return load_artifact(train_forcaster.FORECASTER_PATH)
+
+warm_up_lock = threading.Lock()
+warm_up_state = {'started': False, 'finished': False, 'seconds': None, 'error': None}
+
+def warm_up():
+    """
+    Loads the deployed churn model (see model_registry.py), the sales
+    forecaster and the modules they need. Runs once; later calls return
+    when the first one is done.
+    """
+    with warm_up_lock:
+        if warm_up_state['finished']:
+            return
+        warm_up_state['started'] = True
+        start = time.perf_counter()
+        try:
+            if model_registry.registry.active is None and model_registry.registry.load_current() is None:
+                print("Warning: No churn model registered. Run train_model.py; churn predictions will not work.")
+            else:
+                print(f"Success: Churn model {model_registry.registry.active['version']} loaded.")
+            if get_sales_forecaster() is None:
+                print("Warning: 'sales_forecaster.pkl' not found. Sales forecasting will not work.")
+            else:
+                print("Success: SARIMAX (Sales) model loaded.")
+            # Used by the product demand forecasts
+            import statsmodels.tsa.holtwinters
+        except Exception as e:
+            warm_up_state['error'] = str(e)
+            print(f"Error: Warm-up failed: {e}")
+        finally:
+            warm_up_state['seconds'] = round(time.perf_counter() - start, 3)
+            warm_up_state['finished'] = True
+
+def start_warm_up():
+    """Starts the warm-up in a background thread, unless it has already started."""
+    with warm_up_lock:
+        if warm_up_state['started']:
+            return
+        warm_up_state['started'] = True
+    threading.Thread(target=warm_up, daemon=True).start()
+
+if STARTUP_MODE == 'eager':
+    warm_up()
+elif STARTUP_MODE == 'background':
+    start_warm_up()
 
 # Initialize the Flask application
 app = Flask(__name__)
 CORS(app)
 
+# --- Profiling (opt-in, see profiling.py) ---
+@app.before_request
+def start_profile():
+    session = profiling.current.get()
+    if session is not None:
+        # Async mode: the ASGI middleware decided to profile this request
+        session.endpoint = request.url_rule.rule if request.url_rule else request.path
+        g.profile_attached = session.attach()
+    elif profiler.wanted(request.headers.get(profiling.PROFILE_HEADER)) and not request.path.startswith('/api/admin/'):
+        g.profile = profiler.begin(request.url_rule.rule if request.url_rule else request.path)
+
+@app.teardown_request
+def finish_profile(exc):
+    if g.get('profile') is not None:
+        profiler.end(g.profile)
+    elif g.get('profile_attached'):
+        profiling.current.get().detach()
+
+# --- Read Replicas (see db_router.py) ---
+@app.before_request
+def route_request():
+    min_version = request.headers.get(db_router.DATA_VERSION_HEADER, type=int)
+    g.db_route = db_router.current.set(db_router.Route(request.method in ('GET', 'HEAD'), min_version))
+
+@app.teardown_request
+def finish_route(exc):
+    if g.get('db_route') is not None:
+        db_router.current.reset(g.db_route)
+
+# --- SQL Queries (shared with async_app.py) ---
+def aggregated_data_sql(where_clause=""):
+    """Builds the per-customer aggregation the churn model scores, optionally filtered."""
+    return f"""
+    SELECT
+        c.customer_id, c.age, c.gender, c.country,
+        MIN(c.signup_date) as signup_date,
+        MAX(o.last_purchase_date) as last_purchase_date,
+        COUNT(o.order_id) as purchase_count,
+        SUM(o.quantity) as total_items_purchased,
+        SUM(o.unit_price * o.quantity) as total_spend,
+        AVG(o.ratings) as avg_rating,
+        SUM(o.cancellations_count) as total_cancellations,
+        MAX(o.subscription_status) as subscription_status
+    FROM customers c JOIN orders o ON c.customer_id = o.customer_id
+    {where_clause}
+    GROUP BY c.customer_id, c.age, c.gender, c.country;
+"""
+
+AGGREGATED_DATA_SQL = aggregated_data_sql()
+
+CUSTOMER_SUBSET_SQL = aggregated_data_sql("WHERE c.customer_id = ANY(%(customer_ids)s)")
+
+# Low-cardinality text columns fetched as categoricals, per query
+CATEGORICAL_COLUMNS = {
+    AGGREGATED_DATA_SQL: ('gender', 'country', 'subscription_status'),
+    CUSTOMER_SUBSET_SQL: ('gender', 'country', 'subscription_status'),
+}
+
+# The customers in the approximate-analytics sample (migration 6)
+CUSTOMER_SAMPLE_SQL = aggregated_data_sql("WHERE c.customer_id IN (SELECT customer_id FROM customer_sample)")
+
+# Revenue and units per day: every sales chart and KPI is derived from this
+DAILY_SALES_SQL = """
+    SELECT
+        last_purchase_date,
+        SUM(unit_price * quantity) as order_amount,
+        SUM(quantity) as quantity
+    FROM orders
+    WHERE last_purchase_date IS NOT NULL
+    GROUP BY last_purchase_date;
+"""
+
+ORDER_TOTALS_SQL = """
+    SELECT
+        SUM(unit_price * quantity) as total_revenue,
+        COUNT(*) as total_orders,
+        COUNT(*) FILTER (WHERE subscription_status = 'cancelled') as cancelled_count
+    FROM orders;
+"""
+
+USER_DISTRIBUTION_SQL = """
+    SELECT country, COUNT(customer_id) as user_count
+    FROM customers
+    GROUP BY country
+    ORDER BY user_count DESC;
+"""
+
+# Groups customers into age buckets and sums the quantity they ordered
+SALES_BY_AGE_SQL = """
+    SELECT
+        CASE
+            WHEN c.age BETWEEN 18 AND 25 THEN '18-25'
+            WHEN c.age BETWEEN 26 AND 35 THEN '26-35'
+            WHEN c.age BETWEEN 36 AND 45 THEN '36-45'
+            WHEN c.age BETWEEN 46 AND 60 THEN '46-60'
+            -- Assuming anyone 61 or older is 60+
+            ELSE '60+'
+        END AS age_group,
+        SUM(o.quantity) AS total_sales
+    FROM customers c
+    JOIN orders o ON c.customer_id = o.customer_id
+    GROUP BY age_group
+    ORDER BY total_sales DESC;
+"""
+
+# Leaderboard metrics accepted by the endpoints, mapped to product_sales columns
+LEADERBOARD_METRICS = {'revenue': 'total_revenue', 'units': 'total_units'}
+
+def leaderboard_sql(category=None, metric='revenue', by_name=False):
+    """
+    Builds the query for the top %(k)s products of the product_sales leaderboard.
+    With by_name=True, products sharing a name and category are combined,
+    matching the historical top_products output. Products left without
+    sales (an upsert moved all their orders away) are not listed.
+    """
+    order_column = LEADERBOARD_METRICS[metric]
+    where_clause = "WHERE total_units > 0" + (" AND category = %(category)s" if category else "")
+    if by_name:
+        return f"""
+            SELECT product_name, category,
+                   SUM(total_revenue) as total_revenue, SUM(total_units) as total_units
+            FROM product_sales
+            {where_clause}
+            GROUP BY product_name, category
+            ORDER BY {order_column} DESC, product_name, category
+            LIMIT %(k)s
+        """
+    return f"""
+        SELECT product_id, product_name, category, total_revenue, total_units
+        FROM product_sales
+        {where_clause}
+        ORDER BY {order_column} DESC, product_id
+        LIMIT %(k)s
+    """
+
+def sales_history_sql(category=None, metric='units'):
+    """Builds the query for the order history of the leaderboard's top %(k)s products."""
+    return f"""
+        SELECT o.last_purchase_date, o.product_id, o.quantity, p.product_name
+        FROM orders o
+        JOIN products p ON o.product_id = p.product_id
+        WHERE o.product_id IN (SELECT product_id FROM ({leaderboard_sql(category, metric)}) top_products)
+    """
+
 # --- Helper Functions (used by multiple endpoints) ---
 def json_converter(obj):
     if isinstance(obj, Decimal): return float(obj)
     if isinstance(obj, (datetime.datetime, datetime.date)): return obj.isoformat()
     raise TypeError ("Type %s not serializable" % type(obj))
 
+def read_sql(sql_query, conn, params=None):
+    """Typed columnar equivalent of pd.read_sql (see columnar.py)."""
+    return columnar.read_sql_columnar(conn, sql_query, params, CATEGORICAL_COLUMNS.get(sql_query, ()))
+
 def get_aggregated_data():
-    conn = psycopg2.connect(database=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT)
-    sql_query = """
-        SELECT
-            c.customer_id, c.age, c.gender, c.country,
-            MIN(c.signup_date) as signup_date,
-            MAX(o.last_purchase_date) as last_purchase_date,
-            COUNT(o.order_id) as purchase_count,
-            SUM(o.quantity) as total_items_purchased,
-            SUM(o.unit_price * o.quantity) as total_spend,
-            AVG(o.ratings) as avg_rating,
-            SUM(o.cancellations_count) as total_cancellations,
-            MAX(o.subscription_status) as subscription_status
-        FROM customers c JOIN orders o ON c.customer_id = o.customer_id
-        GROUP BY c.customer_id, c.age, c.gender, c.country;
-    """
-    df = pd.read_sql(sql_query, conn)
+    conn = connect_db()
+    df = read_sql(AGGREGATED_DATA_SQL, conn)
     conn.close()
     return df
 
@@ -75,437 +303,1486 @@ def feature_engineering_for_prediction(df):
     """Applies the same feature engineering as the training script."""
     df['signup_date'] = pd.to_datetime(df['signup_date'], errors='coerce')
     df['last_purchase_date'] = pd.to_datetime(df['last_purchase_date'], errors='coerce')
-    
+
     # --- CRITICAL FIX: Use the same fixed date as the notebook ---
     TODAY = datetime.datetime(2025, 9, 27)
     df['days_since_last_purchase'] = (TODAY - df['last_purchase_date']).dt.days.fillna(9999)
     df['tenure_days'] = (TODAY - df['signup_date']).dt.days.fillna(-1)
     df['avg_spend_per_order'] = df['total_spend'] / df['purchase_count'].replace(0, 1)
     df['purchases_per_year'] = (df['purchase_count'] * 365) / (df['tenure_days'] + 1)
-    
+
     # Fill any remaining NaNs in numeric columns
     num_cols = df.select_dtypes(include=np.number).columns
     for c in num_cols:
         df[c] = df[c].fillna(df[c].median())
-        
+
     return df
 
+def prepare_model_input(customer_df, model):
+    """Feature-engineers aggregated customers and returns (featured_df, model_matrix) for a loaded model."""
+    customer_df_featured = feature_engineering_for_prediction(customer_df)
+    return customer_df_featured, encode_model_input(customer_df_featured, model)
+
+def encode_model_input(customer_df_featured, model):
+    """The model matrix of already feature-engineered customers."""
+    # Every category gets a column and the reindex keeps the trained ones, so a
+    # batch of one country still encodes it (drop_first would drop it)
+    df_predict = pd.get_dummies(customer_df_featured, columns=['gender', 'country'])
+    df_predict_aligned = df_predict.reindex(columns=model['model_columns'], fill_value=0)
+    df_predict_aligned[model['numeric_columns']] = model['scaler'].transform(df_predict_aligned[model['numeric_columns']])
+    return df_predict_aligned[model['model_columns']]
+
+def require_churn_model():
+    if not warm_up_state['finished']:
+        warm_up()
+    # Pick up a swap made through another worker
+    model_registry.registry.sync()
+    model = model_registry.registry.active
+    if model is None:
+        raise RuntimeError("Churn model not loaded.")
+    return model
+
+def predict_with(model, model_input):
+    """Returns churn probabilities and the labels model.predict would give, from one pass over the trees."""
+    probabilities = model['model'].predict_proba(model_input)
+    predictions = model['model'].classes_.take(np.argmax(probabilities, axis=1))
+    return probabilities[:, 1], predictions
+
+def score_customers(customer_df):
+    """
+    Scores every customer once with the active model (taken once, so a
+    concurrent swap never mixes versions). Returns the featured DataFrame,
+    churn probabilities and predicted labels. If a shadow model is set, it
+    scores the same customers in the background for comparison.
+    """
+    model = require_churn_model()
+    shadow_input = customer_df.copy() if model_registry.registry.shadow is not None else None
+    start = time.perf_counter()
+    customer_df_featured, model_input = prepare_model_input(customer_df, model)
+    churn_probability, predicted_churn = predict_with(model, model_input)
+    model_registry.registry.record_latency(model['version'], (time.perf_counter() - start) * 1000)
+    if shadow_input is not None:
+        model_registry.registry.submit_shadow(
+            lambda shadow: predict_with(shadow, prepare_model_input(shadow_input, shadow)[1]),
+            churn_probability, predicted_churn
+        )
+    return {
+        'customers': customer_df_featured,
+        'churn_probability': churn_probability,
+        'predicted_churn': predicted_churn,
+        'model_version': model['version'],
+        'model': model,
+    }
+
+# Chunked scoring keeps one summary, for the latest data version and model
+batch_scorer = batch_scoring.from_environment()
+chunked_summaries = {}
+chunked_lock = threading.Lock()
+
+def chunked_scores(data_version):
+    """
+    Scores every customer in batches (batch_scoring.py) with the active
+    model. Returns the summary (customers_scored, churners, churn_rate,
+    segments, top_churners), computed once per data version and model.
+    """
+    model = require_churn_model()
+    if data_version is None:
+        data_version = current_data_version()
+    key = (data_version, model['version'])
+    with chunked_lock:
+        summary = chunked_summaries.get(key)
+    if summary is not None:
+        return summary
+
+    def compute():
+        conn = connect_db()
+        try:
+            summary = batch_scorer.score(conn, model, predict_with, AGGREGATED_DATA_SQL)
+        finally:
+            conn.close()
+        summary = dict(summary, model=model, data_version=data_version)
+        with chunked_lock:
+            chunked_summaries.clear()
+            chunked_summaries[key] = summary
+        return summary
+    return flights.do(('chunked_scores',) + key, 'chunked_scores', compute)
+
+# Explanations are kept per model version and customer until a newer data version is seen
+explanations = churn_explainer.from_environment()
+
+def explain_customers(model, customer_df, data_version, featured=False):
+    """
+    Per-feature contributions to the churn probability of each customer,
+    sorted by size. Cached explanations are reused; the rest are computed
+    in one batch. `featured` says `customer_df` has already been through
+    feature_engineering_for_prediction (as score_customers returns it).
+    Returns a list in the order of `customer_df`.
+    """
+    customer_ids = customer_df['customer_id'].astype(str).tolist()
+    results = [explanations.get(model['version'], customer_id, data_version) for customer_id in customer_ids]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if not missing:
+        return results
+
+    batch = customer_df.iloc[missing].copy()
+    if featured:
+        model_input = encode_model_input(batch, model)
+    else:
+        _, model_input = prepare_model_input(batch, model)
+    # A lone customer has no population median for missing values; use the training mean
+    model_input = model_input.fillna(0)
+    explainer = churn_explainer.explainer_for(model)
+    contributions = explainer.contributions(model_input)
+    numeric = model['numeric_columns']
+    values = model_input.copy()
+    values[numeric] = model['scaler'].inverse_transform(model_input[numeric])
+    for row, i in enumerate(missing):
+        order = np.argsort(-np.abs(contributions[row]))
+        results[i] = {
+            'customer_id': customer_ids[i],
+            'model_version': model['version'],
+            'churn_probability': round(float(explainer.base_value + contributions[row].sum()), 6),
+            'base_value': round(float(explainer.base_value), 6),
+            'contributions': [
+                {
+                    'feature': explainer.feature_names[j],
+                    'value': float(values.iat[row, j]),
+                    'contribution': round(float(contributions[row, j]), 6),
+                }
+                for j in order
+            ],
+        }
+        explanations.put(model['version'], customer_ids[i], data_version, results[i])
+    return results
+
+def top_features(explanation, count):
+    return dict(explanation, contributions=explanation['contributions'][:count])
+
+churn_history_lock = threading.Lock()
+
+def refresh_churn_history(customer_ids=None):
+    """
+    Scores customers and records them in the churn history and the churn
+    cube: everyone (a full backfill) or only the given customers (an
+    incremental update). Returns the number of customers scored.
+    """
+    conn = connect_db(write=True)
+    try:
+        if customer_ids is None:
+            customer_df = read_sql(AGGREGATED_DATA_SQL, conn)
+        else:
+            customer_df = read_sql(CUSTOMER_SUBSET_SQL, conn, params={'customer_ids': list(customer_ids)})
+        rows = []
+        if not customer_df.empty:
+            scores = score_customers(customer_df)
+            customers = scores['customers']
+            months = customers['last_purchase_date'].dt.to_period('M').dt.to_timestamp()
+            # As churn_history counts them (COALESCE); a categorical NaN would be stored as 'NaN'
+            countries = customers['country'].astype(object).fillna('Unknown')
+            rows = [
+                (customer_id, country, None if pd.isna(month) else month.date(), float(probability), int(predicted))
+                for customer_id, country, month, probability, predicted in zip(
+                    customers['customer_id'], countries, months,
+                    scores['churn_probability'], scores['predicted_churn']
+                )
+            ]
+        elif customer_ids is None:
+            return 0
+        # Given customers left without orders (e.g. theirs moved to another customer) are no longer scored
+        removed = [] if customer_ids is None else sorted(set(customer_ids) - {row[0] for row in rows})
+        churn_history.record_scores(conn, rows, replace_all=customer_ids is None, removed=removed)
+        # Refresh the cube by subset only once it has been built in full
+        if customer_ids is not None and churn_cube.has_cells(conn):
+            churn_cube.refresh(conn, customer_ids)
+        else:
+            churn_cube.refresh(conn)
+        return len(rows)
+    finally:
+        conn.close()
+
+def is_built(check, write=False):
+    """Runs a derived table's `check(conn)`: a read, answered by a replica unless `write`."""
+    conn = connect_db(write=write)
+    try:
+        return check(conn)
+    finally:
+        conn.close()
+
+def ensure_built(lock, check, build):
+    """Runs `build(conn)` on the primary if `check(conn)` says it never ran. Returns True if it did."""
+    if is_built(check):
+        return False
+    with lock:
+        conn = connect_db(write=True)
+        try:
+            if check(conn):
+                return False
+            build(conn)
+            return True
+        finally:
+            conn.close()
+
+def ensure_churn_history():
+    """Backfills the churn history if it was never filled. Returns True if it did."""
+    if is_built(churn_history.has_scores):
+        return False
+    with churn_history_lock:
+        if is_built(churn_history.has_scores, write=True):
+            return False
+        refresh_churn_history()
+        return True
+
+def ensure_churn_cube():
+    """Builds the churn cube from the stored scores if it was never built."""
+    if ensure_churn_history():
+        return
+    ensure_built(churn_history_lock, churn_cube.has_cells, churn_cube.refresh)
+
+cohort_lock = threading.Lock()
+
+def ensure_cohorts():
+    """Builds the cohort retention arrays if they were never built."""
+    ensure_built(cohort_lock, cohorts.has_activity, cohorts.refresh)
+
+rfm_lock = threading.Lock()
+
+def ensure_rfm():
+    """Scores every customer's RFM if it was never done."""
+    ensure_built(rfm_lock, rfm.has_scores, rfm.refresh)
+
+def churn_history_params(params):
+    return {'start': params.get('from'), 'end': params.get('to')}
+
+def read_churn_history(params):
+    conn = connect_db()
+    try:
+        return prepare_source(read_sql(churn_history.CHURN_HISTORY_SQL, conn, params=churn_history_params(params)))
+    finally:
+        conn.close()
+
+def require_sales_forecaster():
+    sales_forecaster = get_sales_forecaster()
+    if sales_forecaster is None:
+        raise RuntimeError("Sales forecasting model not loaded.")
+    return sales_forecaster
+
+# --- Dashboard Sections ---
+# Each section builds one widget from shared query results ("sources") and,
+# if it needs them, the customer churn scores. Sections never modify their
+# inputs, since other sections read the same frames concurrently.
+
+def order_kpis(order_totals):
+    totals = order_totals.iloc[0]
+    total_revenue = totals['total_revenue'] or 0
+    total_orders = totals['total_orders']
+    average_order_value = total_revenue / total_orders if total_orders > 0 else 0
+    return {
+        "total_revenue": float(total_revenue),
+        "total_orders": int(total_orders),
+        "average_order_value": float(average_order_value),
+    }
+
+def section_main_kpis(sources, scores, params):
+    predictions = scores['predicted_churn']
+    churn_rate = (predictions.sum() / len(predictions)) * 100 if len(predictions) > 0 else 0
+    return dict(order_kpis(sources['order_totals']), churn_rate=float(churn_rate))
+
+def section_sales_kpis(sources, scores, params):
+    daily = sources['daily_sales'].dropna(subset=['order_amount']).set_index('last_purchase_date')['order_amount']
+
+    # Find best and worst sales month
+    monthly_sales = daily.resample('M').sum()
+    best_month = monthly_sales.idxmax()
+    worst_month = monthly_sales.idxmin()
+
+    return {
+        "total_revenue": float(daily.sum()),
+        "average_daily_sales": float(daily.mean()),
+        "best_month": best_month.strftime('%B %Y'),
+        "best_month_sales": float(monthly_sales.max()),
+        "worst_month": worst_month.strftime('%B %Y'),
+        "worst_month_sales": float(monthly_sales.min()),
+    }
+
+def section_top_churners(sources, scores, params):
+    count = params.get('count', 10)
+    customers = scores['customers']
+
+    # --- CRITICAL CHANGE: Select more columns for the results ---
+    results_df = customers[[
+        'customer_id',
+        'last_purchase_date',
+        'total_cancellations',
+        'subscription_status'
+    ]].copy()
+    results_df['churn_probability'] = scores['churn_probability']
+
+    top_n_churners = results_df.sort_values(by='churn_probability', ascending=False).head(count)
+
+    # Convert date to string for JSON compatibility
+    top_n_churners['last_purchase_date'] = top_n_churners['last_purchase_date'].dt.strftime('%Y-%m-%d')
+    # A missing (categorical) status is NaN, which JSON can't carry
+    top_n_churners['subscription_status'] = columnar.none_for_missing(top_n_churners['subscription_status'])
+    records = top_n_churners.to_dict(orient='records')
+    if params.get('explain'):
+        batch = explain_customers(scores['model'], customers.loc[top_n_churners.index], scores.get('data_version'), featured=True)
+        for record, explanation in zip(records, batch):
+            record['explanation'] = top_features(explanation, params.get('features', 5))['contributions']
+    return records
+
+def section_churn_trends(sources, scores, params):
+    """Predicted churners per month of last purchase, read from the persisted churn history."""
+    history = sources['churn_history']
+    if history.empty and ensure_churn_history():
+        history = read_churn_history(params)
+    if history.empty:
+        result = {"months": [], "churn_counts": []}
+        if params.get('breakdown') == 'country':
+            result['countries'] = {}
+        return result
+
+    months = pd.date_range(history['month'].min(), history['month'].max(), freq='MS')
+    monthly_churn = history.groupby('month')['churn_count'].sum().reindex(months, fill_value=0)
+    result = {
+        "months": months.strftime('%Y-%m').tolist(),
+        "churn_counts": [int(count) for count in monthly_churn.values]
+    }
+    if params.get('breakdown') == 'country':
+        by_country = history.pivot_table(index='month', columns='country', values='churn_count', aggfunc='sum')
+        by_country = by_country.reindex(months).fillna(0)
+        result['countries'] = {
+            country: [int(count) for count in by_country[country].values] for country in by_country.columns
+        }
+    return result
+
+def section_churn_segmentation(sources, scores, params):
+    def assign_segment(prob):
+        if prob < 0.3: return 'Low Risk'
+        elif prob < 0.7: return 'Medium Risk'
+        else: return 'High Risk'
+    segments = pd.Series(scores['churn_probability']).apply(assign_segment)
+    return segments.value_counts().to_dict()
+
+# Chunked variants: `scores` is the chunked_scores summary
+def section_main_kpis_chunked(sources, scores, params):
+    return dict(order_kpis(sources['order_totals']), churn_rate=float(scores['churn_rate']))
+
+def section_top_churners_chunked(sources, scores, params):
+    records = [dict(record) for record in scores['top_churners'][:params.get('count', 10)]]
+    if params.get('explain') and records:
+        customer_ids = [record['customer_id'] for record in records]
+        conn = connect_db()
+        try:
+            customer_df = read_sql(CUSTOMER_SUBSET_SQL, conn, params={'customer_ids': customer_ids})
+        finally:
+            conn.close()
+        customer_df = customer_df.set_index(customer_df['customer_id'].astype(str)).loc[customer_ids]
+        batch = explain_customers(scores['model'], customer_df.reset_index(drop=True), scores['data_version'])
+        for record, explanation in zip(records, batch):
+            record['explanation'] = top_features(explanation, params.get('features', 5))['contributions']
+    return records
+
+def section_churn_segmentation_chunked(sources, scores, params):
+    return dict(scores['segments'])
+
+def section_sales_forecast(sources, scores, params):
+    forecast_results = require_sales_forecaster().get_forecast(steps=params.get('days', 30))
+
+    # Get the mean prediction
+    predicted_mean = forecast_results.predicted_mean
+
+    # Get the confidence interval to show a range of uncertainty
+    confidence_interval = forecast_results.conf_int()
+
+    # Format the data for the frontend chart
+    return {
+        "dates": predicted_mean.index.strftime('%Y-%m-%d').tolist(),
+        "predicted_sales": predicted_mean.values.tolist(),
+        "confidence_lower": confidence_interval.iloc[:, 0].values.tolist(),
+        "confidence_upper": confidence_interval.iloc[:, 1].values.tolist(),
+    }
+
+def section_full_sales_view(sources, scores, params):
+    sales_forecaster = require_sales_forecaster()
+
+    # Part 1: The last 180 days of sales, relative to the most recent sale
+    daily = sources['daily_sales']
+    recent = daily[daily['last_purchase_date'] >= daily['last_purchase_date'].max() - pd.Timedelta(days=180)]
+    historical_sales = recent.groupby('last_purchase_date')['order_amount'].sum().asfreq('D').fillna(0)
+
+    # Part 2: Generate Forecast
+    forecast_results = sales_forecaster.get_forecast(steps=params.get('days', 90))
+    predicted_mean = forecast_results.predicted_mean
+
+    # Part 3: Combine and Format Data
+    return {
+        "historical_dates": historical_sales.index.strftime('%Y-%m-%d').tolist(),
+        "historical_sales": historical_sales.values.tolist(),
+        "forecast_dates": predicted_mean.index.strftime('%Y-%m-%d').tolist(),
+        "forecast_sales": predicted_mean.values.tolist(),
+    }
+
+def section_top_products(sources, scores, params):
+    df = sources['top_products'].rename(columns={'total_revenue': 'total_sales'})
+    df['total_sales'] = df['total_sales'].astype(float)
+    df['total_units'] = df['total_units'].astype(int)
+    return df.to_dict(orient='records')
+
+def section_product_demand_forecast(sources, scores, params):
+    """Forecasts 30-day demand per top product, with a fallback for sparse data."""
+    top_products = sources['demand_products']
+    sales_history_df = sources['demand_history']
+
+    all_forecasts = []
+    for product_id, product_name in zip(top_products['product_id'], top_products['product_name']):
+        product_sales = sales_history_df[sales_history_df['product_id'] == product_id]
+        daily_demand = product_sales.groupby('last_purchase_date')['quantity'].sum().asfreq('D').fillna(0)
+
+        forecasted_demand = 0
+        if len(daily_demand[daily_demand > 0]) > 7:
+            from statsmodels.tsa.holtwinters import ExponentialSmoothing
+            model = ExponentialSmoothing(daily_demand, trend='add', seasonal=None).fit(smoothing_level=0.2)
+            forecast = model.forecast(30)
+            forecasted_demand = abs(round(forecast.sum()))
+        elif not daily_demand.empty:
+            # Products without dated orders keep a demand of 0
+            total_units = daily_demand.sum()
+            days_with_sales = (daily_demand.index.max() - daily_demand.index.min()).days
+            if days_with_sales > 0:
+                avg_daily_rate = total_units / days_with_sales
+                forecasted_demand = abs(round(avg_daily_rate * 30))
+            else:
+                forecasted_demand = total_units
+
+        all_forecasts.append({
+            "product_id": product_id,
+            "product_name": product_name,
+            # --- CRITICAL FIX: Convert the number to a standard Python integer ---
+            "forecasted_demand_30_days": int(forecasted_demand)
+        })
+    return all_forecasts
+
+def section_user_distribution(sources, scores, params):
+    return sources['user_distribution'].to_dict(orient='records')
+
+def section_sales_by_age(sources, scores, params):
+    # Example output structure: [{"age_group": "26-35", "total_sales": 150000.50}, ...]
+    return sources['sales_by_age'].to_dict(orient='records')
+
+def section_monthly_sales(sources, scores, params):
+    daily = sources['daily_sales'].dropna(subset=['quantity'])
+
+    # Group by Year-Month and sum quantities
+    monthly_sales = daily.groupby(daily['last_purchase_date'].dt.to_period("M"))['quantity'].sum()
+    return [
+        {"month": month.strftime('%B %Y'), "total_quantity": int(quantity)}
+        for month, quantity in monthly_sales.items()
+    ]
+
+def section_yearly_sales(sources, scores, params):
+    daily = sources['daily_sales'].dropna(subset=['quantity'])
+    yearly_sales = daily.groupby(daily['last_purchase_date'].dt.year)['quantity'].sum()
+    return [
+        {"year": int(year), "total_quantity": int(quantity)}
+        for year, quantity in yearly_sales.items()
+    ]
+
+def section_db_stats(sources, scores, params):
+    totals = sources['order_totals'].iloc[0]
+    total_count = int(totals['total_orders'])
+    cancelled_count = int(totals['cancelled_count'])
+
+    # Percentage calculation
+    cancelled_percentage = (
+        (cancelled_count / total_count) * 100 if total_count > 0 else 0
+    )
+    return {
+        "total_entries": total_count,
+        "cancelled_count": cancelled_count,
+        "cancelled_percentage": round(cancelled_percentage, 2)
+    }
+
+# --- Approximate Sections (?approx=true) ---
+# Estimates from the stratified order and customer samples, with 95%
+# confidence intervals and the sample size they rest on.
+
+def month_estimates(strata, sample_months):
+    """Per-month revenue estimates and variances from the order sample, dated months only."""
+    months = strata.merge(sample_months, on='month', how='left').fillna({
+        'sampled': 0, 'amount_sum': 0, 'amount_sum_sq': 0
+    })
+    months = months[months['month'] != pd.Timestamp(approximate.UNDATED_MONTH)].sort_values('month')
+    estimates = [
+        approximate.stratified_total([row.population], [row.sampled], [row.amount_sum], [row.amount_sum_sq])
+        for row in months.itertuples()
+    ]
+    months['estimate'] = [estimate for estimate, _ in estimates]
+    months['variance'] = [variance for _, variance in estimates]
+    return months
+
+def section_sales_kpis_approx(sources, scores, params):
+    months = month_estimates(sources['order_strata'], sources['order_sample_months'])
+    total_revenue, total_variance = months['estimate'].sum(), months['variance'].sum()
+
+    # Assumes sales on every day between the first and last sampled sale
+    first_date = pd.to_datetime(months['first_date']).min()
+    last_date = pd.to_datetime(months['last_date']).max()
+    days = (last_date - first_date).days + 1 if pd.notna(first_date) else 1
+
+    best = months.loc[months['estimate'].idxmax()]
+    worst = months.loc[months['estimate'].idxmin()]
+    return {
+        "total_revenue": float(total_revenue),
+        "average_daily_sales": float(total_revenue / days),
+        "best_month": best['month'].strftime('%B %Y'),
+        "best_month_sales": float(best['estimate']),
+        "worst_month": worst['month'].strftime('%B %Y'),
+        "worst_month_sales": float(worst['estimate']),
+        "approximate": True,
+        "confidence_level": approximate.CONFIDENCE_LEVEL,
+        "sample_size": int(months['sampled'].sum()),
+        "confidence_intervals": {
+            "total_revenue": approximate.interval(total_revenue, total_variance),
+            "average_daily_sales": approximate.interval(total_revenue, total_variance, 1 / days),
+            "best_month_sales": approximate.interval(best['estimate'], best['variance']),
+            "worst_month_sales": approximate.interval(worst['estimate'], worst['variance']),
+        },
+    }
+
+def section_main_kpis_approx(sources, scores, params):
+    strata = sources['order_strata'].merge(sources['order_sample_months'], on='month', how='left').fillna(0)
+    total_orders = int(strata['population'].sum())
+    total_revenue, revenue_variance = approximate.stratified_total(
+        strata['population'], strata['sampled'], strata['amount_sum'], strata['amount_sum_sq']
+    )
+    average_order_value = total_revenue / total_orders if total_orders > 0 else 0
+
+    # Churn rate: score only the sampled customers, weighted by country
+    sample_scores = score_customers(sources['customer_sample'].copy())
+    sampled = pd.DataFrame({
+        'country': sample_scores['customers']['country'].fillna('Unknown'),
+        'predicted_churn': sample_scores['predicted_churn'],
+    }).groupby('country')['predicted_churn'].agg(['count', 'sum'])
+    countries = sources['customer_strata'].set_index('country').join(sampled).fillna(0)
+    churn_share, churn_variance = approximate.stratified_proportion(
+        countries['population'], countries['count'], countries['sum']
+    )
+
+    return {
+        "total_revenue": float(total_revenue),
+        "total_orders": total_orders,
+        "average_order_value": float(average_order_value),
+        "churn_rate": float(churn_share * 100),
+        "approximate": True,
+        "confidence_level": approximate.CONFIDENCE_LEVEL,
+        "sample_size": {"orders": int(strata['sampled'].sum()), "customers": int(countries['count'].sum())},
+        "confidence_intervals": {
+            "total_revenue": approximate.interval(total_revenue, revenue_variance),
+            "average_order_value": approximate.interval(
+                total_revenue, revenue_variance, 1 / total_orders if total_orders > 0 else 0
+            ),
+            "churn_rate": approximate.interval(churn_share, churn_variance, 100),
+        },
+    }
+
+def section_sales_by_age_approx(sources, scores, params):
+    strata = sources['order_strata'].merge(sources['order_sample_months'][['month', 'sampled']], on='month', how='left')
+    strata['sampled'] = strata['sampled'].fillna(0)
+    groups = sources['order_sample_age']
+
+    age_data = []
+    for age_group, group in groups.groupby('age_group'):
+        # Orders outside the group count as zeros in their stratum
+        group_strata = strata.merge(group, on='month', how='left').fillna({
+            'group_sampled': 0, 'quantity_sum': 0, 'quantity_sum_sq': 0
+        })
+        estimate, variance = approximate.stratified_total(
+            group_strata['population'], group_strata['sampled'],
+            group_strata['quantity_sum'], group_strata['quantity_sum_sq']
+        )
+        age_data.append({
+            "age_group": age_group,
+            "total_sales": estimate,
+            "confidence_interval": approximate.interval(estimate, variance),
+            "sample_size": int(group_strata['group_sampled'].sum()),
+        })
+    return sorted(age_data, key=lambda row: row['total_sales'], reverse=True)
+
+def leaderboard_params(params, default_k, default_metric):
+    return {
+        'k': params.get('k', default_k),
+        'category': params.get('category'),
+        'metric': params.get('metric', default_metric),
+    }
+
+def top_products_sources(params):
+    p = leaderboard_params(params, 10, 'revenue')
+    key = f"top_products:{p['k']}:{p['category']}:{p['metric']}"
+    return {'top_products': (key, leaderboard_sql(p['category'], p['metric'], by_name=True), p)}
+
+def demand_sources(params):
+    p = leaderboard_params(params, 5, 'units')
+    key = f"{p['k']}:{p['category']}:{p['metric']}"
+    return {
+        'demand_products': ('demand_products:' + key, leaderboard_sql(p['category'], p['metric']), p),
+        'demand_history': ('demand_history:' + key, sales_history_sql(p['category'], p['metric']), p),
+    }
+
+def churn_history_sources(params):
+    p = churn_history_params(params)
+    key = f"churn_history:{p['start']}:{p['end']}"
+    return {'churn_history': (key, churn_history.CHURN_HISTORY_SQL, p)}
+
+def shared_source(name, sql_query):
+    return lambda params: {name: (name, sql_query, None)}
+
+# name -> (sources for the given params, needs churn scores, builder)
+DASHBOARD_SECTIONS = {
+    'main_kpis': (shared_source('order_totals', ORDER_TOTALS_SQL), True, section_main_kpis),
+    'sales_kpis': (shared_source('daily_sales', DAILY_SALES_SQL), False, section_sales_kpis),
+    'top_churners': (shared_source('customers', AGGREGATED_DATA_SQL), True, section_top_churners),
+    'churn_trends': (churn_history_sources, False, section_churn_trends),
+    'churn_segmentation': (shared_source('customers', AGGREGATED_DATA_SQL), True, section_churn_segmentation),
+    'sales_forecast': (lambda params: {}, False, section_sales_forecast),
+    'full_sales_view': (shared_source('daily_sales', DAILY_SALES_SQL), False, section_full_sales_view),
+    'top_products': (top_products_sources, False, section_top_products),
+    'product_demand_forecast': (demand_sources, False, section_product_demand_forecast),
+    'user_distribution': (shared_source('user_distribution', USER_DISTRIBUTION_SQL), False, section_user_distribution),
+    'sales_by_age': (shared_source('sales_by_age', SALES_BY_AGE_SQL), False, section_sales_by_age),
+    'monthly_sales': (shared_source('daily_sales', DAILY_SALES_SQL), False, section_monthly_sales),
+    'yearly_sales': (shared_source('daily_sales', DAILY_SALES_SQL), False, section_yearly_sales),
+    'db_stats': (shared_source('order_totals', ORDER_TOTALS_SQL), False, section_db_stats),
+}
+
+def approx_sources(*names):
+    queries = {
+        'order_strata': approximate.ORDER_STRATA_SQL,
+        'order_sample_months': approximate.ORDER_SAMPLE_MONTHS_SQL,
+        'order_sample_age': approximate.ORDER_SAMPLE_AGE_SQL,
+        'customer_strata': approximate.CUSTOMER_STRATA_SQL,
+        'customer_sample': CUSTOMER_SAMPLE_SQL,
+    }
+    return lambda params: {name: (name, queries[name], None) for name in names}
+
+# Sections with an approximate variant, used when their params have approx=true
+APPROX_SECTIONS = {
+    'main_kpis': (
+        approx_sources('order_strata', 'order_sample_months', 'customer_strata', 'customer_sample'),
+        False, section_main_kpis_approx
+    ),
+    'sales_kpis': (approx_sources('order_strata', 'order_sample_months'), False, section_sales_kpis_approx),
+    'sales_by_age': (
+        approx_sources('order_strata', 'order_sample_months', 'order_sample_age'),
+        False, section_sales_by_age_approx
+    ),
+}
+
+# Sections built from the chunked scoring summary, used when their params
+# have chunked=true (default: SCORING_MODE=chunked)
+CHUNKED_SCORES = 'chunked'
+CHUNKED_SECTIONS = {
+    'main_kpis': (shared_source('order_totals', ORDER_TOTALS_SQL), CHUNKED_SCORES, section_main_kpis_chunked),
+    'top_churners': (lambda params: {}, CHUNKED_SCORES, section_top_churners_chunked),
+    'churn_segmentation': (lambda params: {}, CHUNKED_SCORES, section_churn_segmentation_chunked),
+}
+
+def scores_chunked(params):
+    return params.get('chunked', SCORING_MODE == 'chunked')
+
+def section_spec(section, params):
+    """Returns (sources, needs scores, builder) for a section and its params."""
+    if params.get('approx') and section in APPROX_SECTIONS:
+        return APPROX_SECTIONS[section]
+    if scores_chunked(params) and section in CHUNKED_SECTIONS:
+        return CHUNKED_SECTIONS[section]
+    return DASHBOARD_SECTIONS[section]
+
+dashboard_executor = ThreadPoolExecutor(max_workers=8)
+
+# Query results are reused until the next upload bumps the data version.
+# The churn history is rewritten after uploads and model swaps without a
+# bump of its own, so it is always read fresh.
+query_results = query_cache.from_environment()
+UNCACHED_QUERIES = {churn_history.CHURN_HISTORY_SQL}
+
+def plan_dashboard(requests):
+    """
+    Works out which queries a set of sections needs.
+    `requests` maps section name -> params. Returns (queries, needs_scores)
+    where queries maps a unique query key -> (sql, params); sections that
+    share a query get the same key, so it runs once.
+    """
+    queries = {}
+    needs_scores = False
+    for section, params in requests.items():
+        sources_for, section_needs_scores, _ = section_spec(section, params)
+        for _, (key, sql_query, sql_params) in sources_for(params).items():
+            queries[key] = (sql_query, sql_params)
+        if section_needs_scores:
+            needs_scores = True
+        if section_needs_scores is True:
+            queries['customers'] = (AGGREGATED_DATA_SQL, None)
+    return queries, needs_scores
+
+def prepare_source(df):
+    """Parses date columns once, so sections can share the frame read-only."""
+    for column in ('last_purchase_date', 'month'):
+        if column in df.columns:
+            df[column] = pd.to_datetime(df[column], errors='coerce')
+    return df
+
+def build_dashboard(requests, frames, timings=None, data_version=None):
+    """
+    Builds the requested sections from fetched query results (read at
+    `data_version`). Scores customers once if any section needs it (in
+    memory, chunked or both), then builds independent sections concurrently.
+    Returns {"sections", "errors", "timings_ms"}.
+    """
+    timings = dict(timings or {})
+    scoring = {section_spec(section, params)[1] for section, params in requests.items()}
+
+    scores = None
+    if True in scoring:
+        start = time.perf_counter()
+        scores = score_customers(frames['customers'].copy())
+        scores['data_version'] = data_version
+        timings['scoring'] = round((time.perf_counter() - start) * 1000, 1)
+    summary = None
+    if CHUNKED_SCORES in scoring:
+        start = time.perf_counter()
+        summary = chunked_scores(data_version)
+        timings['chunked_scoring'] = round((time.perf_counter() - start) * 1000, 1)
+
+    def build(section):
+        params = requests[section]
+        sources_for, section_scoring, builder = section_spec(section, params)
+        sources = {name: frames[key] for name, (key, _, _) in sources_for(params).items()}
+        start = time.perf_counter()
+        result = builder(sources, summary if section_scoring == CHUNKED_SCORES else scores, params)
+        return result, round((time.perf_counter() - start) * 1000, 1)
+
+    sections, errors, section_timings = {}, {}, {}
+    futures = {section: dashboard_executor.submit(db_router.propagate(profiler.propagate(build)), section) for section in requests}
+    for section, future in futures.items():
+        try:
+            sections[section], section_timings[section] = future.result()
+        except Exception as e:
+            errors[section] = str(e)
+    timings['sections'] = section_timings
+    return {"sections": sections, "errors": errors, "timings_ms": timings}
+
+def compute_dashboard(requests, data_version=None):
+    """
+    Runs each distinct query once, concurrently on separate connections, and
+    builds the sections. Results cached for the current data version are reused.
+    """
+    start = time.perf_counter()
+    queries, _ = plan_dashboard(requests)
+    if data_version is None:
+        data_version = current_data_version()
+
+    def fetch(sql_query, sql_params):
+        query_start = time.perf_counter()
+        cacheable = sql_query not in UNCACHED_QUERIES
+        df = query_results.get(sql_query, sql_params, data_version) if cacheable else None
+        if df is None:
+            conn = connect_db()
+            try:
+                df = prepare_source(read_sql(sql_query, conn, params=sql_params))
+            finally:
+                conn.close()
+            if cacheable:
+                query_results.put(sql_query, sql_params, data_version, df)
+        return df, round((time.perf_counter() - query_start) * 1000, 1)
+
+    futures = {key: dashboard_executor.submit(db_router.propagate(profiler.propagate(fetch)), *query) for key, query in queries.items()}
+    frames, query_timings = {}, {}
+    for key, future in futures.items():
+        frames[key], query_timings[key] = future.result()
+
+    result = build_dashboard(requests, frames, {'queries': query_timings}, data_version)
+    result['timings_ms']['total'] = round((time.perf_counter() - start) * 1000, 1)
+    return result
+
+# Identical concurrent dashboard requests share one computation
+flights = coalescing.SingleFlight()
+
+def current_data_version():
+    conn = connect_db()
+    try:
+        return get_data_version(conn)
+    finally:
+        conn.close()
+
+def current_model_version():
+    active = model_registry.registry.active
+    return active['version'] if active else None
+
+def coalesced_dashboard(requests):
+    """compute_dashboard, shared with identical requests already in flight for the same data and model."""
+    data_version = current_data_version()
+    key = coalescing.request_key(requests, data_version, current_model_version())
+    return flights.do(key, coalescing.endpoint_label(requests), lambda: compute_dashboard(requests, data_version))
+
+def parse_bool(value):
+    return value.lower() in ('true', '1', 'yes')
+
+def parse_month(value):
+    """Parses a YYYY-MM month into the date of its first day."""
+    return datetime.datetime.strptime(value, '%Y-%m').date()
+
+# Query parameters a section may take, and their types
+SECTION_PARAM_TYPES = {
+    'count': int, 'days': int, 'k': int, 'category': str, 'metric': str,
+    'from': parse_month, 'to': parse_month, 'breakdown': str, 'approx': parse_bool,
+    'explain': parse_bool, 'features': int, 'chunked': parse_bool,
+}
+
+def read_section_params(args, prefix=''):
+    """Reads a section's parameters from the query string; bad integers fall back to the default."""
+    params = {}
+    for name, cast in SECTION_PARAM_TYPES.items():
+        value = args.get(prefix + name)
+        if value is None:
+            continue
+        try:
+            params[name] = cast(value)
+        except ValueError:
+            pass
+    return params
+
+# Parameters that are a number of rows, days or features to return
+POSITIVE_SECTION_PARAMS = ('count', 'days', 'k', 'features')
+
+def validate_section_params(params):
+    for name in POSITIVE_SECTION_PARAMS:
+        if params.get(name, 1) < 1:
+            return f"{name} must be at least 1."
+    metric = params.get('metric')
+    if metric is not None and metric not in LEADERBOARD_METRICS:
+        return f"Unknown metric '{metric}'. Use 'revenue' or 'units'."
+    breakdown = params.get('breakdown')
+    if breakdown is not None and breakdown != 'country':
+        return f"Unknown breakdown '{breakdown}'. Use 'country'."
+    if scores_chunked(params) and params.get('count', 0) > batch_scorer.top_k:
+        return f"count can be at most {batch_scorer.top_k} with chunked scoring (SCORING_TOP_K)."
+    return None
+
+def read_dashboard_request(args):
+    """
+    Parses /api/dashboard's query string into {section: params}.
+    `sections` is a comma-separated list (default: all), and each section's
+    parameters are prefixed with its name, e.g. top_churners.count=20.
+    Returns (requests, error).
+    """
+    names = [name for name in args.get('sections', '').split(',') if name] or list(DASHBOARD_SECTIONS)
+    unknown = [name for name in names if name not in DASHBOARD_SECTIONS]
+    if unknown:
+        return None, f"Unknown section(s): {', '.join(unknown)}."
+    requests = {}
+    for name in names:
+        requests[name] = read_section_params(args, prefix=name + '.')
+        error = validate_section_params(requests[name])
+        if error:
+            return None, error
+    return requests, None
+
+def dashboard_view(section, args, error_message=None):
+    """Serves one dashboard section as its own endpoint."""
+    params = read_section_params(args)
+    error = validate_section_params(params)
+    if error:
+        return jsonify({"error": error}), 400
+    try:
+        result = coalesced_dashboard({section: params})
+        if section in result['errors']:
+            raise RuntimeError(result['errors'][section])
+        return jsonify(result['sections'][section])
+    except Exception as e:
+        if error_message:
+            print(f"Error in {section}: {e}")
+            return jsonify({"error": error_message}), 500
+        return jsonify({"error": str(e)}), 500
+
+def build_orders(rows, column_names):
+    orders_list = []
+    for row in rows:
+        order_dict = dict(zip(column_names, row))
+        for key, value in order_dict.items():
+            order_dict[key] = json_converter(value) if isinstance(value, (Decimal, datetime.date)) else value
+        orders_list.append(order_dict)
+    return orders_list
+
+# --- Live Updates ---
+# After an upload, the sections below are recomputed once and pushed to every
+# open /api/events stream with their change since the previous push.
+EVENT_SECTIONS = {'main_kpis': {}, 'churn_segmentation': {}, 'top_churners': {'count': 10}}
+
+# Events reach the streams of every API process through the primary (see events.py)
+events.broker.connect = lambda: connect_db(write=True)
+
+event_lock = threading.Lock()
+baseline_started = False
+
+def dashboard_deltas(previous, current):
+    """Returns how the event sections changed between two snapshots."""
+    previous_kpis, current_kpis = previous['main_kpis'], current['main_kpis']
+    previous_segments, current_segments = previous['churn_segmentation'], current['churn_segmentation']
+    previous_ids = [row['customer_id'] for row in previous['top_churners']]
+    current_ids = [row['customer_id'] for row in current['top_churners']]
+    return {
+        "main_kpis": {key: current_kpis[key] - previous_kpis[key] for key in current_kpis},
+        "churn_segmentation": {
+            segment: current_segments.get(segment, 0) - previous_segments.get(segment, 0)
+            for segment in sorted(set(previous_segments) | set(current_segments))
+        },
+        "top_churners": {
+            "entered": [customer_id for customer_id in current_ids if customer_id not in previous_ids],
+            "left": [customer_id for customer_id in previous_ids if customer_id not in current_ids],
+        },
+    }
+
+def refresh_event_snapshot(data_version, relay=True):
+    """
+    Recomputes the event sections and publishes them, with deltas against
+    the last sections published (by any process) once there are some.
+    """
+    with event_lock:
+        result = compute_dashboard(EVENT_SECTIONS)
+        if result['errors']:
+            print(f"Error: Could not refresh live dashboard sections: {result['errors']}")
+            return
+        previous = events.broker.last('dashboard_update')
+        events.broker.publish('dashboard_update', {
+            "data_version": data_version,
+            "sections": result['sections'],
+            "deltas": dashboard_deltas(previous['sections'], result['sections']) if previous else None,
+        }, relay=relay)
+
+def refresh_after_upload(data_version, customer_ids, previous_month=None):
+    """
+    Rebuilds the caches that depend on the data, then pushes the new
+    numbers. `previous_month` is the earliest month an upsert moved orders
+    out of (None for an insert).
+    """
+    try:
+        train_forcaster.update_forecaster()
+    except Exception as e:
+        print(f"Error: Forecaster update failed: {e}")
+    try:
+        # Rescore only the uploaded customers, once the history has been backfilled
+        with churn_history_lock:
+            conn = connect_db(write=True)
+            try:
+                backfilled = churn_history.has_scores(conn)
+            finally:
+                conn.close()
+            if backfilled:
+                refresh_churn_history(customer_ids)
+    except Exception as e:
+        print(f"Error: Churn history update failed: {e}")
+    try:
+        # Count the uploaded months again, once the cohorts have been built
+        with cohort_lock:
+            conn = connect_db(write=True)
+            try:
+                if cohorts.has_activity(conn):
+                    cohorts.refresh(conn, customer_ids, previous_month)
+            finally:
+                conn.close()
+    except Exception as e:
+        print(f"Error: Cohort retention update failed: {e}")
+    try:
+        # Move the uploaded customers in the sketches, once everyone has been scored
+        with rfm_lock:
+            conn = connect_db(write=True)
+            try:
+                if rfm.has_scores(conn):
+                    rfm.refresh(conn, customer_ids)
+            finally:
+                conn.close()
+    except Exception as e:
+        print(f"Error: RFM update failed: {e}")
+    refresh_event_snapshot(data_version)
+
+def refresh_after_model_swap(version):
+    """Rescores every customer into the churn history with the new model, then pushes recomputed numbers."""
+    events.broker.publish('model_version', {"model_version": version})
+    try:
+        with churn_history_lock:
+            conn = connect_db()
+            try:
+                backfilled = churn_history.has_scores(conn)
+                data_version = get_data_version(conn)
+            finally:
+                conn.close()
+            if backfilled:
+                refresh_churn_history()
+    except Exception as e:
+        print(f"Error: Churn history rebuild after model swap failed: {e}")
+        return
+    refresh_event_snapshot(data_version)
+
+model_registry.registry.on_swap.append(
+    lambda version: threading.Thread(target=refresh_after_model_swap, args=(version,), daemon=True).start()
+)
+
+def ensure_event_baseline():
+    """
+    On the first subscriber, publishes the current version and snapshot to
+    this process's streams so later deltas have a base.
+    """
+    global baseline_started
+    with event_lock:
+        if baseline_started:
+            return
+        baseline_started = True
+
+    def baseline():
+        conn = connect_db()
+        try:
+            data_version = get_data_version(conn)
+        finally:
+            conn.close()
+        events.broker.publish('data_version', {"data_version": data_version}, relay=False)
+        refresh_event_snapshot(data_version, relay=False)
+
+    threading.Thread(target=baseline, daemon=True).start()
+
 # --- API Endpoints ---
 @app.route('/api/orders', methods=['GET'])
 def get_orders():
     # ... (This endpoint is restored) ...
-    conn = psycopg2.connect(database=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT)
+    conn = connect_db()
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM orders;")
     orders_data = cursor.fetchall()
     column_names = [desc[0] for desc in cursor.description]
-    orders_list = []
-    for row in orders_data:
-        order_dict = dict(zip(column_names, row))
-        for key, value in order_dict.items():
-            order_dict[key] = json_converter(value) if isinstance(value, (Decimal, datetime.date)) else value
-        orders_list.append(order_dict)
     cursor.close()
     conn.close()
-    return jsonify(orders_list)
+    return jsonify(build_orders(orders_data, column_names))
+
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    """Server-Sent Events stream of data versions and recomputed dashboard numbers."""
+    ensure_event_baseline()
+    return Response(
+        events.broker.stream(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is up and serving requests."""
+    return jsonify({"status": "ok"})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: the models are loaded. 503 while warming up (a lazy start begins warming up here)."""
+    start_warm_up()
+    active = model_registry.registry.active
+    ready = warm_up_state['finished'] and active is not None
+    return jsonify({
+        "ready": ready,
+        "startup_mode": STARTUP_MODE,
+        "churn_model": active['version'] if active else None,
+        "sales_forecaster": warm_up_state['finished'] and get_sales_forecaster() is not None,
+        "warm_up_seconds": warm_up_state['seconds'],
+        "error": warm_up_state['error'],
+    }), 200 if ready else 503
+
+@app.route('/api/admin/profiles', methods=['GET'])
+def get_profiles():
+    """Per-endpoint summary of the profiled requests: count, wall times and the costliest functions."""
+    return jsonify(profiler.summary(request.args.get('top', default=10, type=int)))
+
+@app.route('/api/admin/profiles/export', methods=['GET'])
+def export_profile():
+    """One endpoint's merged profile, as collapsed stacks (format=collapsed) or a pstats file (format=pstats)."""
+    endpoint = request.args.get('endpoint', '')
+    export_format = request.args.get('format', 'collapsed')
+    if export_format == 'collapsed':
+        data = profiler.collapsed(endpoint)
+        mimetype, filename = 'text/plain', 'profile.folded'
+    elif export_format == 'pstats':
+        data = profiler.pstats_dump(endpoint)
+        mimetype, filename = 'application/octet-stream', 'profile.pstats'
+    else:
+        return jsonify({"error": f"Unknown format '{export_format}'. Use 'collapsed' or 'pstats'."}), 400
+    if data is None:
+        return jsonify({"error": f"No profiles recorded for '{endpoint}'."}), 404
+    return Response(data, mimetype=mimetype, headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@app.route('/api/admin/databases', methods=['GET'])
+def get_database_stats():
+    """Per backend (primary and replicas): connections, known data version and statement latencies."""
+    return jsonify(router.stats())
+
+@app.route('/api/admin/profiles', methods=['DELETE'])
+def reset_profiles():
+    profiler.reset()
+    return jsonify({"message": "Profiles cleared."})
+
+@app.route('/api/admin/profiling', methods=['POST'])
+def set_profiling():
+    """Sets the fraction of requests profiled at random (sample_rate, 0 to 1)."""
+    sample_rate = request.form.get('sample_rate', request.args.get('sample_rate'))
+    try:
+        sample_rate = float(sample_rate)
+    except (TypeError, ValueError):
+        return jsonify({"error": "sample_rate must be a number between 0 and 1."}), 400
+    if not 0 <= sample_rate <= 1:
+        return jsonify({"error": "sample_rate must be a number between 0 and 1."}), 400
+    profiler.sample_rate = sample_rate
+    return jsonify({"sample_rate": sample_rate})
+
+@app.route('/api/models', methods=['GET'])
+def get_models():
+    """Registered churn model versions and the state of the ones loaded in this server."""
+    try:
+        status = model_registry.registry.status()
+        current = model_registry.read_registry()['current']
+        status['versions'] = [
+            dict(model_registry.load_meta(version), deployed=version == current)
+            for version in model_registry.list_versions()
+        ]
+        return jsonify(status)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/models/<version>/activate', methods=['POST'])
+def activate_model(version):
+    """Loads a version in the background and swaps it in once ready; requests keep using the current model meanwhile."""
+    try:
+        started = model_registry.registry.activate(version)
+        return jsonify({"message": f"Loading {version}." if started else f"{version} is already loading.", "version": version}), 202
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/models/rollback', methods=['POST'])
+def rollback_model():
+    """Redeploys the version that was active before the current one."""
+    try:
+        version = model_registry.registry.rollback()
+        if version is None:
+            return jsonify({"error": "No previous model version to roll back to."}), 409
+        return jsonify({"message": f"Rolling back to {version}.", "version": version}), 202
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/models/<version>/shadow', methods=['POST'])
+def shadow_model(version):
+    """Loads a candidate version that scores live traffic alongside the active model, without serving its results."""
+    try:
+        started = model_registry.registry.start_shadow(version)
+        return jsonify({"message": f"Loading {version} as shadow." if started else f"{version} is already loading.", "version": version}), 202
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/models/shadow', methods=['GET', 'DELETE'])
+def shadow_status():
+    """Side-by-side agreement and latency of the shadow and active models; DELETE stops shadow scoring."""
+    if request.method == 'DELETE':
+        model_registry.registry.stop_shadow()
+        return jsonify({"message": "Shadow scoring stopped."})
+    return jsonify(model_registry.registry.status()['shadow'])
+
+@app.route('/api/dashboard', methods=['GET'])
+def get_dashboard():
+    """
+    Builds several dashboard sections in one request, sharing their queries
+    and a single churn scoring pass. See API.md for the parameters.
+    """
+    try:
+        requests, error = read_dashboard_request(request.args)
+        if error:
+            return jsonify({"error": error}), 400
+        return jsonify(coalesced_dashboard(requests))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/coalescing_stats', methods=['GET'])
+def get_coalescing_stats():
+    """Dashboard requests computed versus served from an identical request in flight."""
+    return jsonify(flights.stats())
+
+@app.route('/api/query_cache_stats', methods=['GET'])
+def get_query_cache_stats():
+    """Hits, misses, evictions and size of the query-result cache."""
+    return jsonify(query_results.stats())
+
+@app.route('/api/customers/<customer_id>/churn_explanation', methods=['GET'])
+def get_churn_explanation(customer_id):
+    """Why the churn model gives a customer its probability: per-feature contributions, largest first."""
+    try:
+        model = require_churn_model()
+        data_version = current_data_version()
+        explanation = explanations.get(model['version'], customer_id, data_version)
+        if explanation is None:
+            conn = connect_db()
+            try:
+                customer_df = read_sql(CUSTOMER_SUBSET_SQL, conn, params={'customer_ids': [customer_id]})
+            finally:
+                conn.close()
+            if customer_df.empty:
+                return jsonify({"error": f"Customer '{customer_id}' not found."}), 404
+            explanation = explain_customers(model, customer_df, data_version)[0]
+        count = request.args.get('features', type=int)
+        return jsonify(top_features(explanation, count) if count else explanation)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
+@app.route('/api/explanation_cache_stats', methods=['GET'])
+def get_explanation_cache_stats():
+    return jsonify(explanations.stats())
 
 # In your app.py file
 
 @app.route('/api/predict_churn', methods=['GET'])
 def predict_churn():
     """Predicts the top N customers likely to churn with additional details."""
+    return dashboard_view('top_churners', request.args)
+
+@app.route('/api/churn_trends', methods=['GET'])
+def get_churn_trends():
+    return dashboard_view('churn_trends', request.args)
+
+@app.route('/api/churn_segmentation', methods=['GET'])
+def get_churn_segmentation():
+    return dashboard_view('churn_segmentation', request.args)
+
+@app.route('/api/churn_cube', methods=['GET'])
+def get_churn_cube():
+    """
+    Slices the churn and sales cube: customers, churners, orders, revenue and
+    units grouped by any of month, country, gender, age and risk band, with
+    configurable risk thresholds and age bins. See API.md for the parameters.
+    """
+    params, error = churn_cube.read_slice_params(request.args)
+    if error:
+        return jsonify({"error": error}), 400
     try:
-        count = request.args.get('count', default=10, type=int)
-
-        customer_df = get_aggregated_data()
-        customer_df_featured = feature_engineering_for_prediction(customer_df)
-        
-        df_predict = pd.get_dummies(customer_df_featured, columns=['gender', 'country'], drop_first=True)
-        df_predict_aligned = df_predict.reindex(columns=model_columns, fill_value=0)
-        df_predict_aligned[numeric_columns] = scaler.transform(df_predict_aligned[numeric_columns])
-        
-        churn_probabilities = churn_model.predict_proba(df_predict_aligned[model_columns])[:, 1]
-        
-        # --- CRITICAL CHANGE: Select more columns for the results ---
-        results_df = customer_df_featured[[
-            'customer_id', 
-            'last_purchase_date', 
-            'total_cancellations', 
-            'subscription_status'
-        ]].copy()
-        results_df['churn_probability'] = churn_probabilities
-        
-        top_n_churners = results_df.sort_values(by='churn_probability', ascending=False).head(count)
-        
-        # Convert date to string for JSON compatibility
-        top_n_churners['last_purchase_date'] = top_n_churners['last_purchase_date'].dt.strftime('%Y-%m-%d')
-        
-        return jsonify(top_n_churners.to_dict(orient='records'))
+        ensure_churn_cube()
+        conn = connect_db()
+        try:
+            return jsonify(churn_cube.slice_cube(conn, **params))
+        finally:
+            conn.close()
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
+@app.route('/api/cohort_retention', methods=['GET'])
+def get_cohort_retention():
+    """
+    Signup-cohort retention: the share of each monthly cohort ordering N
+    months after signup, for some countries and one product category.
+    """
+    countries = [country.strip() for country in request.args.get('country', '').split(',') if country.strip()]
+    category = request.args.get('category') or None
+    if category is not None and ',' in category:
+        return jsonify({"error": "Give one category; customers active in several categories are counted once per category."}), 400
+    try:
+        start = parse_month(request.args['from']) if request.args.get('from') else None
+        end = parse_month(request.args['to']) if request.args.get('to') else None
+    except ValueError:
+        return jsonify({"error": "'from' and 'to' must be months (YYYY-MM)."}), 400
+    months = request.args.get('months', type=int)
+    if months is not None and months < 0:
+        return jsonify({"error": "'months' must be 0 or more."}), 400
+    try:
+        ensure_cohorts()
+        conn = connect_db()
+        try:
+            result = cohorts.retention_matrix(conn, countries, category, start, end, months)
+        finally:
+            conn.close()
+        result.update({"countries": countries or None, "category": category})
+        return jsonify(result)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/churn_trends', methods=['GET'])
-def get_churn_trends():
-    # ... (This endpoint is restored) ...
+@app.route('/api/rfm_segments', methods=['GET'])
+def get_rfm_segments():
+    """Customers per RFM segment (and per code with codes=true), with the quintile boundaries."""
+    codes = request.args.get('codes', 'false').lower() == 'true'
     try:
-        customer_df = get_aggregated_data()
-        customer_df_featured = feature_engineering_for_prediction(customer_df)
-        df_predict = pd.get_dummies(customer_df_featured, columns=['gender', 'country'], drop_first=True)
-        df_predict_aligned = df_predict.reindex(columns=model_columns, fill_value=0)
-        df_predict_aligned[numeric_columns] = scaler.transform(df_predict_aligned[numeric_columns])
-        customer_df_featured['predicted_churn'] = churn_model.predict(df_predict_aligned[model_columns])
-        df_time = customer_df_featured.set_index('last_purchase_date')
-        monthly_churn = df_time['predicted_churn'].resample('M').sum()
-        trend_data = {
-            "months": monthly_churn.index.strftime('%Y-%m').tolist(),
-            "churn_counts": monthly_churn.values.tolist()
-        }
-        return jsonify(trend_data)
+        ensure_rfm()
+        conn = connect_db()
+        try:
+            return jsonify(rfm.segment_counts(conn, codes))
+        finally:
+            conn.close()
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/churn_segmentation', methods=['GET'])
-def get_churn_segmentation():
-    # ... (This endpoint is restored) ...
+@app.route('/api/rfm_customers', methods=['GET'])
+def get_rfm_customers():
+    """The customers of one RFM code or named segment, highest spend first."""
+    code = request.args.get('code')
+    segment = request.args.get('segment')
+    limit = request.args.get('limit', 100, type=int)
+    if (code is None) == (segment is None):
+        return jsonify({"error": "Give either 'code' (e.g. 545) or 'segment'."}), 400
+    if code is not None:
+        if len(code) != 3 or any(digit not in '12345' for digit in code):
+            return jsonify({"error": "'code' must be three scores from 1 to 5, e.g. 545."}), 400
+        r, f, m = (int(digit) for digit in code)
+        ranges = ((r, r), (f, f), (m, m))
+    else:
+        ranges = rfm.segment_ranges(segment)
+        if ranges is None:
+            return jsonify({"error": f"Unknown segment '{segment}'.", "segments": [name for name, _, _ in rfm.SEGMENTS]}), 400
+    if limit < 1:
+        return jsonify({"error": "'limit' must be at least 1."}), 400
     try:
-        customer_df = get_aggregated_data()
-        customer_df_featured = feature_engineering_for_prediction(customer_df)
-        df_predict = pd.get_dummies(customer_df_featured, columns=['gender', 'country'], drop_first=True)
-        df_predict_aligned = df_predict.reindex(columns=model_columns, fill_value=0)
-        df_predict_aligned[numeric_columns] = scaler.transform(df_predict_aligned[numeric_columns])
-        churn_probabilities = churn_model.predict_proba(df_predict_aligned[model_columns])[:, 1]
-        def assign_segment(prob):
-            if prob < 0.3: return 'Low Risk'
-            elif prob < 0.7: return 'Medium Risk'
-            else: return 'High Risk'
-        segments = pd.Series(churn_probabilities).apply(assign_segment)
-        segment_counts = segments.value_counts().to_dict()
-        return jsonify(segment_counts)
+        ensure_rfm()
+        conn = connect_db()
+        try:
+            customers = rfm.customers_in(conn, *ranges, limit=limit)
+        finally:
+            conn.close()
+        return jsonify({"code": code, "segment": segment, "customers": customers})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    
+
+@app.route('/api/customers/<customer_id>/rfm', methods=['GET'])
+def get_customer_rfm(customer_id):
+    """A customer's RFM code, segment and the values behind them."""
+    try:
+        ensure_rfm()
+        conn = connect_db()
+        try:
+            scores = rfm.customer_scores(conn, customer_id)
+        finally:
+            conn.close()
+        if scores is None:
+            return jsonify({"error": f"Customer '{customer_id}' not found or has no orders."}), 404
+        return jsonify(scores)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/sales_forecast', methods=['GET'])
 def get_sales_forecast():
     """Generates a sales forecast for a specified number of future days."""
-    if sales_forecaster is None:
-        return jsonify({"error": "Sales forecasting model not loaded."}), 500
-        
+    return dashboard_view('sales_forecast', request.args)
+
+
+@app.route('/api/hierarchical_forecast', methods=['GET'])
+def get_hierarchical_forecast():
+    """Serves precomputed, reconciled forecasts for any level or series of the hierarchy."""
+    hierarchy = load_artifact(hierarchical_forecaster.HIERARCHY_PATH)
+    if hierarchy is None:
+        return jsonify({"error": "Hierarchical forecast not available. Run hierarchical_forecaster.py first."}), 500
+
     try:
-        # Get the number of days to forecast from the URL, default to 30
-        days_to_forecast = request.args.get('days', default=30, type=int)
-
-        # Use the loaded model to get the forecast
-        forecast_results = sales_forecaster.get_forecast(steps=days_to_forecast)
-        
-        # Get the mean prediction
-        predicted_mean = forecast_results.predicted_mean
-        
-        # Get the confidence interval to show a range of uncertainty
-        confidence_interval = forecast_results.conf_int()
-
-        # Format the data for the frontend chart
+        level = request.args.get('level')
+        series = request.args.get('series')
+        days = min(request.args.get('days', default=30, type=int), hierarchy['horizon'])
+        if days < 1:
+            return jsonify({"error": "days must be at least 1."}), 400
+
+        # Without a level, list what can be requested
+        if level is None:
+            available = {lvl: [] for lvl in hierarchical_forecaster.LEVELS}
+            for lvl, name in zip(hierarchy['levels'], hierarchy['series']):
+                available[lvl].append(name)
+            return jsonify(available)
+
+        if level not in hierarchical_forecaster.LEVELS:
+            return jsonify({"error": f"Unknown level '{level}'."}), 400
+
+        rows = [
+            i for i, (lvl, name) in enumerate(zip(hierarchy['levels'], hierarchy['series']))
+            if lvl == level and (series is None or name == series)
+        ]
+        if not rows:
+            return jsonify({"error": f"Unknown series '{series}' for level '{level}'."}), 404
+
+        dates = pd.date_range(hierarchy['forecast_start'], periods=days, freq='D')
         forecast_data = {
-            "dates": predicted_mean.index.strftime('%Y-%m-%d').tolist(),
-            "predicted_sales": predicted_mean.values.tolist(),
-            "confidence_lower": confidence_interval.iloc[:, 0].values.tolist(),
-            "confidence_upper": confidence_interval.iloc[:, 1].values.tolist(),
+            "level": level,
+            "dates": dates.strftime('%Y-%m-%d').tolist(),
+            "series": {
+                hierarchy['series'][i]: hierarchy['forecasts'][i, :days].tolist() for i in rows
+            },
         }
-        
         return jsonify(forecast_data)
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    
 
 @app.route('/api/top_products', methods=['GET'])
 def get_top_products():
-    """Calculates the top 10 products with the highest historical sales."""
-    conn = None
-    try:
-        conn = psycopg2.connect(
-            database=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT
-        )
-        
-        # This query calculates the total sales for each product and orders them
-        sql_query = """
-            SELECT
-                p.product_name,
-                p.category,
-                SUM(o.unit_price * o.quantity) as total_sales
-            FROM
-                products p
-            JOIN
-                orders o ON p.product_id = o.product_id
-            GROUP BY
-                p.product_name, p.category
-            ORDER BY
-                total_sales DESC
-            LIMIT 10;
-        """
-        
-        df = pd.read_sql(sql_query, conn)
-        
-        # Convert the DataFrame to a list of dictionaries for the JSON response
-        top_products_list = df.to_dict(orient='records')
-        
-        return jsonify(top_products_list)
-
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        if conn is not None:
-            conn.close()
-
-# ... (add this at the end of your app.py, before the if __name__ == '__main__': line)
+    """Returns the top k products by revenue or units from the product_sales leaderboard."""
+    return dashboard_view('top_products', request.args)
 
 @app.route('/api/full_sales_view', methods=['GET'])
 def get_full_sales_view():
     """
     Provides the last 180 days of historical sales and a future forecast.
     """
-    if sales_forecaster is None:
-        return jsonify({"error": "Sales forecasting model not loaded."}), 500
-        
-    conn = None
-    try:
-        # Part 1: Fetch Recent Historical Data
-        conn = psycopg2.connect(
-            database=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT
-        )
-        
-        # --- MODIFIED SQL QUERY ---
-        # This query now fetches only the sales from the last 180 days
-        # relative to the most recent sale in the database.
-        sql_query = """
-            SELECT 
-                last_purchase_date, 
-                SUM(unit_price * quantity) as order_amount
-            FROM 
-                orders
-            WHERE 
-                last_purchase_date >= (SELECT MAX(last_purchase_date) - INTERVAL '180 days' FROM orders)
-            GROUP BY
-                last_purchase_date;
-        """
-        
-        df = pd.read_sql(sql_query, conn)
-        df['last_purchase_date'] = pd.to_datetime(df['last_purchase_date'], errors='coerce')
-        historical_sales = df.groupby('last_purchase_date')['order_amount'].sum().asfreq('D').fillna(0)
-
-        # Part 2: Generate Forecast
-        days_to_forecast = request.args.get('days', default=90, type=int)
-        forecast_results = sales_forecaster.get_forecast(steps=days_to_forecast)
-        predicted_mean = forecast_results.predicted_mean
-
-        # Part 3: Combine and Format Data
-        full_view_data = {
-            "historical_dates": historical_sales.index.strftime('%Y-%m-%d').tolist(),
-            "historical_sales": historical_sales.values.tolist(),
-            "forecast_dates": predicted_mean.index.strftime('%Y-%m-%d').tolist(),
-            "forecast_sales": predicted_mean.values.tolist(),
-        }
-        
-        return jsonify(full_view_data)
-
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        if conn is not None:
-            conn.close()
+    return dashboard_view('full_sales_view', request.args)
 
 @app.route('/api/sales_kpis', methods=['GET'])
 def get_sales_kpis():
     """Analyzes historical sales to find key performance indicators."""
-    conn = None
-    try:
-        conn = psycopg2.connect(
-            database=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT
-        )
-        sql_query = """
-            SELECT last_purchase_date, (unit_price * quantity) as order_amount
-            FROM orders;
-        """
-        df = pd.read_sql(sql_query, conn)
-        df['last_purchase_date'] = pd.to_datetime(df['last_purchase_date'], errors='coerce')
-        df = df.dropna(subset=['last_purchase_date', 'order_amount'])
-
-        # Calculate KPIs
-        total_revenue = df['order_amount'].sum()
-        avg_daily_sales = df.groupby(df['last_purchase_date'].dt.date)['order_amount'].sum().mean()
-        
-        # Find best and worst sales month
-        monthly_sales = df.set_index('last_purchase_date').resample('M')['order_amount'].sum()
-        best_month = monthly_sales.idxmax()
-        best_month_sales = monthly_sales.max()
-        worst_month = monthly_sales.idxmin()
-        worst_month_sales = monthly_sales.min()
-
-        kpis = {
-            "total_revenue": total_revenue,
-            "average_daily_sales": avg_daily_sales,
-            "best_month": best_month.strftime('%B %Y'),
-            "best_month_sales": best_month_sales,
-            "worst_month": worst_month.strftime('%B %Y'),
-            "worst_month_sales": worst_month_sales,
-        }
-        return jsonify(kpis)
-
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        if conn is not None:
-            conn.close()
+    return dashboard_view('sales_kpis', request.args)
 
 @app.route('/api/product_demand_forecast', methods=['GET'])
 def get_product_demand_forecast():
-    """Forecasts demand for the top 5 selling products with a fallback for sparse data."""
-    conn = None
-    try:
-        conn = psycopg2.connect(
-            database=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT
-        )
-        
-        # Step 1: Find top 5 products (unchanged)
-        top_products_query = """
-            SELECT product_id, SUM(quantity) as total_quantity
-            FROM orders
-            GROUP BY product_id
-            ORDER BY total_quantity DESC
-            LIMIT 5;
-        """
-        top_products_df = pd.read_sql(top_products_query, conn)
-        top_product_ids = top_products_df['product_id'].tolist()
-
-        if not top_product_ids:
-            return jsonify([])
-
-        # Step 2: Fetch sales history (unchanged)
-        sales_history_query = f"""
-            SELECT o.last_purchase_date, o.product_id, o.quantity, p.product_name
-            FROM orders o
-            JOIN products p ON o.product_id = p.product_id
-            WHERE o.product_id IN ({",".join(["'%s'" % pid for pid in top_product_ids])});
-        """
-        sales_history_df = pd.read_sql(sales_history_query, conn)
-        sales_history_df['last_purchase_date'] = pd.to_datetime(sales_history_df['last_purchase_date'])
-
-        # Step 3: Forecast for each product
-        all_forecasts = []
-        for product_id in top_product_ids:
-            product_sales = sales_history_df[sales_history_df['product_id'] == product_id]
-            daily_demand = product_sales.groupby('last_purchase_date')['quantity'].sum().asfreq('D').fillna(0)
-            product_name = product_sales['product_name'].iloc[0]
-            
-            forecasted_demand = 0
-            if len(daily_demand[daily_demand > 0]) > 7:
-                model = ExponentialSmoothing(daily_demand, trend='add', seasonal=None).fit(smoothing_level=0.2)
-                forecast = model.forecast(30)
-                forecasted_demand = abs(round(forecast.sum()))
-            else:
-                total_units = daily_demand.sum()
-                days_with_sales = (daily_demand.index.max() - daily_demand.index.min()).days
-                if days_with_sales > 0:
-                    avg_daily_rate = total_units / days_with_sales
-                    forecasted_demand = abs(round(avg_daily_rate * 30))
-                else:
-                    forecasted_demand = total_units
-            
-            all_forecasts.append({
-                "product_id": product_id,
-                "product_name": product_name,
-                # --- CRITICAL FIX: Convert the number to a standard Python integer ---
-                "forecasted_demand_30_days": int(forecasted_demand)
-            })
-
-        return jsonify(all_forecasts)
-
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        if conn is not None:
-            conn.close()
+    """Forecasts demand for the top k selling products with a fallback for sparse data."""
+    return dashboard_view('product_demand_forecast', request.args)
 
 @app.route('/api/user_distribution', methods=['GET'])
 def get_user_distribution():
     """Calculates the number of users per country."""
-    conn = None
-    try:
-        conn = psycopg2.connect(
-            database=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT
-        )
-        sql_query = """
-            SELECT country, COUNT(customer_id) as user_count
-            FROM customers
-            GROUP BY country
-            ORDER BY user_count DESC;
-        """
-        df = pd.read_sql(sql_query, conn)
-        
-        # Convert the DataFrame to a list of dictionaries
-        country_data = df.to_dict(orient='records')
-        return jsonify(country_data)
-
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        if conn is not None:
-            conn.close()
+    return dashboard_view('user_distribution', request.args)
 
 @app.route('/api/main_kpis', methods=['GET'])
 def get_main_kpis():
     """Calculates the main dashboard KPIs: Revenue, Orders, AOV, and Churn Rate."""
-    conn = None
-    try:
-        conn = psycopg2.connect(
-            database=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT
-        )
-        
-        # --- Part 1: Calculate Sales KPIs ---
-        sales_query = """
-            SELECT
-                SUM(unit_price * quantity) as total_revenue,
-                COUNT(DISTINCT order_id) as total_orders
-            FROM orders;
-        """
-        sales_df = pd.read_sql(sales_query, conn)
-        total_revenue = sales_df['total_revenue'][0]
-        total_orders = sales_df['total_orders'][0]
-        average_order_value = total_revenue / total_orders if total_orders > 0 else 0
-
-        # --- Part 2: Calculate Churn Rate ---
-        customer_df = get_aggregated_data()
-        customer_df_featured = feature_engineering_for_prediction(customer_df)
-        df_predict = pd.get_dummies(customer_df_featured, columns=['gender', 'country'], drop_first=True)
-        df_predict_aligned = df_predict.reindex(columns=model_columns, fill_value=0)
-        df_predict_aligned[numeric_columns] = scaler.transform(df_predict_aligned[numeric_columns])
-        predictions = churn_model.predict(df_predict_aligned[model_columns])
-        churn_rate = (predictions.sum() / len(predictions)) * 100 if len(predictions) > 0 else 0
-
-        # --- Part 3: Combine and CONVERT KPIs ---
-        kpis = {
-            "total_revenue": float(total_revenue),
-            "total_orders": int(total_orders),
-            "average_order_value": float(average_order_value),
-            "churn_rate": float(churn_rate),
-        }
-        
-        return jsonify(kpis)
+    return dashboard_view('main_kpis', request.args)
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        if conn is not None:
-            conn.close()
 
+UPLOAD_MODES = ('insert', 'upsert')
+
+# Upsert uploads run at most this many at a time; later ones wait for a slot
+UPLOAD_CONCURRENCY = int(os.environ.get('UPLOAD_CONCURRENCY', 2))
+upload_slots = threading.BoundedSemaphore(UPLOAD_CONCURRENCY)
+
+upload_pool = None
+upload_pool_lock = threading.Lock()
+
+def get_upload_pool():
+    """Connections for upsert uploads, which stage tables concurrently: enough for UPLOAD_CONCURRENCY of them."""
+    global upload_pool
+    with upload_pool_lock:
+        if upload_pool is None:
+            upload_pool = pg_pool.ThreadedConnectionPool(
+                1, UPLOAD_CONCURRENCY * UPSERT_CONNECTIONS, database=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT
+            )
+        return upload_pool
 
 @app.route('/api/upload_data', methods=['POST'])
 def upload_data():
-    """Receives an Excel file and uses the importer to add it to the database."""
+    """
+    Receives an Excel file and uses the importer to add it to the database.
+    The workbook is read in fixed-size chunks (see excel_stream.py). With
+    mode=upsert, rows already loaded are updated where they changed instead
+    of being skipped.
+    """
     if 'file' not in request.files:
         return jsonify({"error": "No file part in the request"}), 400
-    
+
+    mode = request.form.get('mode', request.args.get('mode', 'insert'))
+    if mode not in UPLOAD_MODES:
+        return jsonify({"error": f"Unknown mode '{mode}'. Use 'insert' or 'upsert'."}), 400
+
     file = request.files['file']
     if file.filename == '':
         return jsonify({"error": "No file selected for uploading"}), 400
@@ -513,16 +1790,43 @@ def upload_data():
     if file and (file.filename.endswith('.xls') or file.filename.endswith('.xlsx')):
         conn = None
         try:
-            df = pd.read_excel(file)
-            conn = psycopg2.connect(
-                database=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT
-            )
-            
+            customer_ids = set()
+
+            def chunks():
+                for df in excel_stream.iter_excel_chunks(file, filename=file.filename):
+                    customer_ids.update(df['customer_id'].dropna().astype(str))
+                    yield df
+
             # Call the function from the other file
-            result = insert_data_from_df(conn, df)
-            
+            if mode == 'upsert':
+                with upload_slots:
+                    result = upsert_chunks(get_upload_pool(), chunks())
+            else:
+                conn = connect_db(write=True)
+                result = insert_chunks(conn, chunks())
+
             if result['success']:
-                return jsonify({"message": f"Successfully processed {result['rows_processed']} rows."})
+                # Tell open dashboards right away, then append the new days to
+                # the forecaster, rescore the uploaded customers into the churn
+                # history and push recomputed numbers in the background;
+                # get_sales_forecaster() picks up the saved file when it lands.
+                router.note_write(result['data_version'])
+                # Orders moved to another customer change their previous customer too
+                customer_ids.update(result.get('previous_customer_ids', ()))
+                events.broker.publish('data_version', {"data_version": result['data_version']})
+                threading.Thread(
+                    target=refresh_after_upload,
+                    args=(result['data_version'], sorted(customer_ids), result.get('previous_earliest_month')),
+                    daemon=True
+                ).start()
+                response = {
+                    "message": f"Successfully processed {result['rows_processed']} rows.",
+                    "data_version": result['data_version'],
+                }
+                for key in ('counts', 'timings_ms', 'rows_per_second'):
+                    if key in result:
+                        response[key] = result[key]
+                return jsonify(response)
             else:
                 return jsonify({"error": result['error']}), 500
 
@@ -533,166 +1837,27 @@ def upload_data():
                 conn.close()
     else:
         return jsonify({"error": "Invalid file type. Please upload an Excel file."}), 400
-    
+
 @app.route('/api/sales_by_age', methods=['GET'])
 def get_sales_by_age():
     """Calculates total sales revenue for predefined age groups."""
-    conn = None
-    try:
-        conn = psycopg2.connect(
-            database=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT
-        )
-
-        # SQL query uses a CASE statement to group customers into age buckets
-        sql_query = """
-            SELECT
-                CASE
-                    WHEN c.age BETWEEN 18 AND 25 THEN '18-25'
-                    WHEN c.age BETWEEN 26 AND 35 THEN '26-35'
-                    WHEN c.age BETWEEN 36 AND 45 THEN '36-45'
-                    WHEN c.age BETWEEN 46 AND 60 THEN '46-60'
-                    -- Assuming anyone 61 or older is 60+
-                    ELSE '60+' 
-                END AS age_group,
-                -- Sum the quantity from the orders table
-                SUM(o.quantity) AS total_sales
-            FROM customers c
-            -- Join customers table with the orders table
-            JOIN orders o ON c.customer_id = o.customer_id
-            -- Group by the newly created age_group label
-            GROUP BY age_group
-            ORDER BY total_sales DESC;
-        """
-        
-        # Use pandas to execute the query and fetch the results
-        df = pd.read_sql(sql_query, conn)
-        
-        # Convert the DataFrame to a list of dictionaries for JSON
-        # Example output structure: [{"age_group": "26-35", "total_sales": 150000.50}, ...]
-        age_data = df.to_dict(orient='records')
-        
-        return jsonify(age_data)
-
-    except Exception as e:
-        # Handle the exception and return a 500 error
-        print(f"Database Error in get_sales_by_age: {e}")
-        return jsonify({"error": "Failed to fetch sales by age data."}), 500
-    finally:
-        if conn is not None:
-            conn.close()
+    return dashboard_view('sales_by_age', request.args, error_message="Failed to fetch sales by age data.")
 
 @app.route('/api/monthly_sales', methods=['GET'])
 def get_monthly_sales():
     """Fetches total quantity sold grouped by month."""
-    conn = None
-    try:
-        conn = psycopg2.connect(
-            database=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT
-        )
-        sql_query = """
-            SELECT last_purchase_date, quantity
-            FROM orders;
-        """
-        df = pd.read_sql(sql_query, conn)
-        df['last_purchase_date'] = pd.to_datetime(df['last_purchase_date'], errors='coerce')
-        df = df.dropna(subset=['last_purchase_date', 'quantity'])
-
-        # Group by Year-Month and sum quantities
-        monthly_sales = (
-            df.groupby(df['last_purchase_date'].dt.to_period("M"))['quantity']
-              .sum()
-              .reset_index()
-        )
-        monthly_sales['last_purchase_date'] = monthly_sales['last_purchase_date'].dt.strftime('%B %Y')
-
-        data = [
-            {"month": row['last_purchase_date'], "total_quantity": int(row['quantity'])}
-            for _, row in monthly_sales.iterrows()
-        ]
-
-        return jsonify(data)
-
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        if conn is not None:
-            conn.close()
+    return dashboard_view('monthly_sales', request.args)
 
 @app.route('/api/yearly_sales', methods=['GET'])
 def get_yearly_sales():
     """Fetches total quantity sold grouped by year."""
-    conn = None
-    try:
-        conn = psycopg2.connect(
-            database=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT
-        )
-        sql_query = """
-            SELECT last_purchase_date, quantity
-            FROM orders;
-        """
-        df = pd.read_sql(sql_query, conn)
-        df['last_purchase_date'] = pd.to_datetime(df['last_purchase_date'], errors='coerce')
-        df = df.dropna(subset=['last_purchase_date', 'quantity'])
-
-        yearly_sales = (
-            df.groupby(df['last_purchase_date'].dt.year)['quantity']
-              .sum()
-              .reset_index()
-        )
-        yearly_sales.rename(columns={"last_purchase_date": "year", "quantity": "total_quantity"}, inplace=True)
-
-        data = [
-            {"year": int(row['year']), "total_quantity": int(row['total_quantity'])}
-            for _, row in yearly_sales.iterrows()
-        ]
-
-        return jsonify(data)
-
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        if conn is not None:
-            conn.close()
+    return dashboard_view('yearly_sales', request.args)
 
 @app.route('/api/db_stats', methods=['GET'])
 def get_db_stats():
     """Returns total entries count and % of cancelled subscriptions."""
-    conn = None
-    try:
-        conn = psycopg2.connect(
-            database=DB_NAME, user=DB_USER, password=DB_PASS,
-            host=DB_HOST, port=DB_PORT
-        )
-        cur = conn.cursor()
-
-        # Total entries
-        cur.execute("SELECT COUNT(*) FROM orders;")
-        total_count = cur.fetchone()[0]
-
-        # Cancelled subscriptions
-        cur.execute("""
-            SELECT COUNT(*) FROM orders 
-            WHERE subscription_status = 'cancelled';
-        """)
-        cancelled_count = cur.fetchone()[0]
-
-        # Percentage calculation
-        cancelled_percentage = (
-            (cancelled_count / total_count) * 100 if total_count > 0 else 0
-        )
-
-        cur.close()
-        return jsonify({
-            "total_entries": total_count,
-            "cancelled_count": cancelled_count,
-            "cancelled_percentage": round(cancelled_percentage, 2)
-        })
-
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
+    return dashboard_view('db_stats', request.args)
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', debug=True, threaded=False)
\ No newline at end of file
+    # Threaded, so open /api/events streams don't block other requests
+    app.run(host='0.0.0.0', debug=True, threaded=True)
@@ -0,0 +1,91 @@
+"""
+Approximate analytics over the maintained stratified samples (migration 6).
+
+Orders are sampled at 1% and stratified by month of purchase; customers at
+10%, stratified by country. Population counts per stratum are exact, so
+totals are estimated as sum over strata of N_h * (sample mean), with the
+usual stratified-sampling variance
+    sum over strata of N_h^2 * (1 - n_h / N_h) * s_h^2 / n_h
+and normal-approximation confidence intervals.
+"""
+
+import numpy as np
+
+CONFIDENCE_LEVEL = 0.95
+Z_SCORE = 1.96
+
+# Stratum of orders without a purchase date
+UNDATED_MONTH = '1900-01-01'
+
+# --- SQL Queries ---
+ORDER_STRATA_SQL = "SELECT month, population FROM order_strata;"
+
+ORDER_SAMPLE_MONTHS_SQL = """
+    SELECT
+        month,
+        COUNT(*) AS sampled,
+        SUM(order_amount) AS amount_sum,
+        SUM(order_amount * order_amount) AS amount_sum_sq,
+        MIN(last_purchase_date) AS first_date,
+        MAX(last_purchase_date) AS last_date
+    FROM order_sample
+    GROUP BY month;
+"""
+
+ORDER_SAMPLE_AGE_SQL = """
+    SELECT
+        month, age_group,
+        COUNT(*) AS group_sampled,
+        SUM(quantity) AS quantity_sum,
+        SUM(quantity * quantity) AS quantity_sum_sq
+    FROM order_sample
+    GROUP BY month, age_group;
+"""
+
+CUSTOMER_STRATA_SQL = "SELECT country, population FROM customer_strata;"
+
+# --- Estimators ---
+def stratified_total(population, sampled, value_sum, value_sum_sq):
+    """
+    Estimates a population total from per-stratum sample sums.
+    Strata with fewer than two sampled rows add no variance (it cannot be
+    estimated from them). Returns (estimate, variance).
+    """
+    population = np.asarray(population, dtype=float)
+    sampled = np.asarray(sampled, dtype=float)
+    value_sum = np.asarray(value_sum, dtype=float)
+    value_sum_sq = np.asarray(value_sum_sq, dtype=float)
+
+    has_sample = sampled > 0
+    mean = np.divide(value_sum, sampled, out=np.zeros_like(value_sum), where=has_sample)
+    has_variance = sampled > 1
+    sample_variance = np.divide(
+        value_sum_sq - sampled * mean ** 2, sampled - 1,
+        out=np.zeros_like(value_sum), where=has_variance
+    ).clip(min=0)
+    finite_population = 1 - np.divide(sampled, population, out=np.ones_like(sampled), where=population > 0)
+    variance = np.divide(
+        population ** 2 * finite_population * sample_variance, sampled,
+        out=np.zeros_like(value_sum), where=has_variance
+    )
+    return float((population * mean).sum()), float(variance.sum())
+
+def stratified_proportion(population, sampled, positives):
+    """Estimates the overall share of positives, weighting strata by population. Returns (estimate, variance)."""
+    population = np.asarray(population, dtype=float)
+    sampled = np.asarray(sampled, dtype=float)
+    positives = np.asarray(positives, dtype=float)
+
+    weights = population / population.sum() if population.sum() > 0 else population
+    share = np.divide(positives, sampled, out=np.zeros_like(positives), where=sampled > 0)
+    finite_population = 1 - np.divide(sampled, population, out=np.ones_like(sampled), where=population > 0)
+    variance = np.divide(
+        weights ** 2 * finite_population * share * (1 - share), sampled - 1,
+        out=np.zeros_like(share), where=sampled > 1
+    )
+    return float((weights * share).sum()), float(variance.sum())
+
+def interval(estimate, variance, scale=1.0):
+    """Returns the confidence interval [lower, upper] of an estimate, optionally scaled."""
+    margin = Z_SCORE * np.sqrt(variance)
+    return [float((estimate - margin) * scale), float((estimate + margin) * scale)]
@@ -0,0 +1,287 @@
+"""
+Async (ASGI) serving mode for the API.
+
+Serves the dashboard's read endpoints natively with Starlette and an asyncpg
+connection pool: independent queries inside a handler run concurrently, and
+model scoring and pandas work run on thread pools so the event loop keeps
+serving other requests. Any other route (uploads, orders, hierarchical
+forecasts) falls through to the Flask app from app.py, run in a thread.
+
+Run with:
+    uvicorn async_app:asgi_app --host 0.0.0.0 --port 5000
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import asyncpg
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+from data_importer import DATA_VERSION_SQL
+import app as flask_app
+import columnar
+import coalescing
+import events
+import profiling
+from profiling import profiler
+
+POOL_MIN_SIZE = 2
+POOL_MAX_SIZE = 10
+# Churn scoring holds the GIL for hundreds of milliseconds, so it gets one
+# thread per core; more would only make concurrent scorings slower. Lighter
+# pandas and forecasting work has its own pool so it never queues behind it.
+SCORING_WORKERS = os.cpu_count() or 1
+CPU_WORKERS = 4
+
+scoring_executor = ThreadPoolExecutor(max_workers=SCORING_WORKERS)
+executor = ThreadPoolExecutor(max_workers=CPU_WORKERS)
+pool = None
+
+class JSONResponse(Response):
+    """JSON response rendered the same way as Flask's jsonify."""
+    media_type = "application/json"
+
+    def render(self, content):
+        body = json.dumps(content, default=flask_app.json_converter, sort_keys=True, separators=(',', ':'))
+        return (body + "\n").encode("utf-8")
+
+# --- Helper Functions ---
+def to_asyncpg(sql_query, params=None):
+    """Rewrites psycopg2-style %(name)s placeholders as asyncpg's $n."""
+    names = []
+    def replace(match):
+        if match.group(1) not in names:
+            names.append(match.group(1))
+        return f"${names.index(match.group(1)) + 1}"
+    sql_query = re.sub(r"%\((\w+)\)s", replace, sql_query)
+    return sql_query, [params[name] for name in names]
+
+async def inline_args(conn, query, args):
+    """
+    Inlines $n arguments as literals, since COPY takes no bind parameters.
+    Like asyncpg's own inlining, but NULL-safe.
+    """
+    if not args:
+        return query
+    statement = await conn.prepare(query)
+    types = [f"{parameter.schema}.{parameter.name}" for parameter in statement.get_parameters()]
+    columns = ', '.join(f"quote_nullable(${i}::{t}::text)" for i, t in enumerate(types, start=1))
+    literals = await conn.fetchrow(f"SELECT {columns}", *args)
+    return re.sub(r"\$(\d+)\b", lambda match: literals[int(match.group(1)) - 1], query)
+
+async def fetch_df(sql_query, params=None):
+    """
+    Runs a query on the pool and returns a typed DataFrame, like app.read_sql:
+    the result is copied out as CSV and parsed off the event loop.
+    """
+    query, args = to_asyncpg(sql_query.strip().rstrip(';'), params)
+    chunks = []
+
+    async def collect(chunk):
+        chunks.append(chunk)
+
+    async with pool.acquire() as conn:
+        types = columnar.cached_types(sql_query)
+        if types is None:
+            statement = await conn.prepare(query)
+            types = [(attribute.name, attribute.type.oid) for attribute in statement.get_attributes()]
+            columnar.cache_types(sql_query, types)
+        copy_query = await inline_args(conn, query, args)
+        await conn.copy_from_query(copy_query, output=collect, format='csv', header=True)
+    categorical = flask_app.CATEGORICAL_COLUMNS.get(sql_query, ())
+    return await run_cpu(columnar.read_copy_buffer, b''.join(chunks), types, categorical)
+
+async def run_cpu(function, *args):
+    """Runs pandas or forecasting work off the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(executor, profiler.propagate(function), *args)
+
+async def run_scoring(function, *args):
+    """Runs churn model scoring off the event loop, at most one per core."""
+    return await asyncio.get_running_loop().run_in_executor(scoring_executor, profiler.propagate(function), *args)
+
+async def current_data_version():
+    async with pool.acquire() as conn:
+        return await conn.fetchval(DATA_VERSION_SQL)
+
+async def compute_dashboard(requests, data_version=None):
+    """
+    Async counterpart of app.compute_dashboard: the queries run concurrently
+    on the pool, sharing the Flask app's query-result cache.
+    """
+    start = time.perf_counter()
+    queries, needs_scores = flask_app.plan_dashboard(requests)
+    if data_version is None:
+        data_version = await current_data_version()
+    query_results = flask_app.query_results
+
+    async def fetch(sql_query, sql_params):
+        query_start = time.perf_counter()
+        cacheable = sql_query not in flask_app.UNCACHED_QUERIES
+        df = query_results.get(sql_query, sql_params, data_version) if cacheable else None
+        if df is None:
+            df = flask_app.prepare_source(await fetch_df(sql_query, sql_params))
+            if cacheable:
+                await run_cpu(query_results.put, sql_query, sql_params, data_version, df)
+        return df, round((time.perf_counter() - query_start) * 1000, 1)
+
+    fetched = await asyncio.gather(*(fetch(*query) for query in queries.values()))
+    frames = {key: df for key, (df, _) in zip(queries, fetched)}
+    query_timings = {key: elapsed for key, (_, elapsed) in zip(queries, fetched)}
+
+    run = run_scoring if needs_scores else run_cpu
+    result = await run(flask_app.build_dashboard, requests, frames, {'queries': query_timings}, data_version)
+    result['timings_ms']['total'] = round((time.perf_counter() - start) * 1000, 1)
+    return result
+
+flights = coalescing.AsyncSingleFlight()
+
+async def coalesced_dashboard(requests):
+    """compute_dashboard, shared with identical requests already in flight for the same data and model."""
+    data_version = await current_data_version()
+    key = coalescing.request_key(requests, data_version, flask_app.current_model_version())
+    return await flights.do(key, coalescing.endpoint_label(requests), lambda: compute_dashboard(requests, data_version))
+
+async def dashboard_view(section, request, error_message=None):
+    """Serves one dashboard section as its own endpoint, like app.dashboard_view."""
+    params = flask_app.read_section_params(request.query_params)
+    error = flask_app.validate_section_params(params)
+    if error:
+        return JSONResponse({"error": error}, status_code=400)
+    try:
+        result = await coalesced_dashboard({section: params})
+        if section in result['errors']:
+            raise RuntimeError(result['errors'][section])
+        return JSONResponse(result['sections'][section])
+    except Exception as e:
+        if error_message:
+            print(f"Error in {section}: {e}")
+            return JSONResponse({"error": error_message}, status_code=500)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+def section_endpoint(section, error_message=None):
+    async def endpoint(request):
+        return await dashboard_view(section, request, error_message)
+    return endpoint
+
+# --- API Endpoints ---
+async def get_dashboard(request):
+    try:
+        requests, error = flask_app.read_dashboard_request(request.query_params)
+        if error:
+            return JSONResponse({"error": error}, status_code=400)
+        return JSONResponse(await coalesced_dashboard(requests))
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+async def get_coalescing_stats(request):
+    return JSONResponse(flights.stats())
+
+async def get_query_cache_stats(request):
+    return JSONResponse(flask_app.query_results.stats())
+
+async def stream_events(request):
+    """Server-Sent Events stream; each client is an asyncio queue, not a thread."""
+    flask_app.ensure_event_baseline()
+    loop = asyncio.get_running_loop()
+    messages = asyncio.Queue(maxsize=events.SUBSCRIBER_BUFFER)
+
+    def enqueue(message):
+        if messages.full():
+            messages.get_nowait()
+        messages.put_nowait(message)
+
+    def deliver(message):
+        # Called from whichever thread publishes
+        loop.call_soon_threadsafe(enqueue, message)
+
+    async def stream():
+        events.broker.subscribe(deliver)
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(messages.get(), events.KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            events.broker.unsubscribe(deliver)
+
+    return StreamingResponse(
+        stream(), media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+async def lifespan(app):
+    global pool
+    # On the primary: DB_REPLICAS routes the Flask routes only, not this pool
+    pool = await asyncpg.create_pool(
+        database=flask_app.DB_NAME, user=flask_app.DB_USER, password=flask_app.DB_PASS,
+        host=flask_app.DB_HOST, port=int(flask_app.DB_PORT),
+        min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE,
+    )
+    print(f"Success: Database pool ready ({POOL_MIN_SIZE}-{POOL_MAX_SIZE} connections).")
+    try:
+        yield
+    finally:
+        await pool.close()
+
+class ProfilingMiddleware:
+    """
+    Starts the profile of a request picked by the profiler. The event loop is
+    shared, so only the work the request runs in executors (and, for the
+    Flask routes, its WSGI thread) is profiled.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'].startswith('/api/admin/'):
+            return await self.app(scope, receive, send)
+        header = dict(scope['headers']).get(profiling.PROFILE_HEADER.lower().encode())
+        if not profiler.wanted(header.decode() if header else None):
+            return await self.app(scope, receive, send)
+        session = profiler.begin(scope['path'], attach=False)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.end(session)
+
+routes = [
+    Route('/api/dashboard', get_dashboard),
+    Route('/api/events', stream_events),
+    Route('/api/coalescing_stats', get_coalescing_stats),
+    Route('/api/query_cache_stats', get_query_cache_stats),
+    Route('/api/predict_churn', section_endpoint('top_churners')),
+    Route('/api/churn_trends', section_endpoint('churn_trends')),
+    Route('/api/churn_segmentation', section_endpoint('churn_segmentation')),
+    Route('/api/sales_forecast', section_endpoint('sales_forecast')),
+    Route('/api/top_products', section_endpoint('top_products')),
+    Route('/api/full_sales_view', section_endpoint('full_sales_view')),
+    Route('/api/sales_kpis', section_endpoint('sales_kpis')),
+    Route('/api/product_demand_forecast', section_endpoint('product_demand_forecast')),
+    Route('/api/user_distribution', section_endpoint('user_distribution')),
+    Route('/api/main_kpis', section_endpoint('main_kpis')),
+    Route('/api/sales_by_age', section_endpoint('sales_by_age', "Failed to fetch sales by age data.")),
+    Route('/api/monthly_sales', section_endpoint('monthly_sales')),
+    Route('/api/yearly_sales', section_endpoint('yearly_sales')),
+    Route('/api/db_stats', section_endpoint('db_stats')),
+    # Everything else is served by the Flask app in a worker thread
+    Mount('/', app=WSGIMiddleware(flask_app.app)),
+]
+
+asgi_app = Starlette(
+    routes=routes,
+    lifespan=lifespan,
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+        Middleware(ProfilingMiddleware),
+    ],
+)
@@ -0,0 +1,199 @@
+"""
+Out-of-core churn scoring of the whole customer base.
+
+The in-memory path reads every customer into a DataFrame, then builds the
+features, the dummies, the aligned matrix and its scaled copy, so its
+memory grows several times over with the customer count. Here customers
+are read through a server-side cursor, BATCH_ROWS at a time. Each batch is
+engineered and one-hot encoded straight into a preallocated feature
+matrix, scaled in place, scored, and folded into running reductions:
+
+    - the TOP_K customers most likely to churn (a heap)
+    - customers per risk segment (the thresholds of churn_segmentation)
+    - predicted churners, for the churn rate
+
+before the next batch overwrites the buffers. Memory is bounded by the
+batch size and TOP_K, whatever the number of customers.
+
+The features are those of app.feature_engineering_for_prediction. Missing
+numeric values are filled with the batch's median instead of the whole
+population's (the aggregation leaves none in practice).
+
+Configure with the environment variables:
+    SCORING_BATCH_ROWS   customers per batch (default 10000)
+    SCORING_TOP_K        most likely churners kept (default 100)
+"""
+
+import os
+import heapq
+import numpy as np
+import pandas as pd
+import psycopg2.extensions
+
+DEFAULT_BATCH_ROWS = 10000
+DEFAULT_TOP_K = 100
+
+# Reference date of the features, as in training
+TODAY = np.datetime64('2025-09-27', 'D')
+
+# churn_segmentation's bands: below 0.3, below 0.7, the rest
+RISK_THRESHOLDS = (0.3, 0.7)
+RISK_SEGMENTS = ('Low Risk', 'Medium Risk', 'High Risk')
+
+# Read numerics as floats and dates as their ISO text (numpy parses a
+# batch of them at once) instead of one Decimal or date object per value
+FLOAT = psycopg2.extensions.new_type(
+    psycopg2.extensions.DECIMAL.values, 'BATCH_FLOAT', lambda value, cursor: None if value is None else float(value)
+)
+ISO_DATE = psycopg2.extensions.new_type(psycopg2.extensions.DATE.values, 'BATCH_DATE', lambda value, cursor: value)
+
+# Columns of app.AGGREGATED_DATA_SQL
+(CUSTOMER_ID, AGE, GENDER, COUNTRY, SIGNUP_DATE, LAST_PURCHASE_DATE, PURCHASE_COUNT,
+ TOTAL_ITEMS_PURCHASED, TOTAL_SPEND, AVG_RATING, TOTAL_CANCELLATIONS, SUBSCRIPTION_STATUS) = range(12)
+
+class FeatureBuffers:
+    """A model's feature matrix for one batch, allocated once and refilled per batch."""
+
+    def __init__(self, model, batch_rows):
+        self.columns = list(model['model_columns'])
+        self.matrix = np.zeros((batch_rows, len(self.columns)))
+        self.values = np.empty(batch_rows)
+        position = {column: i for i, column in enumerate(self.columns)}
+        self.numeric = [position[column] for column in model['numeric_columns']]
+        self.mean = model['scaler'].mean_
+        self.scale = model['scaler'].scale_
+        # Category value -> its dummy column; values without one (the dropped
+        # reference category, unseen ones) leave every dummy at 0
+        self.dummies = {
+            source: {column[len(prefix):]: position[column] for column in self.columns if column.startswith(prefix)}
+            for source, prefix in ((GENDER, 'gender_'), (COUNTRY, 'country_'))
+        }
+        self.dummy_positions = sorted(set(range(len(self.columns))) - set(self.numeric))
+
+    def fill(self, columns, n):
+        """Writes the scaled features of a batch (a list of column tuples) into the first n rows."""
+        last_purchase = np.array(columns[LAST_PURCHASE_DATE], dtype='datetime64[D]')
+        signup = np.array(columns[SIGNUP_DATE], dtype='datetime64[D]')
+        days_since_last_purchase = (TODAY - last_purchase).astype(float)
+        days_since_last_purchase[np.isnat(last_purchase)] = 9999
+        tenure_days = (TODAY - signup).astype(float)
+        tenure_days[np.isnat(signup)] = -1
+        purchase_count = np.array(columns[PURCHASE_COUNT], dtype=float)
+        total_spend = np.array(columns[TOTAL_SPEND], dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            features = {
+                'age': np.array(columns[AGE], dtype=float),
+                'days_since_last_purchase': days_since_last_purchase,
+                'tenure_days': tenure_days,
+                'purchase_count': purchase_count,
+                'total_spend': total_spend,
+                'avg_spend_per_order': total_spend / np.where(purchase_count == 0, 1, purchase_count),
+                'total_cancellations': np.array(columns[TOTAL_CANCELLATIONS], dtype=float),
+                'avg_rating': np.array(columns[AVG_RATING], dtype=float),
+                'purchases_per_year': purchase_count * 365 / (tenure_days + 1),
+            }
+
+        matrix = self.matrix[:n]
+        values = self.values[:n]
+        for i, mean, scale in zip(self.numeric, self.mean, self.scale):
+            values[:] = features[self.columns[i]]
+            missing = np.isnan(values)
+            if missing.any():
+                values[missing] = np.median(values[~missing]) if not missing.all() else np.nan
+            np.subtract(values, mean, out=matrix[:, i])
+            np.divide(matrix[:, i], scale, out=matrix[:, i])
+
+        matrix[:, self.dummy_positions] = 0
+        for source, positions in self.dummies.items():
+            codes = np.fromiter((positions.get(value, -1) for value in columns[source]), dtype=np.intp, count=n)
+            rows = np.flatnonzero(codes >= 0)
+            matrix[rows, codes[rows]] = 1
+        return pd.DataFrame(matrix, columns=self.columns, copy=False)
+
+class ScoreReducer:
+    """Running top-k, segment counts and churner count over scored batches."""
+
+    def __init__(self, top_k):
+        self.top_k = top_k
+        self.heap = []
+        self.customers = 0
+        self.churners = 0
+        self.segments = np.zeros(len(RISK_SEGMENTS), dtype=np.int64)
+
+    def add(self, columns, probabilities, predictions):
+        n = len(probabilities)
+        self.segments += np.bincount(np.searchsorted(RISK_THRESHOLDS, probabilities, side='right'),
+                                     minlength=len(RISK_SEGMENTS))
+        self.churners += int(np.count_nonzero(predictions == 1))
+        # Only the batch's own top k can enter the heap; ties keep the customer read first
+        for i in np.argsort(-probabilities, kind='stable')[:self.top_k]:
+            entry = (float(probabilities[i]), -(self.customers + int(i)))
+            if len(self.heap) < self.top_k:
+                heapq.heappush(self.heap, entry + (self.record(columns, i, probabilities[i]),))
+            elif entry > self.heap[0][:2]:
+                heapq.heapreplace(self.heap, entry + (self.record(columns, i, probabilities[i]),))
+            else:
+                break
+        self.customers += n
+
+    @staticmethod
+    def record(columns, i, probability):
+        return {
+            'customer_id': columns[CUSTOMER_ID][i],
+            'last_purchase_date': columns[LAST_PURCHASE_DATE][i],
+            'total_cancellations': int(columns[TOTAL_CANCELLATIONS][i]),
+            'subscription_status': columns[SUBSCRIPTION_STATUS][i],
+            'churn_probability': float(probability),
+        }
+
+    def result(self):
+        top = [entry[2] for entry in sorted(self.heap, key=lambda entry: entry[:2], reverse=True)]
+        return {
+            'customers_scored': self.customers,
+            'churners': self.churners,
+            'churn_rate': self.churners / self.customers * 100 if self.customers else 0,
+            'segments': {name: int(count) for name, count in zip(RISK_SEGMENTS, self.segments) if count},
+            'top_churners': top,
+        }
+
+class BatchScorer:
+    """Scores all customers in fixed-size batches with bounded memory."""
+
+    def __init__(self, batch_rows=DEFAULT_BATCH_ROWS, top_k=DEFAULT_TOP_K):
+        self.batch_rows = batch_rows
+        self.top_k = top_k
+
+    def score(self, conn, model, predict, sql_query):
+        """
+        Streams `sql_query` (the aggregated customers) through a server-side
+        cursor and scores it with `predict(model, model_input)`, which returns
+        (probabilities, predictions). Returns the reductions and batch count.
+        """
+        buffers = FeatureBuffers(model, self.batch_rows)
+        reducer = ScoreReducer(self.top_k)
+        batches = 0
+        try:
+            with conn.cursor(name='batch_scoring') as cursor:
+                psycopg2.extensions.register_type(FLOAT, cursor)
+                psycopg2.extensions.register_type(ISO_DATE, cursor)
+                cursor.itersize = self.batch_rows
+                cursor.execute(sql_query)
+                while True:
+                    rows = cursor.fetchmany(self.batch_rows)
+                    if not rows:
+                        break
+                    columns = list(zip(*rows))
+                    del rows
+                    model_input = buffers.fill(columns, len(columns[0]))
+                    probabilities, predictions = predict(model, model_input)
+                    reducer.add(columns, probabilities, predictions)
+                    batches += 1
+        finally:
+            conn.rollback()
+        return dict(reducer.result(), batches=batches, batch_rows=self.batch_rows, model_version=model['version'])
+
+def from_environment():
+    return BatchScorer(
+        batch_rows=int(os.environ.get('SCORING_BATCH_ROWS', DEFAULT_BATCH_ROWS)),
+        top_k=int(os.environ.get('SCORING_TOP_K', DEFAULT_TOP_K)),
+    )
@@ -0,0 +1,85 @@
+"""
+Latency/accuracy trade-off of the approximate (?approx=true) endpoints.
+
+Calls each endpoint exactly and approximately in-process, several times,
+and reports the best latency of each, the relative error of every estimate
+and whether the exact value falls inside its confidence interval.
+
+Usage:
+    python benchmarks/approx_accuracy.py [database] [repeats]
+
+Example, on the 1M-order database from seed_synthetic.py:
+    python benchmarks/approx_accuracy.py hackathon_bench 5
+"""
+
+import os
+import sys
+import json
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+ENDPOINTS = ['/api/sales_kpis', '/api/main_kpis', '/api/sales_by_age']
+
+def best_time(client, url, repeats):
+    timings, body = [], None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - start) * 1000)
+        body = response.get_json()
+    return min(timings), body
+
+def compare(exact, approx):
+    """Relative error and interval coverage of each estimated value."""
+    if isinstance(exact, list):
+        exact = {row['age_group']: row['total_sales'] for row in exact}
+        intervals = {row['age_group']: row['confidence_interval'] for row in approx}
+        approx = {row['age_group']: row['total_sales'] for row in approx}
+    else:
+        intervals = approx['confidence_intervals']
+    metrics = {}
+    for name, (lower, upper) in intervals.items():
+        metrics[name] = {
+            'exact': exact[name],
+            'estimate': approx[name],
+            'relative_error': round(abs(approx[name] - exact[name]) / abs(exact[name]), 4) if exact[name] else None,
+            'in_interval': lower <= exact[name] <= upper,
+        }
+    return metrics
+
+def run(repeats):
+    client = app.app.test_client()
+    results = {}
+    for endpoint in ENDPOINTS:
+        exact_ms, exact = best_time(client, endpoint, repeats)
+        approx_ms, approx = best_time(client, endpoint + '?approx=true', repeats)
+        results[endpoint] = {
+            'exact_ms': round(exact_ms, 1),
+            'approx_ms': round(approx_ms, 1),
+            'speedup': round(exact_ms / approx_ms, 2),
+            'metrics': compare(exact, approx),
+        }
+    return results
+
+if __name__ == '__main__':
+    database = sys.argv[1] if len(sys.argv) > 1 else app.DB_NAME
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    app.DB_NAME = database
+
+    results = run(repeats)
+    for endpoint, r in results.items():
+        print(f"{endpoint:<20} exact {r['exact_ms']:>9} ms   approx {r['approx_ms']:>8} ms   {r['speedup']}x")
+        for name, m in r['metrics'].items():
+            print(f"    {name:<22} error {m['relative_error']:<8} in interval: {m['in_interval']}")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f'approx_{database}.json')
+    with open(path, 'w') as f:
+        json.dump({'database': database, 'repeats': repeats, 'results': results}, f, indent=2)
+    print(f"Success: Results saved to '{path}'")
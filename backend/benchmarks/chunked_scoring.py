@@ -0,0 +1,87 @@
+"""
+Peak memory and time of scoring the whole customer base.
+
+Scores every customer of a database in a fresh interpreter, once in memory
+(app.score_customers on the full aggregated DataFrame, then the top
+churners, segments and churn rate from it) and once per batch size with
+batch_scoring (server-side cursor, preallocated buffers, running
+reductions). Reports the peak resident memory added by the scoring
+(ru_maxrss after, minus after loading the models) and the time taken, and
+checks that both give the same segments and churn rate.
+
+Usage:
+    python benchmarks/chunked_scoring.py [database] [batch_rows ...]
+
+Example, on the 1M-order database from seed_synthetic.py:
+    python benchmarks/chunked_scoring.py hackathon_bench 1000 10000 50000
+"""
+
+import os
+import sys
+import json
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# Runs in the child interpreter; prints one JSON line
+PROBE = """
+import sys, time, json, resource
+import numpy as np
+import psycopg2
+import app, batch_scoring
+app.DB_NAME = sys.argv[1]
+model = app.require_churn_model()
+baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+if sys.argv[2] == 'memory':
+    scores = app.score_customers(app.get_aggregated_data())
+    probabilities = scores['churn_probability']
+    segments = np.bincount(np.searchsorted(batch_scoring.RISK_THRESHOLDS, probabilities, side='right'), minlength=3)
+    top = np.argsort(-probabilities, kind='stable')[:100]
+    summary = {
+        'customers_scored': len(probabilities),
+        'churn_rate': float(scores['predicted_churn'].sum() / len(probabilities) * 100),
+        'segments': {name: int(count) for name, count in zip(batch_scoring.RISK_SEGMENTS, segments) if count},
+    }
+else:
+    conn = psycopg2.connect(database=app.DB_NAME, user=app.DB_USER, password=app.DB_PASS, host=app.DB_HOST, port=app.DB_PORT)
+    scorer = batch_scoring.BatchScorer(batch_rows=int(sys.argv[2]))
+    summary = scorer.score(conn, model, app.predict_with, app.AGGREGATED_DATA_SQL)
+    conn.close()
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    'seconds': round(elapsed, 2),
+    'peak_added_mb': round((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_kb) / 1024, 1),
+    'customers': summary['customers_scored'],
+    'churn_rate': summary['churn_rate'],
+    'segments': summary['segments'],
+}))
+"""
+
+def probe(database, mode):
+    env = dict(os.environ, STARTUP_MODE='lazy')
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE, database, str(mode)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+if __name__ == '__main__':
+    database = sys.argv[1] if len(sys.argv) > 1 else 'hackathon'
+    batch_sizes = [int(value) for value in sys.argv[2:]] or [1000, 10000, 50000]
+
+    runs = {'memory': probe(database, 'memory')}
+    for batch_rows in batch_sizes:
+        runs[f'chunked_{batch_rows}'] = probe(database, batch_rows)
+    reference = runs['memory']
+    for name, run in runs.items():
+        run['matches_memory'] = run['segments'] == reference['segments'] and run['churn_rate'] == reference['churn_rate']
+        print(f"{name:<16} {run['customers']:>9} customers   {run['seconds']:>7} s   "
+              f"+{run['peak_added_mb']:>7} MB peak   matches: {run['matches_memory']}")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f'chunked_scoring_{database}.json')
+    with open(path, 'w') as f:
+        json.dump({'database': database, 'results': runs}, f, indent=2)
+    print(f"Success: Results saved to '{path}'")
@@ -0,0 +1,118 @@
+"""
+Throughput of the churn explanations (churn_explainer.py).
+
+Explains batches of customers with the active model and reports
+explanations per second for:
+    vectorized  one decision_path call and one sparse product per batch
+    per_tree    the same attribution, walking each tree's path per customer
+                in Python (the textbook loop), on a small batch only
+    cached      app.explain_customers on a batch already explained
+It also checks that base value + contributions equals predict_proba.
+
+Usage:
+    python benchmarks/churn_explanations.py [database] [repeats]
+
+Example, on the 1M-order database from seed_synthetic.py:
+    python benchmarks/churn_explanations.py hackathon_bench 3
+"""
+
+import os
+import sys
+import json
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+import churn_explainer
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+BATCH_SIZES = [1, 10, 100, 1000, 10000]
+PER_TREE_BATCH = 20
+
+def best_rate(function, count, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return round(count / min(timings), 1)
+
+def per_tree_contributions(forest, model_input):
+    """Tree-path attribution one tree and one customer at a time."""
+    X = np.asarray(model_input, dtype=np.float32)
+    contributions = np.zeros(X.shape)
+    for tree in forest.estimators_:
+        t = tree.tree_
+        fraction = t.value[:, 0, 1] / t.value[:, 0, :].sum(axis=1)
+        for i, row in enumerate(X):
+            node = 0
+            while t.children_left[node] >= 0:
+                feature = t.feature[node]
+                child = t.children_left[node] if row[feature] <= t.threshold[node] else t.children_right[node]
+                contributions[i, feature] += fraction[child] - fraction[node]
+                node = child
+    return contributions / len(forest.estimators_)
+
+def run(repeats):
+    model = app.require_churn_model()
+    customer_df = app.get_aggregated_data()
+    _, model_input = app.prepare_model_input(customer_df.copy(), model)
+    build_start = time.perf_counter()
+    churn_explainer.explainers.clear()
+    explainer = churn_explainer.explainer_for(model)
+    build_ms = round((time.perf_counter() - build_start) * 1000, 1)
+
+    contributions = explainer.contributions(model_input)
+    probabilities = model['model'].predict_proba(model_input)[:, 1]
+    max_error = float(np.abs(explainer.base_value + contributions.sum(axis=1) - probabilities).max())
+
+    sizes = [size for size in BATCH_SIZES if size < len(model_input)] + [len(model_input)]
+    vectorized = {
+        size: best_rate(lambda: explainer.contributions(model_input.iloc[:size]), size, repeats)
+        for size in sizes
+    }
+
+    batch = model_input.iloc[:PER_TREE_BATCH]
+    per_tree = best_rate(lambda: per_tree_contributions(model['model'], batch), len(batch), 1)
+    per_tree_error = float(np.abs(per_tree_contributions(model['model'], batch) - contributions[:len(batch)]).max())
+
+    cached_batch = customer_df.iloc[:1000]
+    data_version = app.current_data_version()
+    app.explain_customers(model, cached_batch, data_version)
+    cached = best_rate(lambda: app.explain_customers(model, cached_batch, data_version), len(cached_batch), repeats)
+
+    return {
+        'customers': len(model_input),
+        'trees': len(model['model'].estimators_),
+        'features': len(explainer.feature_names),
+        'build_ms': build_ms,
+        'max_abs_error_vs_predict_proba': max_error,
+        'max_abs_error_per_tree_vs_vectorized': per_tree_error,
+        'explanations_per_second': {
+            'vectorized': vectorized,
+            'per_tree': {len(batch): per_tree},
+            'cached': {len(cached_batch): cached},
+        },
+    }
+
+if __name__ == '__main__':
+    database = sys.argv[1] if len(sys.argv) > 1 else app.DB_NAME
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    app.DB_NAME = database
+
+    results = run(repeats)
+    print(f"{results['customers']} customers, {results['trees']} trees, {results['features']} features "
+          f"(explainer built in {results['build_ms']} ms, max error {results['max_abs_error_vs_predict_proba']:.2e})")
+    for method, rates in results['explanations_per_second'].items():
+        for size, rate in rates.items():
+            print(f"    {method:<11} batch {size:>7}   {rate:>12} explanations/s")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f'explanations_{database}.json')
+    with open(path, 'w') as f:
+        json.dump({'database': database, 'repeats': repeats, 'results': results}, f, indent=2)
+    print(f"Success: Results saved to '{path}'")
@@ -0,0 +1,80 @@
+"""
+Row-wise (pd.read_sql) vs typed columnar (COPY CSV) fetch.
+
+Fetches the aggregated customer query and the raw orders table both ways,
+several times, and reports the best wall time and the DataFrame memory of
+each.
+
+Usage:
+    python benchmarks/columnar_fetch.py [database] [repeats]
+
+Example, on the 1M-order database from seed_synthetic.py:
+    python benchmarks/columnar_fetch.py hackathon_bench 3
+"""
+
+import os
+import sys
+import json
+import time
+import pandas as pd
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+import columnar
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+ORDERS_SQL = "SELECT * FROM orders"
+
+QUERIES = {
+    'aggregated_customers': (app.AGGREGATED_DATA_SQL, app.CATEGORICAL_COLUMNS[app.AGGREGATED_DATA_SQL]),
+    'orders': (ORDERS_SQL, ()),
+}
+
+def best_time(fetch, repeats):
+    timings, df = [], None
+    for _ in range(repeats):
+        conn = psycopg2.connect(database=app.DB_NAME, user=app.DB_USER, password=app.DB_PASS, host=app.DB_HOST, port=app.DB_PORT)
+        try:
+            start = time.perf_counter()
+            df = fetch(conn)
+            timings.append((time.perf_counter() - start) * 1000)
+        finally:
+            conn.close()
+    return min(timings), df
+
+def run(repeats):
+    results = {}
+    for name, (sql_query, categorical) in QUERIES.items():
+        row_ms, row_df = best_time(lambda conn: pd.read_sql(sql_query, conn), repeats)
+        columnar_ms, columnar_df = best_time(
+            lambda conn: columnar.read_sql_columnar(conn, sql_query, categorical=categorical), repeats
+        )
+        results[name] = {
+            'rows': len(row_df),
+            'read_sql_ms': round(row_ms, 1),
+            'columnar_ms': round(columnar_ms, 1),
+            'speedup': round(row_ms / columnar_ms, 2),
+            'read_sql_mb': round(row_df.memory_usage(deep=True).sum() / 2**20, 1),
+            'columnar_mb': round(columnar_df.memory_usage(deep=True).sum() / 2**20, 1),
+        }
+    return results
+
+if __name__ == '__main__':
+    database = sys.argv[1] if len(sys.argv) > 1 else app.DB_NAME
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    app.DB_NAME = database
+
+    results = run(repeats)
+    for name, r in results.items():
+        print(f"{name:<22} {r['rows']:>8} rows   read_sql {r['read_sql_ms']:>8} ms {r['read_sql_mb']:>7} MB"
+              f"   columnar {r['columnar_ms']:>8} ms {r['columnar_mb']:>7} MB   {r['speedup']}x")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f'columnar_{database}.json')
+    with open(path, 'w') as f:
+        json.dump({'database': database, 'repeats': repeats, 'results': results}, f, indent=2)
+    print(f"Success: Results saved to '{path}'")
@@ -0,0 +1,60 @@
+"""
+Compares one /api/dashboard request against the separate requests the
+dashboard components send on each load.
+
+Usage:
+    python benchmarks/dashboard_bundle.py URL [repeats]
+
+Example:
+    python benchmarks/dashboard_bundle.py http://localhost:5000 5
+"""
+
+import sys
+import json
+import time
+import urllib.request
+
+# The requests the dashboard components send on each page load
+PAGE_LOAD = [
+    '/api/main_kpis',
+    '/api/sales_kpis',
+    '/api/predict_churn?count=10',
+    '/api/churn_trends',
+    '/api/churn_segmentation',
+    '/api/top_products',
+    '/api/full_sales_view?days=90',
+    '/api/product_demand_forecast',
+    '/api/db_stats',
+    '/api/monthly_sales',
+]
+
+BUNDLE = (
+    '/api/dashboard?sections=main_kpis,sales_kpis,top_churners,churn_trends,churn_segmentation,'
+    'top_products,full_sales_view,product_demand_forecast,db_stats,monthly_sales'
+)
+
+def timed_get(url):
+    start = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=300) as response:
+        body = response.read()
+    return (time.perf_counter() - start) * 1000, body
+
+def run(base_url, repeats):
+    separate, bundled = [], []
+    for _ in range(repeats):
+        separate.append(sum(timed_get(base_url + path)[0] for path in PAGE_LOAD))
+        elapsed, body = timed_get(base_url + BUNDLE)
+        bundled.append(elapsed)
+    return {
+        'separate_ms': round(min(separate), 1),
+        'bundle_ms': round(min(bundled), 1),
+        'speedup': round(min(separate) / min(bundled), 2),
+        'bundle_timings_ms': json.loads(body)['timings_ms'],
+    }
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    print(json.dumps(run(sys.argv[1].rstrip('/'), repeats), indent=2))
@@ -0,0 +1,124 @@
+"""
+Peak memory and throughput of reading an upload workbook.
+
+Generates .xlsx files of the upload layout (openpyxl write-only mode, so
+generating them is itself streamed), then reads each one in a fresh
+interpreter, once with pd.read_excel and once with the chunked
+excel_stream reader, and reports the peak resident memory (ru_maxrss) and
+rows per second. pd.read_excel is skipped above --max-pandas-rows, where
+it needs more memory than is worth spending.
+
+Usage:
+    python benchmarks/excel_stream.py [rows ...] [--max-pandas-rows N]
+
+Example:
+    python benchmarks/excel_stream.py 100000 250000 1000000 --max-pandas-rows 250000
+"""
+
+import os
+import sys
+import json
+import random
+import datetime
+import subprocess
+import tempfile
+import openpyxl
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import excel_stream
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+HEADER = [
+    'customer_id', 'age', 'gender', 'country', 'signup_date', 'product_id', 'product_name',
+    'category', 'order_id', 'last_purchase_date', 'cancellations_count', 'subscription_status',
+    'unit_price', 'quantity', 'purchase_frequency', 'Ratings',
+]
+COUNTRIES = ['USA', 'UK', 'Germany', 'France', 'India', 'Canada', 'Australia', 'Japan']
+CATEGORIES = ['Electronics', 'Clothing', 'Books', 'Home', 'Beauty', 'Sports']
+
+# Runs in the child interpreter; prints one JSON line
+PROBE = """
+import sys, time, json, resource
+start = time.perf_counter()
+rows = 0
+if sys.argv[2] == 'pandas':
+    import pandas as pd
+    rows = len(pd.read_excel(sys.argv[1]))
+else:
+    import excel_stream
+    for df in excel_stream.iter_excel_chunks(sys.argv[1]):
+        rows += len(df)
+elapsed = time.perf_counter() - start
+print(json.dumps({'rows': rows, 'seconds': elapsed, 'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+"""
+
+def generate(path, rows, seed=7):
+    """Writes a workbook of `rows` synthetic upload rows."""
+    rng = random.Random(seed)
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(HEADER)
+    base = datetime.date(2022, 1, 1)
+    for i in range(rows):
+        customer = rng.randrange(max(rows // 5, 1))
+        product = rng.randrange(500)
+        sheet.append([
+            f"C{customer:07d}", rng.randint(18, 70), rng.choice(['Male', 'Female']),
+            COUNTRIES[customer % len(COUNTRIES)], base + datetime.timedelta(days=customer % 700),
+            f"P{product:04d}", f"Product {product}", CATEGORIES[product % len(CATEGORIES)],
+            f"O{i:08d}", base + datetime.timedelta(days=rng.randrange(1000)), rng.randint(0, 5),
+            rng.choice(['active', 'paused', 'cancelled']), round(rng.uniform(5, 500), 2),
+            rng.randint(1, 5), rng.randint(1, 30), rng.randint(1, 5),
+        ])
+    workbook.save(path)
+
+def measure(path, reader):
+    completed = subprocess.run(
+        [sys.executable, '-c', PROBE, path, reader],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    return {
+        'rows': result['rows'],
+        'seconds': round(result['seconds'], 2),
+        'rows_per_second': round(result['rows'] / result['seconds']),
+        'peak_rss_mb': round(result['peak_rss_kb'] / 1024, 1),
+    }
+
+def run(sizes, max_pandas_rows):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in sizes:
+            path = os.path.join(directory, f"upload_{rows}.xlsx")
+            generate(path, rows)
+            entry = {'file_mb': round(os.path.getsize(path) / 2**20, 1), 'stream': measure(path, 'stream')}
+            if rows <= max_pandas_rows:
+                entry['pandas'] = measure(path, 'pandas')
+            results[rows] = entry
+            os.remove(path)
+    return results
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    max_pandas_rows = 250000
+    if '--max-pandas-rows' in args:
+        index = args.index('--max-pandas-rows')
+        max_pandas_rows = int(args[index + 1])
+        del args[index:index + 2]
+    sizes = [int(arg) for arg in args] or [100000, 250000, 1000000]
+
+    results = run(sizes, max_pandas_rows)
+    for rows, r in results.items():
+        line = f"{rows:>9} rows ({r['file_mb']} MB)   stream {r['stream']['peak_rss_mb']:>7} MB {r['stream']['rows_per_second']:>7} rows/s"
+        if 'pandas' in r:
+            line += f"   read_excel {r['pandas']['peak_rss_mb']:>7} MB {r['pandas']['rows_per_second']:>7} rows/s"
+        print(line)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, 'excel_stream.json')
+    with open(path, 'w') as f:
+        json.dump({'chunk_rows': excel_stream.CHUNK_ROWS, 'results': results}, f, indent=2)
+    print(f"Success: Results saved to '{path}'")
@@ -0,0 +1,163 @@
+"""
+Captures EXPLAIN ANALYZE for the SQL behind each API endpoint.
+
+Usage:
+    python benchmarks/explain_queries.py capture <label> [database]
+    python benchmarks/explain_queries.py compare <before> <after>
+
+A capture is written to benchmarks/results/explain_<label>.json; compare
+prints a Markdown table of execution times and top-level plan nodes.
+"""
+
+import os
+import sys
+import json
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from migrations import DB_NAME, DB_USER, DB_PASS, DB_HOST, DB_PORT
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# The queries issued by app.py, keyed by the endpoint that runs them
+ENDPOINT_QUERIES = {
+    'aggregated_data (predict_churn, churn_trends, churn_segmentation, main_kpis)': """
+        SELECT
+            c.customer_id, c.age, c.gender, c.country,
+            MIN(c.signup_date) as signup_date,
+            MAX(o.last_purchase_date) as last_purchase_date,
+            COUNT(o.order_id) as purchase_count,
+            SUM(o.quantity) as total_items_purchased,
+            SUM(o.unit_price * o.quantity) as total_spend,
+            AVG(o.ratings) as avg_rating,
+            SUM(o.cancellations_count) as total_cancellations,
+            MAX(o.subscription_status) as subscription_status
+        FROM customers c JOIN orders o ON c.customer_id = o.customer_id
+        GROUP BY c.customer_id, c.age, c.gender, c.country;
+    """,
+    'top_products': """
+        SELECT p.product_name, p.category, SUM(o.unit_price * o.quantity) as total_sales
+        FROM products p JOIN orders o ON p.product_id = o.product_id
+        GROUP BY p.product_name, p.category
+        ORDER BY total_sales DESC
+        LIMIT 10;
+    """,
+    'full_sales_view': """
+        SELECT last_purchase_date, SUM(unit_price * quantity) as order_amount
+        FROM orders
+        WHERE last_purchase_date >= (SELECT MAX(last_purchase_date) - INTERVAL '180 days' FROM orders)
+        GROUP BY last_purchase_date;
+    """,
+    'sales_kpis': """
+        SELECT last_purchase_date, (unit_price * quantity) as order_amount
+        FROM orders;
+    """,
+    'product_demand_forecast (top products)': """
+        SELECT product_id, SUM(quantity) as total_quantity
+        FROM orders
+        GROUP BY product_id
+        ORDER BY total_quantity DESC
+        LIMIT 5;
+    """,
+    'product_demand_forecast (sales history)': """
+        SELECT o.last_purchase_date, o.product_id, o.quantity, p.product_name
+        FROM orders o
+        JOIN products p ON o.product_id = p.product_id
+        WHERE o.product_id IN ('PROD1', 'PROD2', 'PROD3', 'PROD4', 'PROD5');
+    """,
+    'user_distribution': """
+        SELECT country, COUNT(customer_id) as user_count
+        FROM customers
+        GROUP BY country
+        ORDER BY user_count DESC;
+    """,
+    'main_kpis (sales)': """
+        SELECT SUM(unit_price * quantity) as total_revenue, COUNT(DISTINCT order_id) as total_orders
+        FROM orders;
+    """,
+    'sales_by_age': """
+        SELECT
+            CASE
+                WHEN c.age BETWEEN 18 AND 25 THEN '18-25'
+                WHEN c.age BETWEEN 26 AND 35 THEN '26-35'
+                WHEN c.age BETWEEN 36 AND 45 THEN '36-45'
+                WHEN c.age BETWEEN 46 AND 60 THEN '46-60'
+                ELSE '60+'
+            END AS age_group,
+            SUM(o.quantity) AS total_sales
+        FROM customers c JOIN orders o ON c.customer_id = o.customer_id
+        GROUP BY age_group
+        ORDER BY total_sales DESC;
+    """,
+    'monthly_sales / yearly_sales': """
+        SELECT last_purchase_date, quantity FROM orders;
+    """,
+    'db_stats (total)': "SELECT COUNT(*) FROM orders;",
+    'db_stats (cancelled)': "SELECT COUNT(*) FROM orders WHERE subscription_status = 'cancelled';",
+}
+
+def explain(conn, sql_query):
+    """Runs EXPLAIN ANALYZE on a query and returns timings and the top plan node."""
+    with conn.cursor() as cursor:
+        cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql_query.strip().rstrip(';'))
+        plan = cursor.fetchone()[0][0]
+    conn.rollback()
+
+    def node_types(node):
+        types = [node['Node Type'] + (f" on {node['Relation Name']}" if 'Relation Name' in node else '')]
+        for child in node.get('Plans', []):
+            types += node_types(child)
+        return types
+
+    return {
+        'execution_ms': plan['Execution Time'],
+        'planning_ms': plan['Planning Time'],
+        'nodes': node_types(plan['Plan']),
+    }
+
+def capture(label, database):
+    """Explains every endpoint query, warming the cache with one run first."""
+    conn = psycopg2.connect(database=database, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT)
+    results = {}
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM orders;")
+            results['_orders'] = cursor.fetchone()[0]
+            cursor.execute("SELECT version FROM schema_migrations ORDER BY version;")
+            results['_migrations'] = [row[0] for row in cursor.fetchall()]
+        for endpoint, sql_query in ENDPOINT_QUERIES.items():
+            explain(conn, sql_query)
+            results[endpoint] = explain(conn, sql_query)
+            print(f"{endpoint}: {results[endpoint]['execution_ms']:.1f} ms")
+    finally:
+        conn.close()
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f'explain_{label}.json')
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Success: Plans saved to '{path}'")
+
+def compare(before_label, after_label):
+    """Prints a Markdown table comparing two captures."""
+    with open(os.path.join(RESULTS_DIR, f'explain_{before_label}.json')) as f:
+        before = json.load(f)
+    with open(os.path.join(RESULTS_DIR, f'explain_{after_label}.json')) as f:
+        after = json.load(f)
+
+    print(f"Orders: {before['_orders']} | migrations before: {before['_migrations']} | after: {after['_migrations']}\n")
+    print("| Endpoint query | Before (ms) | After (ms) | Speedup | Scans after |")
+    print("|---|---:|---:|---:|---|")
+    for endpoint in ENDPOINT_QUERIES:
+        b, a = before[endpoint], after[endpoint]
+        scans = ', '.join(sorted({n for n in a['nodes'] if ' on ' in n}))
+        speedup = b['execution_ms'] / a['execution_ms'] if a['execution_ms'] else float('inf')
+        print(f"| {endpoint} | {b['execution_ms']:.1f} | {a['execution_ms']:.1f} | {speedup:.1f}x | {scans} |")
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 3 and sys.argv[1] == 'capture':
+        capture(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else DB_NAME)
+    elif len(sys.argv) == 4 and sys.argv[1] == 'compare':
+        compare(sys.argv[2], sys.argv[3])
+    else:
+        print(__doc__)
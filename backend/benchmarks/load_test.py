@@ -0,0 +1,118 @@
+"""
+Mixed-traffic load test for the API.
+
+Each client thread repeatedly picks an endpoint from MIX (weighted) and
+records its latency, for a fixed duration. Prints p50/p95/p99 latency per
+endpoint and overall.
+
+Usage:
+    python benchmarks/load_test.py URL [concurrency] [duration_seconds] [label]
+
+Example, comparing the two serving modes on the same database:
+    python app.py                                         # Flask on :5000
+    uvicorn async_app:asgi_app --port 5001                 # async on :5001
+    python benchmarks/load_test.py http://localhost:5000 16 60 flask
+    python benchmarks/load_test.py http://localhost:5001 16 60 async
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import threading
+import urllib.request
+import urllib.error
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# (weight, path): a few slow churn requests among many cheap dashboard reads
+MIX = [
+    (1, '/api/predict_churn?count=10'),
+    (1, '/api/main_kpis'),
+    (4, '/api/top_products'),
+    (4, '/api/db_stats'),
+    (4, '/api/user_distribution'),
+    (3, '/api/sales_by_age'),
+    (2, '/api/sales_forecast?days=30'),
+]
+
+def percentile(values, pct):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+def summarize(latencies, errors, duration):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / duration, 2),
+        'p50_ms': round(percentile(latencies, 50), 1),
+        'p95_ms': round(percentile(latencies, 95), 1),
+        'p99_ms': round(percentile(latencies, 99), 1),
+    }
+
+def run(base_url, concurrency, duration, mix=MIX, seed=42):
+    """Runs the load test and returns a summary per endpoint and overall."""
+    paths = [path for _, path in mix]
+    weights = [weight for weight, _ in mix]
+    latencies = {path: [] for path in paths}
+    errors = {path: 0 for path in paths}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(client_id):
+        rng = random.Random(seed + client_id)
+        while time.perf_counter() < deadline:
+            path = rng.choices(paths, weights)[0]
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(base_url + path, timeout=300) as response:
+                    response.read()
+                    ok = response.status < 400
+            except (urllib.error.URLError, OSError):
+                ok = False
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies[path].append(elapsed_ms)
+                if not ok:
+                    errors[path] += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    results = {path: summarize(latencies[path], errors[path], elapsed) for path in paths}
+    all_latencies = [value for values in latencies.values() for value in values]
+    results['overall'] = summarize(all_latencies, sum(errors.values()), elapsed)
+    return results
+
+def print_results(results):
+    print(f"{'endpoint':<34}{'reqs':>7}{'errs':>6}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for path, r in results.items():
+        print(f"{path:<34}{r['requests']:>7}{r['errors']:>6}{r['throughput_rps']:>8}"
+              f"{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}")
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    url = sys.argv[1].rstrip('/')
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    duration = float(sys.argv[3]) if len(sys.argv) > 3 else 30
+    label = sys.argv[4] if len(sys.argv) > 4 else None
+
+    results = run(url, concurrency, duration)
+    print_results(results)
+    if label:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f'load_{label}.json')
+        with open(path, 'w') as f:
+            json.dump({'url': url, 'concurrency': concurrency, 'duration': duration, 'results': results}, f, indent=2)
+        print(f"Success: Results saved to '{path}'")
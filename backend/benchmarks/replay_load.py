@@ -0,0 +1,264 @@
+"""
+Traffic-replay load test: the dashboard's own request mix.
+
+Each virtual user replays what the React dashboard
+(frontend/project/src/components) asks the API for. Opening a tab fires
+every request of its components at once, as the browser does (at most six
+in parallel per user), and the controls on the page issue single requests.
+VIEWS lists those bursts with how often they happen; a user picks one by
+weight, waits for all its responses, thinks for --think-ms and picks
+again. At startup the components are scanned for /api/ paths, and any the
+mix does not cover (or covers but the dashboard no longer calls) is
+reported.
+
+With --seed, a database is first filled by seed_synthetic.py; with
+--serve, a local server (flask or async) is started on that database for
+the run. Reports p50/p95/p99 latency, throughput and error rate per
+endpoint and per view, and writes them with the configuration and git
+commit to results/replay_<label>.json, keys sorted so two runs diff.
+
+Usage:
+    python benchmarks/replay_load.py [--url URL | --serve flask|async] [--database NAME] [--seed ORDERS]
+                                     [--concurrency N] [--duration S] [--warmup S] [--think-ms MS] [--label NAME]
+
+Example, on 200k synthetic orders:
+    python benchmarks/replay_load.py --serve flask --database hackathon_load --seed 200000 \\
+        --concurrency 8 --duration 60 --label flask
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARKS_DIR)
+COMPONENTS_DIR = os.path.join(os.path.dirname(BACKEND_DIR), 'frontend', 'project', 'src', 'components')
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from load_test import percentile
+
+# Requests a browser sends to one host in parallel
+BROWSER_CONNECTIONS = 6
+
+# (weight, view, paths fired together). The sales tab is the landing page.
+VIEWS = [
+    (6, 'sales_tab', [
+        '/api/sales_kpis',                  # StatsCards
+        '/api/top_products',                # TopProductsTable
+        '/api/full_sales_view?days=90',     # SalesForecastChart
+        '/api/monthly_sales',               # TrendsChart
+        '/api/product_demand_forecast',     # DemandForecastCard
+    ]),
+    (4, 'churn_tab', [
+        '/api/predict_churn?count=10',      # TopChurnCustomers
+        '/api/churn_segmentation',          # ChurnSegmentationx (pieChart)
+        '/api/churn_trends',                # ChurnRateTrends
+        '/api/db_stats',                    # ChurnRiskSummary (ChurnRiskBoard)
+    ]),
+    (2, 'forecast_range', ['/api/full_sales_view?days=365']),     # SalesForecastChart range button
+    (2, 'yearly_trend', ['/api/yearly_sales']),                   # TrendsChart yearly toggle
+    (2, 'churner_count', ['/api/predict_churn?count={count}']),   # TopChurnCustomers count select
+]
+CHURNER_COUNTS = [10, 20, 30, 40, 50, 60, 70, 80, 90, 100]
+
+# Writes are left out of the replay
+EXCLUDED_ENDPOINTS = {'/api/upload_data'}
+
+# Starts a server on a given database and port, in a child interpreter
+SERVE = {
+    'flask': "import app, train_forcaster; app.DB_NAME = train_forcaster.DB_NAME = %r; "
+             "app.app.run(port=%d, threaded=True)",
+    'async': "import app, train_forcaster; app.DB_NAME = train_forcaster.DB_NAME = %r; "
+             "import uvicorn, async_app; uvicorn.run(async_app.asgi_app, port=%d, log_level='warning')",
+}
+
+def endpoint_of(path):
+    return path.split('?', 1)[0]
+
+def frontend_coverage():
+    """Endpoints the dashboard components call that the mix misses, and the reverse."""
+    called = set()
+    for name in os.listdir(COMPONENTS_DIR):
+        if name.endswith(('.tsx', '.jsx', '.ts', '.js')):
+            with open(os.path.join(COMPONENTS_DIR, name), encoding='utf-8') as f:
+                called.update(re.findall(r'/api/[a-z_]+', f.read()))
+    replayed = {endpoint_of(path) for _, _, paths in VIEWS for path in paths}
+    return {
+        'not_replayed': sorted(called - replayed - EXCLUDED_ENDPOINTS),
+        'not_called_by_frontend': sorted(replayed - called),
+    }
+
+def summarize(latencies, errors, duration):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'error_rate': round(errors / len(latencies), 4) if latencies else 0.0,
+        'throughput_rps': round(len(latencies) / duration, 2),
+        'p50_ms': round(percentile(latencies, 50), 1),
+        'p95_ms': round(percentile(latencies, 95), 1),
+        'p99_ms': round(percentile(latencies, 99), 1),
+    }
+
+def fetch(url):
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=300) as response:
+            response.read()
+            ok = response.status < 400
+    except (urllib.error.URLError, OSError):
+        ok = False
+    return (time.perf_counter() - start) * 1000, ok
+
+def replay(base_url, concurrency, duration, think_ms=0, seed=42, record=True):
+    """Runs the virtual users for `duration` seconds. Returns per-endpoint and per-view latencies."""
+    weights = [weight for weight, _, _ in VIEWS]
+    requests, views = {}, {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def user(user_id):
+        rng = random.Random(seed + user_id)
+        with ThreadPoolExecutor(max_workers=BROWSER_CONNECTIONS) as browser:
+            while time.perf_counter() < deadline:
+                _, view, paths = rng.choices(VIEWS, weights)[0]
+                paths = [path.format(count=rng.choice(CHURNER_COUNTS)) for path in paths]
+                start = time.perf_counter()
+                results = list(browser.map(lambda path: fetch(base_url + path), paths))
+                view_ms = (time.perf_counter() - start) * 1000
+                if record:
+                    with lock:
+                        for path, (elapsed_ms, ok) in zip(paths, results):
+                            latencies, errors = requests.setdefault(endpoint_of(path), ([], [0]))
+                            latencies.append(elapsed_ms)
+                            errors[0] += not ok
+                        latencies, errors = views.setdefault(view, ([], [0]))
+                        latencies.append(view_ms)
+                        errors[0] += not all(ok for _, ok in results)
+                if think_ms:
+                    time.sleep(rng.expovariate(1000 / think_ms))
+
+    users = [threading.Thread(target=user, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in users:
+        thread.start()
+    for thread in users:
+        thread.join()
+    return requests, views, time.perf_counter() - started
+
+def run(base_url, concurrency, duration, warmup=0, think_ms=0):
+    if warmup:
+        replay(base_url, concurrency, warmup, think_ms, seed=7, record=False)
+    requests, views, elapsed = replay(base_url, concurrency, duration, think_ms)
+    all_latencies = [value for latencies, _ in requests.values() for value in latencies]
+    all_errors = sum(errors[0] for _, errors in requests.values())
+    return {
+        'endpoints': {name: summarize(latencies, errors[0], elapsed) for name, (latencies, errors) in requests.items()},
+        'views': {name: summarize(latencies, errors[0], elapsed) for name, (latencies, errors) in views.items()},
+        'overall': summarize(all_latencies, all_errors, elapsed),
+    }
+
+def start_server(mode, database, port):
+    server = subprocess.Popen(
+        [sys.executable, '-c', SERVE[mode] % (database, port)],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f"http://localhost:{port}"
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(url + '/readyz', timeout=5) as response:
+                if response.status == 200:
+                    return server, url
+        except (urllib.error.URLError, OSError):
+            pass
+        if server.poll() is not None:
+            break
+        time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError(f"The {mode} server did not become ready on port {port}.")
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_results(results):
+    print(f"{'endpoint / view':<34}{'reqs':>7}{'err%':>7}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for group in ('endpoints', 'views'):
+        for name, r in sorted(results[group].items()):
+            print(f"{name:<34}{r['requests']:>7}{r['error_rate'] * 100:>7.1f}{r['throughput_rps']:>8}"
+                  f"{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}")
+    r = results['overall']
+    print(f"{'overall':<34}{r['requests']:>7}{r['error_rate'] * 100:>7.1f}{r['throughput_rps']:>8}"
+          f"{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replays the dashboard's request mix against the API.")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--url', default='http://localhost:5000', help="server to load (default: %(default)s)")
+    target.add_argument('--serve', choices=sorted(SERVE), help="start a local server for the run")
+    parser.add_argument('--database', help="database for --serve and --seed (default: the app's)")
+    parser.add_argument('--seed', type=int, metavar='ORDERS', help="first seed the database with this many synthetic orders")
+    parser.add_argument('--port', type=int, default=5050, help="port for --serve (default: %(default)s)")
+    parser.add_argument('--concurrency', type=int, default=8, help="virtual users (default: %(default)s)")
+    parser.add_argument('--duration', type=float, default=30, help="measured seconds (default: %(default)s)")
+    parser.add_argument('--warmup', type=float, default=5, help="unmeasured seconds first (default: %(default)s)")
+    parser.add_argument('--think-ms', type=float, default=0, help="mean pause between a user's views (default: none)")
+    parser.add_argument('--label', help="save results to results/replay_<label>.json")
+    args = parser.parse_args()
+
+    coverage = frontend_coverage()
+    for path in coverage['not_replayed']:
+        print(f"Warning: The dashboard calls {path}, which the replay mix does not cover.")
+    for path in coverage['not_called_by_frontend']:
+        print(f"Warning: The replay mix requests {path}, which the dashboard no longer calls.")
+
+    database = args.database
+    if args.seed:
+        import psycopg2
+        import seed_synthetic
+        database = database or seed_synthetic.DB_NAME
+        seed_synthetic.create_database(database)
+        conn = psycopg2.connect(database=database, user=seed_synthetic.DB_USER, password=seed_synthetic.DB_PASS,
+                                host=seed_synthetic.DB_HOST, port=seed_synthetic.DB_PORT)
+        try:
+            seed_synthetic.apply_migrations(conn)
+            seed_synthetic.seed(conn, args.seed, max(args.seed // 10, 1))
+            print(f"Success: Seeded '{database}' with {args.seed} orders.")
+        finally:
+            conn.close()
+
+    server, url = None, args.url.rstrip('/')
+    if args.serve:
+        server, url = start_server(args.serve, database or 'hackathon', args.port)
+    try:
+        results = run(url, args.concurrency, args.duration, args.warmup, args.think_ms)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    print_results(results)
+
+    if args.label:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f'replay_{args.label}.json')
+        config = {
+            'url': None if args.serve else url, 'serve': args.serve, 'database': database, 'seed_orders': args.seed,
+            'concurrency': args.concurrency, 'duration': args.duration, 'warmup': args.warmup, 'think_ms': args.think_ms,
+        }
+        with open(path, 'w') as f:
+            json.dump({'commit': git_commit(), 'config': config, 'frontend_coverage': coverage, 'results': results},
+                      f, indent=2, sort_keys=True)
+        print(f"Success: Results saved to '{path}'")
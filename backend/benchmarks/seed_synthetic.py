@@ -0,0 +1,103 @@
+"""
+Seeds a database with a synthetic e-commerce dataset for benchmarking.
+Rows are generated inside PostgreSQL with generate_series, in date order,
+so large datasets load in seconds.
+
+Usage: python benchmarks/seed_synthetic.py [orders] [customers] [database]
+"""
+
+import os
+import sys
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from migrations import apply_migrations, REBUILD_SAMPLES_STATEMENTS, DB_NAME, DB_USER, DB_PASS, DB_HOST, DB_PORT
+
+PRODUCTS = 500
+
+def create_database(name):
+    """Creates the target database if it does not exist yet."""
+    conn = psycopg2.connect(database='postgres', user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT)
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s;", (name,))
+        if cursor.fetchone() is None:
+            cursor.execute(f'CREATE DATABASE "{name}";')
+    conn.close()
+
+def seed(conn, n_orders, n_customers):
+    """Replaces the contents of the tables with synthetic rows."""
+    with conn.cursor() as cursor:
+        cursor.execute("TRUNCATE orders, customers, products CASCADE;")
+        cursor.execute("SELECT setseed(0.42);")
+        cursor.execute("""
+            INSERT INTO customers (customer_id, age, gender, country, signup_date)
+            SELECT
+                'CUST' || g,
+                18 + (random() * 52)::int,
+                (ARRAY['Male', 'Female', 'Other'])[1 + (random() * 2)::int],
+                (ARRAY['USA', 'UK', 'Canada', 'Germany', 'India', 'Pakistan'])[1 + (random() * 5)::int],
+                DATE '2021-01-01' + (random() * 1000)::int
+            FROM generate_series(1, %s) g;
+        """, (n_customers,))
+        cursor.execute("""
+            INSERT INTO products (product_id, product_name, category)
+            SELECT
+                'PROD' || g,
+                'Product ' || g,
+                (ARRAY['Electronics', 'Clothing', 'Sports', 'Home', 'Beauty'])[1 + g %% 5]
+            FROM generate_series(1, %s) g;
+        """, (PRODUCTS,))
+        # Orders are spread evenly over ~3 years and inserted in date order
+        cursor.execute("""
+            INSERT INTO orders (order_id, customer_id, product_id, last_purchase_date,
+                                cancellations_count, subscription_status, unit_price,
+                                quantity, purchase_frequency, ratings)
+            SELECT
+                'ORD' || g,
+                'CUST' || (1 + (random() * (%s - 1))::int),
+                'PROD' || (1 + (random() * (%s - 1))::int),
+                DATE '2022-12-01' + (g::bigint * 1100 / %s)::int,
+                (random() * 5)::int,
+                (ARRAY['active', 'paused', 'cancelled'])[1 + (random() * 2)::int],
+                round((5 + random() * 995)::numeric, 2),
+                1 + (random() * 9)::int,
+                round((random() * 50)::numeric, 2),
+                round((1 + random() * 4)::numeric, 1)
+            FROM generate_series(1, %s) g;
+        """, (n_customers, PRODUCTS, n_orders, n_orders))
+        # Rebuild the leaderboard if this database already has it (migration 3)
+        cursor.execute("SELECT to_regclass('product_sales') IS NOT NULL;")
+        if cursor.fetchone()[0]:
+            cursor.execute("""
+                INSERT INTO product_sales (product_id, product_name, category, total_revenue, total_units)
+                SELECT p.product_id, p.product_name, p.category,
+                       SUM(o.unit_price * o.quantity), SUM(o.quantity)
+                FROM products p JOIN orders o ON p.product_id = o.product_id
+                GROUP BY p.product_id, p.product_name, p.category;
+            """)
+        # Refill the approximate-analytics samples if this database has them (migration 6)
+        cursor.execute("SELECT to_regclass('order_sample') IS NOT NULL;")
+        if cursor.fetchone()[0]:
+            for statement in REBUILD_SAMPLES_STATEMENTS:
+                cursor.execute(statement)
+        # Mark the data as changed if this database tracks a version (migration 4)
+        cursor.execute("SELECT to_regclass('data_version') IS NOT NULL;")
+        if cursor.fetchone()[0]:
+            cursor.execute("UPDATE data_version SET version = version + 1, updated_at = NOW();")
+        cursor.execute("ANALYZE;")
+    conn.commit()
+
+if __name__ == '__main__':
+    n_orders = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    n_customers = int(sys.argv[2]) if len(sys.argv) > 2 else n_orders // 10
+    database = sys.argv[3] if len(sys.argv) > 3 else DB_NAME
+
+    create_database(database)
+    conn = psycopg2.connect(database=database, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT)
+    try:
+        apply_migrations(conn, target_version=1)
+        seed(conn, n_orders, n_customers)
+        print(f"Success: Seeded '{database}' with {n_orders} orders and {n_customers} customers.")
+    finally:
+        conn.close()
@@ -0,0 +1,104 @@
+"""
+Import-time profile of the API in each startup mode.
+
+Imports app.py in a fresh interpreter per mode (python -X importtime) and
+reports the time until `import app` returns, the time until the models are
+warm (/readyz would answer 200), the slowest modules imported and which
+heavy modules (statsmodels, sklearn, scipy) were imported before the server
+could answer. Exits non-zero when the lazy import loads a heavy module, or,
+with --max-import-ms, when it is slower than the budget, so a startup
+regression fails the run.
+
+Usage:
+    python benchmarks/startup_profile.py [repeats] [--max-import-ms N]
+
+Example:
+    python benchmarks/startup_profile.py 3 --max-import-ms 1500
+"""
+
+import os
+import re
+import sys
+import json
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+MODES = ['eager', 'background', 'lazy']
+HEAVY_MODULES = ['statsmodels', 'sklearn', 'scipy']
+TOP_MODULES = 10
+
+# Runs in the child interpreter; prints one JSON line after the import timings on stderr
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import app
+imported = time.perf_counter() - start
+heavy = [name for name in %r if name in sys.modules]
+app.warm_up()
+ready = time.perf_counter() - start
+print(json.dumps({'import_s': imported, 'ready_s': ready, 'heavy_at_import': heavy}))
+"""
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$')
+
+def top_level_modules(stderr):
+    """Slowest modules by cumulative import time (microseconds), outermost imports only."""
+    modules = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match and len(match.group(3)) <= 3:
+            modules.append((match.group(4), int(match.group(2))))
+    modules.sort(key=lambda module: -module[1])
+    return [{'module': name, 'cumulative_ms': round(us / 1000, 1)} for name, us in modules[:TOP_MODULES]]
+
+def profile(mode):
+    env = dict(os.environ, STARTUP_MODE=mode)
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE % (HEAVY_MODULES,)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    return {
+        'import_ms': round(result['import_s'] * 1000, 1),
+        'ready_ms': round(result['ready_s'] * 1000, 1),
+        'heavy_at_import': result['heavy_at_import'],
+        'top_modules': top_level_modules(completed.stderr),
+    }
+
+def run(repeats):
+    results = {}
+    for mode in MODES:
+        runs = [profile(mode) for _ in range(repeats)]
+        best = min(runs, key=lambda r: r['import_ms'])
+        results[mode] = dict(best, ready_ms=min(r['ready_ms'] for r in runs))
+    return results
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    max_import_ms = None
+    if '--max-import-ms' in args:
+        index = args.index('--max-import-ms')
+        max_import_ms = float(args[index + 1])
+        del args[index:index + 2]
+    repeats = int(args[0]) if args else 3
+
+    results = run(repeats)
+    for mode, r in results.items():
+        print(f"{mode:<11} import {r['import_ms']:>8} ms   ready {r['ready_ms']:>8} ms   heavy at import: {r['heavy_at_import'] or '-'}")
+        for module in r['top_modules'][:5]:
+            print(f"    {module['module']:<40} {module['cumulative_ms']:>8} ms")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, 'startup_profile.json')
+    with open(path, 'w') as f:
+        json.dump({'repeats': repeats, 'results': results}, f, indent=2)
+    print(f"Success: Results saved to '{path}'")
+
+    if results['lazy']['heavy_at_import']:
+        print(f"Error: Lazy import loaded {', '.join(results['lazy']['heavy_at_import'])}.")
+        sys.exit(1)
+    if max_import_ms is not None and results['lazy']['import_ms'] > max_import_ms:
+        print(f"Error: Lazy import took {results['lazy']['import_ms']} ms, over the {max_import_ms} ms budget.")
+        sys.exit(1)
@@ -0,0 +1,299 @@
+"""
+Precomputed churn and sales cube.
+
+Holds, per month x country x gender x age x churn risk, the number of
+customers and predicted churners and the orders, revenue and units sold
+(table churn_cube). Orders count in the month they were placed; a customer
+counts once, in the month of their last purchase (as in churn_history).
+Age is kept per year and churn risk per percent of churn probability, so
+any age bins and risk thresholds (at 0.01 resolution) can be applied when
+the cube is sliced, without going back to the orders or rescoring.
+
+Each customer's own cells are kept too (customer_cube_cells). Refreshing a
+set of customers takes back what they added before and adds their cells as
+they are now, so uploads and rescores only touch the customers they
+changed. The churn risk comes from the stored scores (customer_churn), so
+refresh after churn_history.record_scores.
+
+Rebuild it from the stored scores with:
+    python churn_cube.py
+"""
+
+import psycopg2
+
+# --- Database Connection Details ---
+DB_NAME = "hackathon"
+DB_USER = "postgres"
+DB_PASS = "Post@7070" # <-- IMPORTANT: Change this
+DB_HOST = "localhost"
+DB_PORT = "5432"
+
+# Arbitrary key so rebuilds and incremental refreshes apply one at a time
+CUBE_LOCK_ID = 7072
+
+DIMENSIONS = ('month', 'country', 'gender', 'age', 'risk')
+MEASURES = ('customers', 'churners', 'orders', 'revenue', 'units')
+KEY_COLUMNS = 'month, country, gender, age, risk_pct'
+
+# Bands of churn_segmentation and sales_by_age
+DEFAULT_RISK_THRESHOLDS = (0.3, 0.7)
+RISK_SEGMENTS = ('Low Risk', 'Medium Risk', 'High Risk')
+DEFAULT_AGE_BINS = (18, 26, 36, 46, 61)
+
+# Band index of customers not scored yet, and of unknown ages
+UNKNOWN_BAND = -1
+
+# The cells of the customers with dated orders (or of those in %(customer_ids)s).
+# risk_pct is -1 for customers without a stored score, age -1 when unknown.
+CELLS_SQL = """
+    WITH last_purchase AS (
+        SELECT customer_id, date_trunc('month', MAX(last_purchase_date))::date AS month
+        FROM orders
+        WHERE last_purchase_date IS NOT NULL {where}
+        GROUP BY customer_id
+    ), customer_orders AS (
+        SELECT o.customer_id, date_trunc('month', o.last_purchase_date)::date AS month,
+               COUNT(*) AS orders,
+               COALESCE(SUM(o.unit_price * o.quantity), 0) AS revenue,
+               COALESCE(SUM(o.quantity), 0) AS units
+        FROM orders o
+        WHERE o.last_purchase_date IS NOT NULL {where}
+        GROUP BY o.customer_id, date_trunc('month', o.last_purchase_date)
+    )
+    SELECT co.customer_id, co.month,
+           COALESCE(c.country, 'Unknown') AS country,
+           COALESCE(c.gender, 'Unknown') AS gender,
+           COALESCE(c.age, -1) AS age,
+           COALESCE(floor(s.churn_probability * 100 + 0.0001)::smallint, -1) AS risk_pct,
+           (co.month = l.month)::int AS customers,
+           CASE WHEN co.month = l.month THEN COALESCE(s.predicted_churn, 0) ELSE 0 END AS churners,
+           co.orders, co.revenue, co.units
+    FROM customer_orders co
+    JOIN customers c ON c.customer_id = co.customer_id
+    JOIN last_purchase l ON l.customer_id = co.customer_id
+    LEFT JOIN customer_churn s ON s.customer_id = co.customer_id
+"""
+
+# Per-cell sums of a set of customer cells
+CELL_SUMS_SQL = f"""
+    SELECT {KEY_COLUMNS}, SUM(customers) AS customers, SUM(churners) AS churners,
+           SUM(orders) AS orders, SUM(revenue) AS revenue, SUM(units) AS units
+    FROM {{table}}
+    {{where}}
+    GROUP BY {KEY_COLUMNS}
+"""
+
+HAS_CELLS_SQL = "SELECT EXISTS (SELECT 1 FROM churn_cube);"
+
+def has_cells(conn):
+    """True once the cube has been built."""
+    with conn.cursor() as cursor:
+        cursor.execute(HAS_CELLS_SQL)
+        return cursor.fetchone()[0]
+
+def refresh(conn, customer_ids=None):
+    """
+    Recomputes the cells of the given customers and applies the change to
+    the cube, in one transaction; with no customers, rebuilds the whole
+    cube. Returns the number of customer cells written.
+    """
+    subset = customer_ids is not None
+    params = {'customer_ids': list(customer_ids)} if subset else None
+    where = "AND customer_id = ANY(%(customer_ids)s)" if subset else ""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s);", (CUBE_LOCK_ID,))
+        cursor.execute(f"CREATE TEMP TABLE new_cells ON COMMIT DROP AS {CELLS_SQL.format(where=where)};", params)
+
+        if subset:
+            # Take back the previous contribution of these customers
+            old_sums = CELL_SUMS_SQL.format(table="customer_cube_cells", where="WHERE customer_id = ANY(%(customer_ids)s)")
+            cursor.execute(f"CREATE TEMP TABLE old_sums ON COMMIT DROP AS {old_sums};", params)
+            cursor.execute("""
+                UPDATE churn_cube k
+                SET customers = k.customers - old.customers,
+                    churners = k.churners - old.churners,
+                    orders = k.orders - old.orders,
+                    revenue = k.revenue - old.revenue,
+                    units = k.units - old.units
+                FROM old_sums old
+                WHERE (k.month, k.country, k.gender, k.age, k.risk_pct)
+                    = (old.month, old.country, old.gender, old.age, old.risk_pct);
+            """)
+            cursor.execute("DELETE FROM customer_cube_cells WHERE customer_id = ANY(%(customer_ids)s);", params)
+        else:
+            cursor.execute("TRUNCATE churn_cube, customer_cube_cells;")
+
+        cursor.execute(f"""
+            INSERT INTO churn_cube ({KEY_COLUMNS}, customers, churners, orders, revenue, units)
+            {CELL_SUMS_SQL.format(table="new_cells", where="")}
+            ON CONFLICT ({KEY_COLUMNS}) DO UPDATE SET
+                customers = churn_cube.customers + EXCLUDED.customers,
+                churners = churn_cube.churners + EXCLUDED.churners,
+                orders = churn_cube.orders + EXCLUDED.orders,
+                revenue = churn_cube.revenue + EXCLUDED.revenue,
+                units = churn_cube.units + EXCLUDED.units;
+        """)
+        if subset:
+            # Every cell with a contribution has orders; drop the emptied ones
+            cursor.execute("""
+                DELETE FROM churn_cube k USING old_sums old
+                WHERE k.orders <= 0 AND (k.month, k.country, k.gender, k.age, k.risk_pct)
+                    = (old.month, old.country, old.gender, old.age, old.risk_pct);
+            """)
+        cursor.execute(f"""
+            INSERT INTO customer_cube_cells (customer_id, {KEY_COLUMNS}, customers, churners, orders, revenue, units)
+            SELECT customer_id, {KEY_COLUMNS}, customers, churners, orders, revenue, units FROM new_cells;
+        """)
+        count = cursor.rowcount
+        if not subset:
+            cursor.execute("ANALYZE churn_cube;")
+    conn.commit()
+    return count
+
+def risk_bands(thresholds):
+    """The bands the thresholds cut churn probability [0, 1] into."""
+    edges = [0.0] + list(thresholds) + [1.0]
+    names = RISK_SEGMENTS if len(thresholds) == 2 else [f"{low:.2f}-{high:.2f}" for low, high in zip(edges, edges[1:])]
+    return [{'band': name, 'from': low, 'to': high} for name, low, high in zip(names, edges, edges[1:])]
+
+def age_bands(bins):
+    """The bands the lower bounds in `bins` cut ages into, from under the first to the last and over."""
+    bands = [{'band': f"<{bins[0]}", 'from': None, 'to': bins[0] - 1}]
+    bands += [{'band': f"{low}-{high - 1}", 'from': low, 'to': high - 1} for low, high in zip(bins, bins[1:])]
+    bands.append({'band': f"{bins[-1]}+", 'from': bins[-1], 'to': None})
+    return bands
+
+def parse_list(value, cast=str):
+    return [cast(item.strip()) for item in value.split(',') if item.strip()]
+
+def read_slice_params(args):
+    """
+    Reads a slice of the cube from query arguments: `by` (dimensions to
+    group by), `risk_thresholds`, `age_bins`, and the filters `country`,
+    `gender`, `age` and `risk` (comma-separated values or band names) and
+    `from`/`to` (YYYY-MM). Returns (params, error).
+    """
+    dimensions = parse_list(args.get('by', ''))
+    unknown = [dimension for dimension in dimensions if dimension not in DIMENSIONS]
+    if unknown:
+        return None, f"Unknown dimension(s): {', '.join(unknown)}. Use {', '.join(DIMENSIONS)}."
+
+    try:
+        thresholds = [round(value, 2) for value in parse_list(args.get('risk_thresholds', ''), float)]
+    except ValueError:
+        return None, "risk_thresholds must be comma-separated numbers."
+    thresholds = thresholds or list(DEFAULT_RISK_THRESHOLDS)
+    if any(not 0 < value < 1 for value in thresholds) or thresholds != sorted(set(thresholds)):
+        return None, "risk_thresholds must be increasing and between 0 and 1 (exclusive)."
+
+    try:
+        bins = parse_list(args.get('age_bins', ''), int) or list(DEFAULT_AGE_BINS)
+    except ValueError:
+        return None, "age_bins must be comma-separated whole ages."
+    if bins != sorted(set(bins)) or bins[0] < 0:
+        return None, "age_bins must be increasing, non-negative ages."
+
+    filters = {}
+    for name in ('country', 'gender'):
+        if args.get(name):
+            filters[name] = parse_list(args.get(name))
+    for name, bands in (('risk', risk_bands(thresholds)), ('age', age_bands(bins))):
+        if args.get(name):
+            labels = [band['band'] for band in bands] + ['Unknown']
+            wanted = parse_list(args.get(name))
+            unknown = [label for label in wanted if label not in labels]
+            if unknown:
+                return None, f"Unknown {name} band(s): {', '.join(unknown)}. Use {', '.join(labels)}."
+            filters[name] = [UNKNOWN_BAND if label == 'Unknown' else labels.index(label) for label in wanted]
+    for name in ('from', 'to'):
+        if args.get(name):
+            try:
+                year, month = (int(part) for part in args.get(name).split('-'))
+                filters[name] = f"{year:04d}-{month:02d}-01"
+            except ValueError:
+                return None, f"'{name}' must be a month (YYYY-MM)."
+    return {'dimensions': dimensions, 'filters': filters, 'risk_thresholds': thresholds, 'age_bins': bins}, None
+
+def slice_cube(conn, dimensions, filters, risk_thresholds, age_bins):
+    """
+    Sums the cube's measures per combination of `dimensions` over the cells
+    that pass `filters`, with churn risk and age grouped into the given bands.
+    """
+    params = {
+        'risk_bins': [int(round(threshold * 100)) for threshold in risk_thresholds],
+        'age_bins': age_bins,
+    }
+    expressions = {
+        'month': "to_char(month, 'YYYY-MM')",
+        'country': "country",
+        'gender': "gender",
+        'age': f"CASE WHEN age < 0 THEN {UNKNOWN_BAND} ELSE width_bucket(age, %(age_bins)s::int[]) END",
+        'risk': f"CASE WHEN risk_pct < 0 THEN {UNKNOWN_BAND} ELSE width_bucket(risk_pct, %(risk_bins)s::int[]) END",
+    }
+    conditions = []
+    for name in ('country', 'gender', 'age', 'risk'):
+        if name in filters:
+            conditions.append(f"{expressions[name]} = ANY(%({name})s)")
+            params[name] = filters[name]
+    if 'from' in filters:
+        conditions.append("month >= %(from)s::date")
+        params['from'] = filters['from']
+    if 'to' in filters:
+        conditions.append("month <= %(to)s::date")
+        params['to'] = filters['to']
+
+    selected = [f"{expressions[dimension]} AS {dimension}" for dimension in dimensions]
+    selected += [f"COALESCE(SUM({measure}), 0) AS {measure}" for measure in MEASURES]
+    sql_query = f"SELECT {', '.join(selected)} FROM churn_cube"
+    if conditions:
+        sql_query += " WHERE " + " AND ".join(conditions)
+    if dimensions:
+        ordinals = ', '.join(str(i + 1) for i in range(len(dimensions)))
+        sql_query += f" GROUP BY {ordinals} ORDER BY {ordinals}"
+    with conn.cursor() as cursor:
+        cursor.execute(sql_query, params)
+        rows = cursor.fetchall()
+
+    labels = {
+        'risk': [band['band'] for band in risk_bands(risk_thresholds)],
+        'age': [band['band'] for band in age_bands(age_bins)],
+    }
+    cells = []
+    for row in rows:
+        cell = {}
+        for dimension, value in zip(dimensions, row):
+            if dimension in labels:
+                value = 'Unknown' if value == UNKNOWN_BAND else labels[dimension][value]
+            cell[dimension] = value
+        cell.update(measures(dict(zip(MEASURES, row[len(dimensions):]))))
+        cells.append(cell)
+
+    totals = {measure: sum(cell[measure] for cell in cells) for measure in MEASURES}
+    return {
+        'dimensions': dimensions,
+        'risk_bands': risk_bands(risk_thresholds),
+        'age_bands': age_bands(age_bins),
+        'cells': cells,
+        'totals': measures(totals),
+    }
+
+def measures(sums):
+    customers = int(sums['customers'])
+    churners = int(sums['churners'])
+    return {
+        'customers': customers,
+        'churners': churners,
+        'churn_rate': churners / customers * 100 if customers else 0.0,
+        'orders': int(sums['orders']),
+        'revenue': float(sums['revenue']),
+        'units': int(sums['units']),
+    }
+
+# --- Main Execution Block ---
+if __name__ == '__main__':
+    conn = psycopg2.connect(database=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT)
+    try:
+        count = refresh(conn)
+        print(f"Success: Churn cube rebuilt from {count} customer cells.")
+    finally:
+        conn.close()
@@ -0,0 +1,144 @@
+"""
+Per-feature explanations of the churn forest's probabilities.
+
+Tree-path attribution: walking a customer down a tree, every split moves
+the node's churn fraction from the parent's value to the child's; that
+change is credited to the split feature. The forest's probability is then
+exactly the mean root value (the base value) plus the sum of the feature
+contributions.
+
+The change of every node of every tree is computed once per model into a
+sparse (nodes x features) matrix. A batch is explained with one
+forest.decision_path call (all trees, all customers) and one sparse
+product, with no Python loop over trees or customers.
+
+Explanations are cached per model version and customer, tagged with the
+data version they were computed at. The first lookup or store at a newer
+data version clears the cache, so every worker drops its explanations once
+it sees an upload, whichever worker handled it.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+DEFAULT_MAX_ENTRIES = 100000
+
+class ForestExplainer:
+    """Tree-path attribution for a fitted RandomForestClassifier."""
+
+    def __init__(self, forest, feature_names, positive_class=1):
+        # Imported here: scipy is slow to import and only needed once a model is loaded
+        from scipy import sparse
+        self.forest = forest
+        self.feature_names = list(feature_names)
+        positive = list(forest.classes_).index(positive_class)
+
+        rows, cols, data = [], [], []
+        base_value, offset = 0.0, 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            # Class weights per node; normalised, as predict_proba does at the leaves
+            values = tree.value[:, 0, :]
+            fraction = values[:, positive] / values.sum(axis=1)
+
+            parents = np.full(tree.node_count, -1)
+            internal = np.flatnonzero(tree.children_left >= 0)
+            parents[tree.children_left[internal]] = internal
+            parents[tree.children_right[internal]] = internal
+            children = np.flatnonzero(parents >= 0)
+
+            rows.append(offset + children)
+            cols.append(tree.feature[parents[children]])
+            data.append(fraction[children] - fraction[parents[children]])
+            base_value += fraction[0]
+            offset += tree.node_count
+
+        n_trees = len(forest.estimators_)
+        self.base_value = base_value / n_trees
+        self.node_contributions = sparse.csr_matrix(
+            (np.concatenate(data) / n_trees, (np.concatenate(rows), np.concatenate(cols))),
+            shape=(offset, len(self.feature_names))
+        )
+
+    def contributions(self, model_input):
+        """(customers x features) contributions; each row sums to probability - base_value."""
+        indicator, _ = self.forest.decision_path(model_input)
+        return np.asarray((indicator @ self.node_contributions).todense())
+
+class ExplanationCache:
+    """LRU of explanations keyed by (model version, customer id), for one data version."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        # Newest data version seen; every entry was computed at it
+        self.data_version = None
+        self.counts = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def _observe(self, data_version):
+        """Clears the cache once a newer data version is seen. Caller holds the lock."""
+        if self.data_version is None or data_version > self.data_version:
+            self.counts['invalidations'] += len(self.entries)
+            self.entries.clear()
+            self.data_version = data_version
+
+    def get(self, model_version, customer_id, data_version):
+        """The explanation computed at the current `data_version`, or None."""
+        with self.lock:
+            if data_version is not None:
+                self._observe(data_version)
+                key = (model_version, customer_id)
+                entry = self.entries.get(key)
+                if entry is not None and entry[0] >= data_version:
+                    self.entries.move_to_end(key)
+                    self.counts['hits'] += 1
+                    return entry[1]
+            self.counts['misses'] += 1
+            return None
+
+    def put(self, model_version, customer_id, data_version, explanation):
+        """Stores an explanation computed from data read at `data_version`, unless newer data has been seen."""
+        if self.max_entries <= 0 or data_version is None:
+            return
+        with self.lock:
+            self._observe(data_version)
+            if data_version < self.data_version:
+                return
+            key = (model_version, customer_id)
+            self.entries[key] = (data_version, explanation)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counts['evictions'] += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counts['hits'] + self.counts['misses']
+            return dict(
+                self.counts,
+                hit_rate=round(self.counts['hits'] / lookups, 4) if lookups else None,
+                entries=len(self.entries),
+                data_version=self.data_version,
+                max_entries=self.max_entries,
+            )
+
+explainers = {}
+explainers_lock = threading.Lock()
+
+def explainer_for(model):
+    """The ForestExplainer of a loaded model package, built once per version."""
+    with explainers_lock:
+        explainer = explainers.get(model['version'])
+        if explainer is None:
+            explainer = ForestExplainer(model['model'], model['model_columns'])
+            # Keep the active version and the one it may be rolled back to
+            for version in list(explainers)[:-1]:
+                del explainers[version]
+            explainers[model['version']] = explainer
+        return explainer
+
+def from_environment():
+    return ExplanationCache(int(os.environ.get('EXPLANATION_CACHE_ENTRIES', DEFAULT_MAX_ENTRIES)))
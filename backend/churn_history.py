@@ -0,0 +1,111 @@
+"""
+Persisted monthly churn history.
+
+Stores the latest churn score of every customer (customer_churn) and the
+number of predicted churners per month of last purchase and country
+(churn_history), so the churn trend is read from a few dozen rows instead
+of rescoring every customer. A backfill scores everyone once; after that,
+only rescored customers are applied, as deltas.
+
+Run a full backfill (e.g. after retraining the model) with:
+    python churn_history.py
+"""
+
+from psycopg2 import extras
+
+# Arbitrary key so backfills and incremental updates apply one at a time
+HISTORY_LOCK_ID = 7071
+
+# Months in [%(start)s, %(end)s]; either bound may be NULL
+CHURN_HISTORY_SQL = """
+    SELECT month, country, churn_count, customer_count
+    FROM churn_history
+    WHERE (%(start)s::date IS NULL OR month >= %(start)s::date)
+      AND (%(end)s::date IS NULL OR month <= %(end)s::date)
+    ORDER BY month, country
+"""
+
+HAS_SCORES_SQL = "SELECT EXISTS (SELECT 1 FROM customer_churn);"
+
+# Per (month, country) counts of a set of customer_churn rows
+COUNTS_SQL = """
+    SELECT month, COALESCE(country, 'Unknown') AS country,
+           SUM(predicted_churn) AS churn_count, COUNT(*) AS customer_count
+    FROM {table}
+    WHERE month IS NOT NULL {where}
+    GROUP BY month, COALESCE(country, 'Unknown')
+"""
+
+def has_scores(conn):
+    """True once a backfill has scored the customers."""
+    with conn.cursor() as cursor:
+        cursor.execute(HAS_SCORES_SQL)
+        return cursor.fetchone()[0]
+
+def record_scores(conn, rows, replace_all=False, removed=()):
+    """
+    Stores churn scores and applies their change to churn_history, in one
+    transaction. `rows` are (customer_id, country, month, churn_probability,
+    predicted_churn) tuples, month being the first day of the month of the
+    customer's last purchase (or None). `removed` are customers no longer
+    scored (left without orders), whose scores are dropped. With
+    replace_all=True the stored scores and history are rebuilt from `rows`
+    alone.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s);", (HISTORY_LOCK_ID,))
+        cursor.execute("""
+            CREATE TEMP TABLE new_scores (
+                customer_id VARCHAR(50) PRIMARY KEY,
+                country VARCHAR(50),
+                month DATE,
+                churn_probability REAL,
+                predicted_churn SMALLINT
+            ) ON COMMIT DROP;
+        """)
+        extras.execute_values(cursor, "INSERT INTO new_scores VALUES %s", rows, page_size=10000)
+
+        if replace_all:
+            cursor.execute("TRUNCATE customer_churn, churn_history;")
+        else:
+            # Take back the previous contribution of the rescored and removed customers
+            old_counts = COUNTS_SQL.format(
+                table="customer_churn",
+                where="AND (customer_id IN (SELECT customer_id FROM new_scores) OR customer_id = ANY(%(removed)s))"
+            )
+            cursor.execute(f"""
+                UPDATE churn_history h
+                SET churn_count = h.churn_count - old.churn_count,
+                    customer_count = h.customer_count - old.customer_count
+                FROM ({old_counts}) old
+                WHERE h.month = old.month AND h.country = old.country;
+            """, {'removed': list(removed)})
+            cursor.execute("DELETE FROM customer_churn WHERE customer_id = ANY(%s);", (list(removed),))
+
+        new_counts = COUNTS_SQL.format(table="new_scores", where="")
+        cursor.execute(f"""
+            INSERT INTO churn_history (month, country, churn_count, customer_count)
+            {new_counts}
+            ON CONFLICT (month, country) DO UPDATE SET
+                churn_count = churn_history.churn_count + EXCLUDED.churn_count,
+                customer_count = churn_history.customer_count + EXCLUDED.customer_count;
+        """)
+        cursor.execute("DELETE FROM churn_history WHERE customer_count <= 0;")
+        cursor.execute("""
+            INSERT INTO customer_churn (customer_id, country, month, churn_probability, predicted_churn)
+            SELECT customer_id, country, month, churn_probability, predicted_churn FROM new_scores
+            ON CONFLICT (customer_id) DO UPDATE SET
+                country = EXCLUDED.country,
+                month = EXCLUDED.month,
+                churn_probability = EXCLUDED.churn_probability,
+                predicted_churn = EXCLUDED.predicted_churn,
+                scored_at = NOW();
+        """)
+    conn.commit()
+
+# --- Main Execution Block ---
+if __name__ == '__main__':
+    # Scores with the serving model and feature pipeline
+    import app
+    count = app.refresh_churn_history()
+    print(f"Success: Churn history rebuilt from {count} customers.")
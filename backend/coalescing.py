@@ -0,0 +1,113 @@
+"""
+Single-flight request coalescing.
+
+When identical requests arrive while one is already being computed, they
+wait for that computation and share its result (or its error) instead of
+each running the same queries and model pass. Requests are identical when
+their key matches: the sections asked for, their normalized parameters and
+the data and model versions they would be computed from, so a request made
+after an upload never receives a result computed before it.
+
+Nothing is kept once a computation finishes; only concurrent requests are
+coalesced.
+"""
+
+import asyncio
+import threading
+
+def request_key(requests, data_version, model_version):
+    """Key of a {section: params} request: order-independent, with the versions it depends on."""
+    return (
+        tuple(sorted((section, tuple(sorted(params.items()))) for section, params in requests.items())),
+        data_version,
+        model_version,
+    )
+
+def endpoint_label(requests):
+    """Counter label of a request: its section, or the sorted sections of a bundle."""
+    return ','.join(sorted(requests))
+
+class FlightCounters:
+    """Executed and coalesced request counts, overall and per endpoint."""
+
+    def __init__(self):
+        self.counter_lock = threading.Lock()
+        self.counts = {}
+
+    def count(self, label, outcome):
+        with self.counter_lock:
+            counts = self.counts.setdefault(label, {'executed': 0, 'coalesced': 0})
+            counts[outcome] += 1
+
+    def stats(self):
+        with self.counter_lock:
+            endpoints = {label: dict(counts) for label, counts in self.counts.items()}
+        executed = sum(counts['executed'] for counts in endpoints.values())
+        coalesced = sum(counts['coalesced'] for counts in endpoints.values())
+        return {
+            'executed': executed,
+            'coalesced': coalesced,
+            'coalesced_share': round(coalesced / (executed + coalesced), 4) if executed + coalesced else None,
+            'endpoints': endpoints,
+        }
+
+class Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight(FlightCounters):
+    """Coalesces identical concurrent calls across threads (the Flask app)."""
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, label, function):
+        """Returns function(), or the result of the identical call already in flight."""
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Call()
+        self.count(label, 'executed' if leader else 'coalesced')
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+class AsyncSingleFlight(FlightCounters):
+    """Coalesces identical concurrent calls on one event loop (async_app.py)."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = {}
+
+    async def do(self, key, label, function):
+        """Returns await function(), or the result of the identical call already in flight."""
+        future = self.calls.get(key)
+        if future is not None:
+            self.count(label, 'coalesced')
+            # Shielded, so a waiter that disconnects doesn't cancel the shared computation
+            return await asyncio.shield(future)
+
+        self.count(label, 'executed')
+        future = asyncio.ensure_future(function())
+        self.calls[key] = future
+        future.add_done_callback(lambda _: self.calls.pop(key, None))
+        return await asyncio.shield(future)
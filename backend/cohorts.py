@@ -0,0 +1,251 @@
+"""
+Signup-cohort retention.
+
+Customers are grouped into cohorts by month of signup. A cohort's
+retention N months after signup is the share of its customers who placed
+an order in that month (N = 0 is the signup month itself).
+
+The active customers are stored as one compact array per cohort, country
+and product category (table cohort_activity): active[N + 1] is the number
+of the cohort's customers of that country who ordered in that category N
+months after signup. Category '*' counts orders in any category, since a
+customer active in two categories is one active customer. Cohort sizes
+per country are in cohort_sizes. Countries add up; categories do not, so
+a slice covers any set of countries and one category (or all).
+
+The counts are computed set-based in SQL (COUNT DISTINCT over GROUPING
+SETS), never customer by customer. After an upload only the calendar
+months from the uploaded customers' earliest order onwards (or from the
+earliest month an updated order was in before, if that is earlier) are
+counted again, and the arrays are extended to the newest month. A change of a
+product's category is picked up by a full rebuild.
+
+Rebuild it with:
+    python cohorts.py
+"""
+
+import numpy as np
+import psycopg2
+
+# --- Database Connection Details ---
+DB_NAME = "hackathon"
+DB_USER = "postgres"
+DB_PASS = "Post@7070" # <-- IMPORTANT: Change this
+DB_HOST = "localhost"
+DB_PORT = "5432"
+
+# Arbitrary key so rebuilds and incremental refreshes apply one at a time
+COHORT_LOCK_ID = 7073
+
+ALL_CATEGORIES = '*'
+
+def months_between(start, end):
+    """SQL for the whole months from the month of `start` to the month of `end`."""
+    return (f"((date_part('year', {end}) - date_part('year', {start})) * 12"
+            f" + date_part('month', {end}) - date_part('month', {start}))::int")
+
+# Last month with orders, and the last month the stored arrays reach
+LAST_ORDER_MONTH_SQL = "SELECT date_trunc('month', MAX(last_purchase_date))::date FROM orders;"
+STORED_LAST_MONTH_SQL = """
+    SELECT MAX(cohort + make_interval(months => cardinality(active) - 1))::date FROM cohort_activity;
+"""
+EARLIEST_ORDER_MONTH_SQL = """
+    SELECT date_trunc('month', MIN(last_purchase_date))::date FROM orders WHERE customer_id = ANY(%(customer_ids)s);
+"""
+
+SIZES_STATEMENTS = [
+    "TRUNCATE cohort_sizes;",
+    """
+    INSERT INTO cohort_sizes (cohort, country, customers)
+    SELECT date_trunc('month', signup_date)::date, COALESCE(country, 'Unknown'), COUNT(*)
+    FROM customers
+    WHERE signup_date IS NOT NULL
+    GROUP BY 1, 2;
+    """,
+]
+
+# Active customers per cohort, country, category ('*' for any) and months
+# since signup, counting only orders from %(since)s on (all if NULL)
+ACTIVITY_SQL = f"""
+    SELECT cohort, country,
+           CASE WHEN GROUPING(category) = 1 THEN '{ALL_CATEGORIES}' ELSE category END AS category,
+           month_offset, COUNT(DISTINCT customer_id) AS active
+    FROM (
+        SELECT date_trunc('month', c.signup_date)::date AS cohort,
+               COALESCE(c.country, 'Unknown') AS country,
+               COALESCE(p.category, 'Unknown') AS category,
+               {months_between('c.signup_date', 'o.last_purchase_date')} AS month_offset,
+               o.customer_id
+        FROM orders o
+        JOIN customers c ON c.customer_id = o.customer_id
+        LEFT JOIN products p ON p.product_id = o.product_id
+        WHERE c.signup_date IS NOT NULL
+          AND o.last_purchase_date >= date_trunc('month', c.signup_date)
+          AND (%(since)s::date IS NULL OR o.last_purchase_date >= %(since)s::date)
+    ) activity
+    GROUP BY GROUPING SETS ((cohort, country, category, month_offset), (cohort, country, month_offset))
+"""
+
+# Every array, up to %(last)s: the new counts from %(since)s on, the stored ones before.
+# Cohorts left without customers (all moved to another) are dropped.
+MERGE_SQL = f"""
+    WITH keys AS (
+        SELECT k.cohort, k.country, k.category
+        FROM (
+            SELECT cohort, country, category FROM cohort_activity
+            UNION
+            SELECT cohort, country, category FROM new_activity
+        ) k
+        JOIN cohort_sizes s ON (s.cohort, s.country) = (k.cohort, k.country)
+    )
+    SELECT k.cohort, k.country, k.category,
+           array_agg(
+               CASE WHEN %(since)s::date IS NOT NULL AND k.cohort + make_interval(months => g.i) < %(since)s::date
+                    THEN COALESCE(a.active[g.i + 1], 0)
+                    ELSE COALESCE(n.active, 0) END
+               ORDER BY g.i
+           ) AS active
+    FROM keys k
+    LEFT JOIN cohort_activity a ON (a.cohort, a.country, a.category) = (k.cohort, k.country, k.category)
+    CROSS JOIN LATERAL generate_series(0, {months_between('k.cohort', '%(last)s::date')}) g(i)
+    LEFT JOIN new_activity n
+        ON (n.cohort, n.country, n.category, n.month_offset) = (k.cohort, k.country, k.category, g.i)
+    GROUP BY k.cohort, k.country, k.category
+"""
+
+HAS_ACTIVITY_SQL = "SELECT EXISTS (SELECT 1 FROM cohort_activity);"
+
+def has_activity(conn):
+    """True once the cohort arrays have been built."""
+    with conn.cursor() as cursor:
+        cursor.execute(HAS_ACTIVITY_SQL)
+        return cursor.fetchone()[0]
+
+def refresh(conn, customer_ids=None, previous_month=None):
+    """
+    Brings the cohort arrays up to date, in one transaction. With customer
+    ids (the customers of an upload), only the months from their earliest
+    order onwards, and the last stored month, are counted again; otherwise
+    everything is rebuilt. `previous_month` is the earliest month the
+    upload moved orders out of (upsert_chunks' previous_earliest_month),
+    counted again too. Returns the first month counted (None for all).
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s);", (COHORT_LOCK_ID,))
+        cursor.execute(LAST_ORDER_MONTH_SQL)
+        last = cursor.fetchone()[0]
+        since = None
+        if customer_ids is not None:
+            cursor.execute(STORED_LAST_MONTH_SQL)
+            stored_last = cursor.fetchone()[0]
+            cursor.execute(EARLIEST_ORDER_MONTH_SQL, {'customer_ids': list(customer_ids)})
+            earliest = cursor.fetchone()[0]
+            if stored_last is not None:
+                since = min(month for month in (earliest, stored_last, previous_month) if month is not None)
+
+        for statement in SIZES_STATEMENTS:
+            cursor.execute(statement)
+        if last is None:
+            cursor.execute("TRUNCATE cohort_activity;")
+        else:
+            params = {'since': since, 'last': last}
+            cursor.execute(f"CREATE TEMP TABLE new_activity ON COMMIT DROP AS {ACTIVITY_SQL};", params)
+            cursor.execute(f"CREATE TEMP TABLE merged_activity ON COMMIT DROP AS {MERGE_SQL};", params)
+            cursor.execute("TRUNCATE cohort_activity;")
+            cursor.execute("""
+                INSERT INTO cohort_activity (cohort, country, category, active)
+                SELECT cohort, country, category, active FROM merged_activity;
+            """)
+    conn.commit()
+    return since
+
+# Summed arrays of a slice, one row per cohort and months since signup
+SLICE_ACTIVITY_SQL = """
+    SELECT a.cohort, t.i - 1 AS month_offset, SUM(t.active) AS active
+    FROM cohort_activity a
+    CROSS JOIN LATERAL unnest(a.active) WITH ORDINALITY t(active, i)
+    WHERE a.category = %(category)s
+      AND (%(countries)s::text[] IS NULL OR a.country = ANY(%(countries)s))
+      AND (%(start)s::date IS NULL OR a.cohort >= %(start)s::date)
+      AND (%(end)s::date IS NULL OR a.cohort <= %(end)s::date)
+    GROUP BY 1, 2
+"""
+
+SLICE_SIZES_SQL = """
+    SELECT cohort, SUM(customers) AS customers
+    FROM cohort_sizes
+    WHERE (%(countries)s::text[] IS NULL OR country = ANY(%(countries)s))
+      AND (%(start)s::date IS NULL OR cohort >= %(start)s::date)
+      AND (%(end)s::date IS NULL OR cohort <= %(end)s::date)
+    GROUP BY 1
+    ORDER BY 1
+"""
+
+def month_index(dates):
+    return np.array(dates, dtype='datetime64[M]').astype(np.int64)
+
+def retention_matrix(conn, countries=None, category=None, start=None, end=None, months=None):
+    """
+    The cohort x months-since-signup matrix of a slice: active customers,
+    cohort sizes and retention (None where the month has not happened yet),
+    plus the size-weighted average curve over the cohorts observed.
+    """
+    params = {
+        'countries': list(countries) if countries else None,
+        'category': category or ALL_CATEGORIES,
+        'start': start,
+        'end': end,
+    }
+    with conn.cursor() as cursor:
+        cursor.execute(SLICE_SIZES_SQL, params)
+        sizes_rows = cursor.fetchall()
+        cursor.execute(SLICE_ACTIVITY_SQL, params)
+        activity_rows = cursor.fetchall()
+        cursor.execute(STORED_LAST_MONTH_SQL)
+        last = cursor.fetchone()[0]
+
+    cohorts = [row[0] for row in sizes_rows]
+    if not cohorts or last is None:
+        return {'cohorts': [], 'sizes': [], 'months_since_signup': [], 'active': [], 'retention': [], 'average': []}
+    sizes = np.array([row[1] for row in sizes_rows], dtype=np.int64)
+    cohort_months = month_index(cohorts)
+    observed_offsets = month_index([last])[0] - cohort_months
+    width = int(max(observed_offsets.max(), 0)) + 1
+    if months is not None:
+        width = min(width, months + 1)
+
+    active = np.zeros((len(cohorts), width), dtype=np.int64)
+    if activity_rows:
+        row_cohorts, offsets, counts = (np.array(column) for column in zip(*activity_rows))
+        rows = np.searchsorted(cohort_months, month_index(list(row_cohorts)))
+        offsets = offsets.astype(np.int64)
+        keep = offsets < width
+        active[rows[keep], offsets[keep]] = counts[keep].astype(np.int64)
+
+    observed = np.arange(width)[None, :] <= observed_offsets[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        retention = np.where(observed & (sizes[:, None] > 0), active / sizes[:, None], np.nan)
+        observed_sizes = (observed * sizes[:, None]).sum(axis=0)
+        average = np.where(observed_sizes > 0, (active * observed).sum(axis=0) / observed_sizes, np.nan)
+
+    def values(array):
+        return [None if np.isnan(value) else round(float(value), 4) for value in array]
+
+    return {
+        'cohorts': [str(month) for month in cohort_months.astype('datetime64[M]')],
+        'sizes': sizes.tolist(),
+        'months_since_signup': list(range(width)),
+        'active': [[int(count) if seen else None for count, seen in zip(row, seen_row)]
+                   for row, seen_row in zip(active, observed)],
+        'retention': [values(row) for row in retention],
+        'average': values(average),
+    }
+
+# --- Main Execution Block ---
+if __name__ == '__main__':
+    conn = psycopg2.connect(database=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT)
+    try:
+        refresh(conn)
+        print("Success: Cohort retention rebuilt.")
+    finally:
+        conn.close()
@@ -0,0 +1,117 @@
+"""
+Typed columnar fetch of query results.
+
+pd.read_sql builds a Python object per value through psycopg2 (Decimal,
+datetime.date, str) and pandas then converts those again. Instead, the
+query is streamed out of PostgreSQL with COPY ... TO STDOUT (FORMAT csv)
+and parsed by pandas' C reader straight into typed columns: numeric as
+float64, dates as datetime64, chosen text columns as categoricals.
+Integer columns come back as int64 (float64 if they hold NULLs), just as
+with pd.read_sql.
+"""
+
+import io
+import os
+import threading
+import pandas as pd
+
+# PostgreSQL type OIDs
+NUMERIC_TYPES = {700, 701, 1700}          # real, double precision, numeric
+DATE_TYPES = {1082, 1114, 1184}           # date, timestamp, timestamptz
+TEXT_TYPES = {25, 1042, 1043}             # text, char, varchar
+
+column_types_cache = {}
+cache_lock = threading.Lock()
+
+def copy_sql(sql_query):
+    """Wraps a SELECT in a CSV COPY statement."""
+    return f"COPY ({sql_query.strip().rstrip(';')}) TO STDOUT WITH (FORMAT csv, HEADER true)"
+
+def cached_types(sql_query):
+    with cache_lock:
+        return column_types_cache.get(sql_query)
+
+def cache_types(sql_query, types):
+    with cache_lock:
+        column_types_cache[sql_query] = types
+
+def column_types(conn, sql_query, bound_query):
+    """
+    Returns [(name, type_oid)] of the query's result columns. Cached per
+    query text, since parameter values don't change the result types.
+    """
+    types = cached_types(sql_query)
+    if types is None:
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT * FROM ({bound_query.strip().rstrip(';')}) q LIMIT 0")
+            types = [(column.name, column.type_code) for column in cursor.description]
+        cache_types(sql_query, types)
+    return types
+
+def none_for_missing(series):
+    """The values as objects with NULLs as None, as pd.read_sql returns them (null in JSON, not NaN)."""
+    return series.astype(object).where(series.notna(), None)
+
+def read_csv_typed(stream, types, categorical=()):
+    """Parses COPY CSV output into a DataFrame with the dtypes of the given columns."""
+    dtypes, date_columns = {}, []
+    for name, type_oid in types:
+        if type_oid in NUMERIC_TYPES:
+            dtypes[name] = 'float64'
+        elif type_oid in DATE_TYPES:
+            date_columns.append(name)
+        elif type_oid in TEXT_TYPES:
+            dtypes[name] = 'category' if name in categorical else 'object'
+    df = pd.read_csv(stream, dtype=dtypes, keep_default_na=False, na_values=[''], float_precision='round_trip')
+    for name in date_columns:
+        df[name] = pd.to_datetime(df[name], errors='coerce')
+    # NULL text is None, as with pd.read_sql, so it serializes as null. A
+    # categorical can't hold None: it keeps NaN, and none_for_missing()
+    # converts it where the column leaves the DataFrame.
+    for name, dtype in dtypes.items():
+        if dtype == 'object' and df[name].hasnans:
+            df[name] = none_for_missing(df[name])
+    return df
+
+def read_sql_columnar(conn, sql_query, params=None, categorical=()):
+    """
+    Runs a query and returns a typed DataFrame, like pd.read_sql but
+    without per-value Python objects. Rows are parsed as they stream in.
+    """
+    with conn.cursor() as cursor:
+        bound_query = cursor.mogrify(sql_query, params).decode() if params else sql_query
+    types = column_types(conn, sql_query, bound_query)
+
+    read_fd, write_fd = os.pipe()
+    errors = []
+
+    def produce():
+        with os.fdopen(write_fd, 'wb') as writer:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.copy_expert(copy_sql(bound_query), writer)
+            except Exception as e:
+                errors.append(e)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    with os.fdopen(read_fd, 'rb') as reader:
+        try:
+            df = read_csv_typed(reader, types, categorical)
+        except Exception:
+            df = None
+            if not errors:
+                # Drain the rest so the producer can finish, then report the parse error
+                while reader.read(1 << 16):
+                    pass
+                producer.join()
+                if not errors:
+                    raise
+    producer.join()
+    if errors:
+        raise errors[0]
+    return df
+
+def read_copy_buffer(data, types, categorical=()):
+    """Parses COPY CSV bytes already in memory (the async fetch path)."""
+    return read_csv_typed(io.BytesIO(data), types, categorical)
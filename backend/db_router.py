@@ -0,0 +1,275 @@
+"""
+Read-replica routing.
+
+Connections for reads made while serving a read-only request (GET) go to
+one of the read replicas; everything else (uploads, the builds and
+refreshes that write derived tables, background work) goes to the
+primary. Replicas are balanced by fewest open connections, round-robin
+among equals. A request keeps the replica it was first given, so its
+data version and its queries agree, and reads from the primary once it
+has written there (a first request building a derived table).
+
+Reads after an upload must see it, so a replica is only used when its
+data version has reached the required one: the newest version this
+process wrote, or the one a client sends in the X-Data-Version header
+(uploads return it). A replica that is behind, or that cannot be reached,
+is skipped and the read falls back to the primary.
+
+Every statement run through a routed connection is timed per backend.
+
+Configure with the environment variables:
+    DB_REPLICAS              comma-separated host:port of the replicas
+                             (default none: everything on the primary)
+    REPLICA_RETRY_SECONDS    how long an unreachable replica is skipped (default 30)
+    REPLICA_RECHECK_SECONDS  how long a replica found behind is skipped before
+                             its version is checked again (default 1)
+"""
+
+import os
+import time
+import itertools
+import threading
+import contextvars
+import psycopg2
+import psycopg2.extensions
+from data_importer import get_data_version
+from profiling import LatencyStats
+
+DEFAULT_RETRY_SECONDS = 30
+DEFAULT_RECHECK_SECONDS = 1
+
+DATA_VERSION_HEADER = 'X-Data-Version'
+
+class Route:
+    """How the current request may read: from a replica or not, and the data version it needs."""
+
+    def __init__(self, read_only, min_version=None):
+        self.read_only = read_only
+        self.min_version = min_version
+        self.backend = None
+
+# The route of the request being served, if any
+current = contextvars.ContextVar('db_route', default=None)
+
+def propagate(function):
+    """Wraps work handed to another thread so its connections are routed like the submitting request's."""
+    route = current.get()
+    if route is None:
+        return function
+
+    def run(*args, **kwargs):
+        token = current.set(route)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            current.reset(token)
+    return run
+
+class Backend:
+    """A database server: its connection counts, known data version and statement latencies."""
+
+    def __init__(self, role, host, port):
+        self.role = role
+        self.host = host
+        self.port = str(port)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.open = 0
+        self.errors = 0
+        self.down_until = 0.0
+        self.data_version = None
+        self.behind_until = 0.0
+        self.latency = LatencyStats()
+
+    @property
+    def name(self):
+        return f"{self.role} {self.host}:{self.port}"
+
+    def opened(self):
+        with self.lock:
+            self.connections += 1
+            self.open += 1
+
+    def closed(self):
+        with self.lock:
+            self.open -= 1
+
+    def record(self, milliseconds):
+        with self.lock:
+            self.latency.add(milliseconds)
+
+    def stats(self):
+        with self.lock:
+            return dict(
+                self.latency.summary(),
+                backend=self.name,
+                role=self.role,
+                connections=self.connections,
+                open=self.open,
+                errors=self.errors,
+                data_version=self.data_version,
+                available=time.monotonic() >= self.down_until,
+            )
+
+class TimedCursor(psycopg2.extensions.cursor):
+    """Records how long each statement takes on the connection's backend."""
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            self.connection.backend.record((time.perf_counter() - start) * 1000)
+
+    def copy_expert(self, sql, file, size=8192):
+        start = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            self.connection.backend.record((time.perf_counter() - start) * 1000)
+
+class RoutedConnection(psycopg2.extensions.connection):
+    """A connection that knows its backend and tells it when it closes."""
+
+    backend = None
+
+    def close(self):
+        if not self.closed and self.backend is not None:
+            self.backend.closed()
+        super().close()
+
+class Router:
+    """Picks the backend of each new connection."""
+
+    def __init__(self, replicas=(), retry_seconds=DEFAULT_RETRY_SECONDS, recheck_seconds=DEFAULT_RECHECK_SECONDS):
+        self.replicas = [Backend('replica', host, port) for host, port in replicas]
+        self.retry_seconds = retry_seconds
+        self.recheck_seconds = recheck_seconds
+        self.primaries = {}
+        self.lock = threading.Lock()
+        self.turn = itertools.count()
+        self.written_version = None
+        self.routed = {'replica': 0, 'primary': 0, 'behind': 0, 'unavailable': 0}
+
+    def primary(self, host, port):
+        key = (host, str(port))
+        with self.lock:
+            if key not in self.primaries:
+                self.primaries[key] = Backend('primary', host, port)
+            return self.primaries[key]
+
+    def note_write(self, data_version):
+        """Remembers a data version written by this process, so later reads here wait for it."""
+        if data_version is None:
+            return
+        with self.lock:
+            if self.written_version is None or data_version > self.written_version:
+                self.written_version = data_version
+
+    def count(self, outcome):
+        with self.lock:
+            self.routed[outcome] += 1
+
+    def open(self, backend, params):
+        conn = psycopg2.connect(
+            connection_factory=RoutedConnection, cursor_factory=TimedCursor,
+            **dict(params, host=backend.host, port=backend.port)
+        )
+        conn.backend = backend
+        backend.opened()
+        return conn
+
+    def connect(self, params, write=False):
+        """
+        A connection for `params` (psycopg2.connect keyword arguments of the
+        primary). Reads of a read-only request get a replica that has the
+        data they need, if there is one; everything else gets the primary.
+        """
+        primary = self.primary(params['host'], params['port'])
+        route = current.get()
+        if write and route is not None:
+            # The request reads what it wrote from now on
+            route.backend = primary
+        if write or route is None or not route.read_only or not self.replicas:
+            return self.open(primary, params)
+        if route.backend is not None:
+            return self.open(route.backend, params)
+
+        required = max((version for version in (route.min_version, self.written_version) if version is not None),
+                       default=None)
+        conn = self.replica_connection(params, required)
+        if conn is None:
+            route.backend = primary
+            self.count('primary')
+            return self.open(primary, params)
+        route.backend = conn.backend
+        self.count('replica')
+        return conn
+
+    def replica_connection(self, params, required):
+        """A connection to the least busy replica that is up and has reached `required`, or None."""
+        now = time.monotonic()
+        candidates = [
+            backend for backend in self.replicas
+            if now >= backend.down_until and (required is None or now >= backend.behind_until)
+        ]
+        if not candidates:
+            return None
+        start = next(self.turn)
+        n = len(candidates)
+        order = sorted(range(n), key=lambda i: (candidates[i].open, (i - start) % n))
+        for backend in (candidates[i] for i in order):
+            try:
+                conn = self.open(backend, params)
+            except psycopg2.OperationalError:
+                with backend.lock:
+                    backend.errors += 1
+                    backend.down_until = time.monotonic() + self.retry_seconds
+                self.count('unavailable')
+                continue
+            # Versions only grow, so a replica known to have reached `required` still has
+            if required is not None and (backend.data_version is None or backend.data_version < required):
+                try:
+                    backend.data_version = get_data_version(conn)
+                    conn.rollback()
+                except psycopg2.Error:
+                    conn.close()
+                    with backend.lock:
+                        backend.errors += 1
+                    continue
+                if backend.data_version is None or backend.data_version < required:
+                    backend.behind_until = time.monotonic() + self.recheck_seconds
+                    conn.close()
+                    self.count('behind')
+                    continue
+            return conn
+        return None
+
+    def stats(self):
+        """Statement latencies and connection counts per backend, and where reads were routed."""
+        with self.lock:
+            backends = list(self.primaries.values()) + self.replicas
+            routed = dict(self.routed)
+            written_version = self.written_version
+        return {
+            'backends': [backend.stats() for backend in backends],
+            'read_requests': routed,
+            'written_version': written_version,
+        }
+
+def parse_replicas(value):
+    """'host:port,host:port' -> [(host, port), ...]; the port defaults to 5432."""
+    replicas = []
+    for item in value.split(','):
+        item = item.strip()
+        if item:
+            host, _, port = item.partition(':')
+            replicas.append((host, port or '5432'))
+    return replicas
+
+def from_environment():
+    return Router(
+        replicas=parse_replicas(os.environ.get('DB_REPLICAS', '')),
+        retry_seconds=float(os.environ.get('REPLICA_RETRY_SECONDS', DEFAULT_RETRY_SECONDS)),
+        recheck_seconds=float(os.environ.get('REPLICA_RECHECK_SECONDS', DEFAULT_RECHECK_SECONDS)),
+    )
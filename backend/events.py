@@ -0,0 +1,186 @@
+"""
+Publish/subscribe for Server-Sent Events.
+
+The upload path publishes events once; every open /api/events stream gets
+a copy, so dashboards are told about new data instead of polling for it.
+
+With a database to relay through (EventBroker.connect), an event is sent
+with Postgres NOTIFY and each API process delivers it to its own streams
+from a LISTEN connection, so every worker's clients get every event.
+Without one, or if the database cannot be reached, events stay in the
+process that published them.
+"""
+
+import json
+import queue
+import select
+import threading
+import psycopg2
+
+# Events kept per subscriber before the oldest is dropped (slow clients)
+SUBSCRIBER_BUFFER = 100
+# Seconds between keep-alive comments on an idle stream
+KEEPALIVE_SECONDS = 15
+
+# Postgres channel carrying events between processes
+CHANNEL = 'api_events'
+# NOTIFY payloads must be shorter than 8000 bytes; larger events stay in-process
+MAX_PAYLOAD_BYTES = 7999
+# EventBroker.listener while one thread opens the LISTEN connection
+CONNECTING = object()
+
+def format_sse(event, data, event_id=None):
+    """Formats one message in the text/event-stream wire format."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    for line in json.dumps(data, default=str).splitlines():
+        lines.append(f"data: {line}")
+    return "\n".join(lines) + "\n\n"
+
+class EventBroker:
+    """
+    Fans published events out to subscribers. A subscriber is any callable
+    taking the formatted message; the latest message of each event type is
+    replayed to new subscribers so they start from the current state.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.latest = {}
+        self.latest_data = {}
+        self.next_id = 1
+        # Opens a connection to the primary to relay events through; None keeps them in-process
+        self.connect = None
+        self.listener = None
+
+    def publish(self, event, data, relay=True):
+        """Sends an event to the streams of every process, or of this one only with relay=False."""
+        if relay and self.listening():
+            payload = json.dumps({'event': event, 'data': data}, default=str)
+            if len(payload.encode('utf-8')) <= MAX_PAYLOAD_BYTES:
+                try:
+                    self.notify(payload)
+                    return
+                except psycopg2.Error as e:
+                    print(f"Error: Could not relay event '{event}': {e}")
+        self.deliver(event, data)
+
+    def deliver(self, event, data):
+        """Sends an event to this process's subscribers."""
+        with self.lock:
+            message = format_sse(event, data, self.next_id)
+            self.next_id += 1
+            self.latest[event] = message
+            self.latest_data[event] = data
+            subscribers = list(self.subscribers)
+        for deliver in subscribers:
+            deliver(message)
+
+    def last(self, event):
+        """The data of the latest event of a type delivered here, or None."""
+        with self.lock:
+            return self.latest_data.get(event)
+
+    def notify(self, payload):
+        conn = self.connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_notify(%s, %s);", (CHANNEL, payload))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def listening(self):
+        """
+        Starts this process's LISTEN thread once; False when there is nothing
+        to relay through, or while another thread is still connecting. The
+        connection is opened outside the lock, so a slow database never
+        blocks delivery to this process's streams.
+        """
+        if self.connect is None:
+            return False
+        with self.lock:
+            if self.listener is not None:
+                return self.listener is not CONNECTING
+            self.listener = CONNECTING
+        conn = None
+        try:
+            conn = self.connect()
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL};")
+        except Exception as e:
+            print(f"Error: Could not listen for relayed events: {e}")
+            if conn is not None:
+                conn.close()
+            with self.lock:
+                self.listener = None
+            return False
+        listener = threading.Thread(target=self.listen, args=(conn,), daemon=True)
+        with self.lock:
+            self.listener = listener
+        listener.start()
+        return True
+
+    def listen(self, conn):
+        """Delivers relayed events until the connection fails; the next publish or subscribe listens again."""
+        try:
+            while True:
+                if select.select([conn], [], [], KEEPALIVE_SECONDS) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    message = json.loads(conn.notifies.pop(0).payload)
+                    self.deliver(message['event'], message['data'])
+        except (psycopg2.Error, OSError) as e:
+            print(f"Error: Relayed events listener stopped: {e}")
+        finally:
+            conn.close()
+            with self.lock:
+                self.listener = None
+
+    def subscribe(self, deliver):
+        self.listening()
+        with self.lock:
+            self.subscribers.add(deliver)
+            replay = list(self.latest.values())
+        for message in replay:
+            deliver(message)
+
+    def unsubscribe(self, deliver):
+        with self.lock:
+            self.subscribers.discard(deliver)
+
+    def subscriber_count(self):
+        with self.lock:
+            return len(self.subscribers)
+
+    def stream(self):
+        """Yields messages for one blocking (WSGI) client, with keep-alives."""
+        messages = queue.Queue(maxsize=SUBSCRIBER_BUFFER)
+
+        def deliver(message):
+            while True:
+                try:
+                    messages.put_nowait(message)
+                    return
+                except queue.Full:
+                    try:
+                        messages.get_nowait()
+                    except queue.Empty:
+                        pass
+
+        self.subscribe(deliver)
+        try:
+            while True:
+                try:
+                    yield messages.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+        finally:
+            self.unsubscribe(deliver)
+
+broker = EventBroker()
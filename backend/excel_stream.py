@@ -0,0 +1,113 @@
+"""
+Streaming reader for uploaded workbooks.
+
+pd.read_excel builds every cell of the workbook before returning. Here an
+.xlsx is walked row by row in openpyxl's read-only mode and coerced into
+fixed-size typed column buffers (float64 for numbers, object for text and
+dates); every CHUNK_ROWS rows the buffers are handed on as a DataFrame and
+reused. Memory is bounded by the chunk size, not by the file size, apart
+from the workbook's shared-string table, which openpyxl keeps whole.
+
+Legacy .xls files (at most 65,536 rows by format) have no streaming
+reader, so they are read whole and then cut into the same chunks.
+"""
+
+import numpy as np
+import pandas as pd
+import openpyxl
+
+CHUNK_ROWS = 50000
+
+# Upload columns by type; anything else in the sheet is ignored
+TEXT_COLUMNS = [
+    'order_id', 'customer_id', 'gender', 'product_id', 'country',
+    'subscription_status', 'product_name', 'category',
+]
+NUMERIC_COLUMNS = ['age', 'cancellations_count', 'unit_price', 'quantity', 'purchase_frequency', 'Ratings']
+DATE_COLUMNS = ['signup_date', 'last_purchase_date']
+
+def to_float(value):
+    if value is None:
+        return np.nan
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def to_text(value):
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        # Ids typed as numbers in Excel come back as floats
+        return str(int(value))
+    return str(value)
+
+class ColumnBuffers:
+    """Preallocated typed buffers for one chunk of upload rows."""
+
+    def __init__(self, columns, size):
+        self.size = size
+        self.length = 0
+        self.buffers = {}
+        self.setters = []
+        for position, name in enumerate(columns):
+            if name in NUMERIC_COLUMNS:
+                self.buffers[name] = np.empty(size, dtype=np.float64)
+                self.setters.append((position, self.buffers[name], to_float))
+            elif name in TEXT_COLUMNS:
+                self.buffers[name] = np.empty(size, dtype=object)
+                self.setters.append((position, self.buffers[name], to_text))
+            elif name in DATE_COLUMNS:
+                # Parsed per chunk with pd.to_datetime, which handles both cells and strings
+                self.buffers[name] = np.empty(size, dtype=object)
+                self.setters.append((position, self.buffers[name], lambda value: value))
+
+    def append(self, row):
+        index = self.length
+        width = len(row)
+        for position, buffer, convert in self.setters:
+            buffer[index] = convert(row[position]) if position < width else convert(None)
+        self.length += 1
+        return self.length == self.size
+
+    def to_frame(self):
+        """The filled rows as a DataFrame (copied, so the buffers can be refilled)."""
+        data = {}
+        for name, buffer in self.buffers.items():
+            column = buffer[:self.length]
+            data[name] = pd.to_datetime(column, errors='coerce') if name in DATE_COLUMNS else column
+        self.length = 0
+        return pd.DataFrame(data, copy=True)
+
+def iter_xlsx_chunks(source, chunk_rows=CHUNK_ROWS):
+    """Yields DataFrames of up to chunk_rows rows from the first sheet of an .xlsx file or file object."""
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        buffers = ColumnBuffers([str(name).strip() if name is not None else '' for name in header], chunk_rows)
+        for row in rows:
+            if not any(value is not None for value in row):
+                continue
+            if buffers.append(row):
+                yield buffers.to_frame()
+        if buffers.length:
+            yield buffers.to_frame()
+    finally:
+        workbook.close()
+
+def iter_xls_chunks(source, chunk_rows=CHUNK_ROWS):
+    df = pd.read_excel(source)
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].copy()
+
+def iter_excel_chunks(source, filename=None, chunk_rows=CHUNK_ROWS):
+    """Yields the rows of an uploaded workbook as DataFrames of up to chunk_rows rows."""
+    name = filename or (source if isinstance(source, str) else '')
+    if name.lower().endswith('.xls'):
+        return iter_xls_chunks(source, chunk_rows)
+    return iter_xlsx_chunks(source, chunk_rows)
@@ -0,0 +1,179 @@
+import os
+import sys
+import datetime
+import pandas as pd
+import numpy as np
+import psycopg2
+import joblib
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+warnings.filterwarnings('ignore')
+
+# --- Database Connection Details ---
+DB_NAME = "hackathon"
+DB_USER = "postgres"
+DB_PASS = "Post@7070" # <-- IMPORTANT: Change this
+DB_HOST = "localhost"
+DB_PORT = "5432"
+
+HIERARCHY_PATH = 'hierarchical_forecast.pkl'
+HORIZON_DAYS = 90
+SEASONAL_PERIODS = 7
+# Series with fewer non-zero days than this fall back to a flat recent average.
+MIN_ACTIVE_DAYS = 2 * SEASONAL_PERIODS
+RECENT_WINDOW_DAYS = 28
+
+# Levels of the hierarchy. Categories and countries both aggregate the
+# category x country bottom series, and everything aggregates to the total.
+LEVELS = ['total', 'category', 'country', 'category_country']
+
+def get_hierarchy_sales_data():
+    """Fetches daily revenue per product category and customer country."""
+    conn = None
+    try:
+        conn = psycopg2.connect(
+            database=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT
+        )
+        sql_query = """
+            SELECT
+                o.last_purchase_date,
+                p.category,
+                c.country,
+                SUM(o.unit_price * o.quantity) as revenue
+            FROM orders o
+            JOIN products p ON o.product_id = p.product_id
+            JOIN customers c ON o.customer_id = c.customer_id
+            GROUP BY o.last_purchase_date, p.category, c.country;
+        """
+        df = pd.read_sql(sql_query, conn)
+        print("Success: Hierarchical sales data loaded from database.")
+        return df
+
+    except Exception as e:
+        print(f"Error: Could not fetch sales data. {e}")
+        return None
+    finally:
+        if conn is not None:
+            conn.close()
+
+def build_hierarchy(df):
+    """Builds the daily series for every level and the summing matrix.
+
+    Returns (keys, values, summing_matrix) where keys is a list of
+    (level, series_name) pairs, values is a (days x series) DataFrame in the
+    same order, and summing_matrix maps the bottom series onto every series.
+    """
+    df = df.copy()
+    df['last_purchase_date'] = pd.to_datetime(df['last_purchase_date'], errors='coerce')
+    df = df.dropna(subset=['last_purchase_date', 'revenue'])
+    df['category'] = df['category'].fillna('Unknown')
+    df['country'] = df['country'].fillna('Unknown')
+    df['revenue'] = df['revenue'].astype(float)
+
+    bottom = df.pivot_table(
+        index='last_purchase_date', columns=['category', 'country'],
+        values='revenue', aggfunc='sum', fill_value=0
+    ).asfreq('D', fill_value=0)
+    bottom_keys = list(bottom.columns)
+    categories = sorted({cat for cat, _ in bottom_keys})
+    countries = sorted({country for _, country in bottom_keys})
+
+    keys = [('total', 'total')]
+    keys += [('category', cat) for cat in categories]
+    keys += [('country', country) for country in countries]
+    keys += [('category_country', f"{cat}|{country}") for cat, country in bottom_keys]
+
+    summing_matrix = np.zeros((len(keys), len(bottom_keys)))
+    summing_matrix[0, :] = 1
+    for j, (cat, country) in enumerate(bottom_keys):
+        summing_matrix[1 + categories.index(cat), j] = 1
+        summing_matrix[1 + len(categories) + countries.index(country), j] = 1
+    summing_matrix[1 + len(categories) + len(countries):, :] = np.eye(len(bottom_keys))
+
+    values = pd.DataFrame(bottom.values @ summing_matrix.T, index=bottom.index)
+    return keys, values, summing_matrix
+
+def fit_series(task):
+    """Fits one daily series and returns its base forecast and parameters.
+
+    Runs in a worker process, so it only takes and returns plain values.
+    """
+    # Imported here, in the worker: statsmodels is slow to import and the API only serves saved forecasts
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing
+
+    key, values, start_date = task
+    series = pd.Series(values, index=pd.date_range(start_date, periods=len(values), freq='D'))
+
+    if (series > 0).sum() >= MIN_ACTIVE_DAYS and len(series) >= 2 * SEASONAL_PERIODS:
+        try:
+            model = ExponentialSmoothing(
+                series, trend='add', seasonal='add', seasonal_periods=SEASONAL_PERIODS
+            ).fit()
+            params = {
+                name: float(model.params[name])
+                for name in ('smoothing_level', 'smoothing_trend', 'smoothing_seasonal')
+                if model.params.get(name) is not None
+            }
+            params['method'] = 'holt_winters'
+            # An additive trend can run below zero on sparse series; revenue can't
+            return key, np.clip(model.forecast(HORIZON_DAYS).values, 0, None), params
+        except Exception:
+            pass
+
+    # Sparse series: carry the recent daily average forward.
+    rate = float(series.iloc[-RECENT_WINDOW_DAYS:].mean()) if len(series) else 0.0
+    return key, np.full(HORIZON_DAYS, rate), {'method': 'recent_average', 'daily_rate': rate}
+
+def reconcile(base_forecasts, summing_matrix):
+    """Makes the base forecasts add up using OLS reconciliation.
+
+    Projects the (series x horizon) base forecasts onto the space of coherent
+    forecasts, so every aggregate equals the sum of its bottom series. The
+    projection can still push a bottom series below zero; those are clipped
+    at 0 before summing, so every level stays non-negative and coherent.
+    """
+    s = summing_matrix
+    bottom = np.linalg.solve(s.T @ s, s.T @ base_forecasts)
+    return s @ np.clip(bottom, 0, None)
+
+def train_and_save_hierarchy(df, max_workers=None):
+    """Fits every series in parallel, reconciles them and saves one artifact."""
+    keys, values, summing_matrix = build_hierarchy(df)
+    if len(values) < 2 * SEASONAL_PERIODS:
+        print("Error: Not enough daily data to train the hierarchical forecaster.")
+        return None
+
+    start_date = values.index[0]
+    tasks = [(key, values[i].values, start_date) for i, key in enumerate(keys)]
+
+    print(f"Fitting {len(tasks)} series across worker processes...")
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        fitted = list(pool.map(fit_series, tasks, chunksize=max(1, len(tasks) // (4 * (os.cpu_count() or 1)))))
+
+    base_forecasts = np.vstack([forecast for _, forecast, _ in fitted])
+    reconciled = reconcile(base_forecasts, summing_matrix)
+
+    artifact = {
+        'created_at': datetime.datetime.now().isoformat(),
+        'forecast_start': (values.index[-1] + pd.Timedelta(days=1)).strftime('%Y-%m-%d'),
+        'horizon': HORIZON_DAYS,
+        'levels': [level for level, _ in keys],
+        'series': [name for _, name in keys],
+        'params': [params for _, _, params in fitted],
+        'base_forecasts': base_forecasts.astype(np.float32),
+        'forecasts': reconciled.astype(np.float32),
+    }
+    tmp_path = HIERARCHY_PATH + '.tmp'
+    joblib.dump(artifact, tmp_path, compress=3)
+    os.replace(tmp_path, HIERARCHY_PATH)
+    print(f"\nSuccess: {len(keys)} reconciled series saved to '{HIERARCHY_PATH}'")
+    return artifact
+
+# --- Main Execution Block ---
+if __name__ == '__main__':
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    sales_df = get_hierarchy_sales_data()
+
+    if sales_df is not None:
+        train_and_save_hierarchy(sales_df, max_workers=workers)
@@ -0,0 +1,391 @@
+"""
+Versioned schema migrations for the backend database.
+Each migration runs once, in its own transaction, and is recorded in the
+schema_migrations table. Add new migrations to the end of MIGRATIONS.
+"""
+
+import psycopg2
+
+# --- Database Connection Details ---
+DB_NAME = "hackathon"
+DB_USER = "postgres"
+DB_PASS = "Post@7070" # <-- IMPORTANT: Change this
+DB_HOST = "localhost"
+DB_PORT = "5432"
+
+# Arbitrary key so concurrent runners apply migrations one at a time
+MIGRATION_LOCK_ID = 7070
+
+# Refills the approximate-analytics samples and their strata counts from the
+# base tables (migration 6, and after bulk loads that bypass data_importer)
+REBUILD_SAMPLES_STATEMENTS = [
+    "TRUNCATE order_sample, order_strata, customer_sample, customer_strata;",
+    """
+    INSERT INTO order_strata (month, population)
+    SELECT COALESCE(date_trunc('month', last_purchase_date)::date, DATE '1900-01-01'), COUNT(*)
+    FROM orders
+    GROUP BY 1;
+    """,
+    """
+    INSERT INTO order_sample (order_id, month, last_purchase_date, order_amount, quantity, age_group)
+    SELECT o.order_id, COALESCE(date_trunc('month', o.last_purchase_date)::date, DATE '1900-01-01'),
+           o.last_purchase_date, o.unit_price * o.quantity, o.quantity, age_group(c.age)
+    FROM orders o JOIN customers c ON o.customer_id = c.customer_id
+    WHERE order_in_sample(o.order_id);
+    """,
+    """
+    INSERT INTO customer_strata (country, population)
+    SELECT COALESCE(country, 'Unknown'), COUNT(*)
+    FROM customers
+    GROUP BY 1;
+    """,
+    """
+    INSERT INTO customer_sample (customer_id, country)
+    SELECT customer_id, COALESCE(country, 'Unknown')
+    FROM customers
+    WHERE customer_in_sample(customer_id);
+    """,
+    "ANALYZE order_sample; ANALYZE customer_sample;",
+]
+
+MIGRATIONS = [
+    (1, "Create customers, products and orders tables", [
+        """
+        CREATE TABLE IF NOT EXISTS customers (
+            customer_id VARCHAR(50) PRIMARY KEY,
+            age INTEGER,
+            gender VARCHAR(20),
+            country VARCHAR(50),
+            signup_date DATE
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS products (
+            product_id VARCHAR(50) PRIMARY KEY,
+            product_name VARCHAR(200),
+            category VARCHAR(100)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS orders (
+            order_id VARCHAR(50) PRIMARY KEY,
+            customer_id VARCHAR(50) REFERENCES customers(customer_id),
+            product_id VARCHAR(50) REFERENCES products(product_id),
+            last_purchase_date DATE,
+            cancellations_count INTEGER,
+            subscription_status VARCHAR(50),
+            unit_price DECIMAL(10,2),
+            quantity INTEGER,
+            purchase_frequency DECIMAL(10,2),
+            ratings DECIMAL(3,2)
+        );
+        """,
+    ]),
+    (2, "Index order foreign keys and purchase dates", [
+        # Joins to customers/products and the per-product demand history
+        "CREATE INDEX IF NOT EXISTS idx_orders_customer_id ON orders (customer_id);",
+        "CREATE INDEX IF NOT EXISTS idx_orders_product_id ON orders (product_id);",
+        # Orders arrive roughly in date order, so a BRIN index covers date
+        # range filters (e.g. the 180-day window) at a fraction of a B-tree's size
+        "CREATE INDEX IF NOT EXISTS idx_orders_last_purchase_date_brin ON orders USING BRIN (last_purchase_date);",
+        "ANALYZE orders;",
+    ]),
+    (3, "Add product sales leaderboard", [
+        # Running per-product totals, kept current by data_importer as deltas
+        """
+        CREATE TABLE IF NOT EXISTS product_sales (
+            product_id VARCHAR(50) PRIMARY KEY REFERENCES products(product_id),
+            product_name VARCHAR(200),
+            category VARCHAR(100),
+            total_revenue DECIMAL(16,2) NOT NULL DEFAULT 0,
+            total_units BIGINT NOT NULL DEFAULT 0
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_product_sales_revenue ON product_sales (total_revenue DESC);",
+        "CREATE INDEX IF NOT EXISTS idx_product_sales_units ON product_sales (total_units DESC);",
+        "CREATE INDEX IF NOT EXISTS idx_product_sales_category_revenue ON product_sales (category, total_revenue DESC);",
+        "CREATE INDEX IF NOT EXISTS idx_product_sales_category_units ON product_sales (category, total_units DESC);",
+        # Backfill from existing orders
+        """
+        INSERT INTO product_sales (product_id, product_name, category, total_revenue, total_units)
+        SELECT p.product_id, p.product_name, p.category,
+               COALESCE(SUM(o.unit_price * o.quantity), 0), COALESCE(SUM(o.quantity), 0)
+        FROM products p JOIN orders o ON p.product_id = o.product_id
+        GROUP BY p.product_id, p.product_name, p.category
+        ON CONFLICT (product_id) DO NOTHING;
+        """,
+        "ANALYZE product_sales;",
+    ]),
+    (4, "Add data version counter", [
+        # A single row, bumped in the same transaction as every data load, so
+        # readers can tell whether anything they derived from the data is stale
+        """
+        CREATE TABLE IF NOT EXISTS data_version (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+            version BIGINT NOT NULL DEFAULT 1,
+            updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+        """,
+        "INSERT INTO data_version (id) VALUES (TRUE) ON CONFLICT (id) DO NOTHING;",
+    ]),
+    (5, "Add churn score and monthly churn history tables", [
+        # Latest score per customer, so a rescore can take back its old contribution
+        """
+        CREATE TABLE IF NOT EXISTS customer_churn (
+            customer_id VARCHAR(50) PRIMARY KEY REFERENCES customers(customer_id),
+            country VARCHAR(50),
+            month DATE,
+            churn_probability REAL NOT NULL,
+            predicted_churn SMALLINT NOT NULL,
+            scored_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+        """,
+        # Predicted churners per month of last purchase and country; filled by
+        # churn_history.py and kept current as deltas when customers are rescored
+        """
+        CREATE TABLE IF NOT EXISTS churn_history (
+            month DATE NOT NULL,
+            country VARCHAR(50) NOT NULL,
+            churn_count INTEGER NOT NULL DEFAULT 0,
+            customer_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (month, country)
+        );
+        """,
+    ]),
+    (6, "Add stratified samples for approximate analytics", [
+        # Sample membership is a fixed hash of the id, so each new row joins
+        # the sample (or not) as it is inserted: 1% of orders, 10% of customers.
+        # To change a rate, redefine the function in a new migration and
+        # rerun REBUILD_SAMPLES_STATEMENTS.
+        """
+        CREATE OR REPLACE FUNCTION order_in_sample(id TEXT) RETURNS BOOLEAN
+        LANGUAGE SQL IMMUTABLE PARALLEL SAFE AS $$
+            SELECT ('x' || substr(md5(id), 1, 8))::bit(32)::bigint % 10000 < 100
+        $$;
+        """,
+        """
+        CREATE OR REPLACE FUNCTION customer_in_sample(id TEXT) RETURNS BOOLEAN
+        LANGUAGE SQL IMMUTABLE PARALLEL SAFE AS $$
+            SELECT ('x' || substr(md5(id), 1, 8))::bit(32)::bigint % 10000 < 1000
+        $$;
+        """,
+        # Same buckets as the sales_by_age endpoint
+        """
+        CREATE OR REPLACE FUNCTION age_group(age INTEGER) RETURNS VARCHAR
+        LANGUAGE SQL IMMUTABLE PARALLEL SAFE AS $$
+            SELECT CASE
+                WHEN age BETWEEN 18 AND 25 THEN '18-25'
+                WHEN age BETWEEN 26 AND 35 THEN '26-35'
+                WHEN age BETWEEN 36 AND 45 THEN '36-45'
+                WHEN age BETWEEN 46 AND 60 THEN '46-60'
+                ELSE '60+'
+            END
+        $$;
+        """,
+        # Orders are stratified by month of purchase (1900-01-01 for no date)
+        """
+        CREATE TABLE IF NOT EXISTS order_strata (
+            month DATE PRIMARY KEY,
+            population BIGINT NOT NULL DEFAULT 0
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS order_sample (
+            order_id VARCHAR(50) PRIMARY KEY REFERENCES orders(order_id) ON DELETE CASCADE,
+            month DATE NOT NULL,
+            last_purchase_date DATE,
+            order_amount DECIMAL(12,2),
+            quantity INTEGER,
+            age_group VARCHAR(10)
+        );
+        """,
+        # Customers are stratified by country
+        """
+        CREATE TABLE IF NOT EXISTS customer_strata (
+            country VARCHAR(50) PRIMARY KEY,
+            population BIGINT NOT NULL DEFAULT 0
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS customer_sample (
+            customer_id VARCHAR(50) PRIMARY KEY REFERENCES customers(customer_id) ON DELETE CASCADE,
+            country VARCHAR(50) NOT NULL
+        );
+        """,
+    ] + REBUILD_SAMPLES_STATEMENTS),
+    (7, "Add churn and sales cube", [
+        # Each customer's contribution per month of purchase, so a rescore or
+        # an upload can take back what the customer added before
+        """
+        CREATE TABLE IF NOT EXISTS customer_cube_cells (
+            customer_id VARCHAR(50) NOT NULL REFERENCES customers(customer_id) ON DELETE CASCADE,
+            month DATE NOT NULL,
+            country VARCHAR(50) NOT NULL,
+            gender VARCHAR(20) NOT NULL,
+            age INTEGER NOT NULL,
+            risk_pct SMALLINT NOT NULL,
+            customers INTEGER NOT NULL,
+            churners INTEGER NOT NULL,
+            orders INTEGER NOT NULL,
+            revenue DECIMAL(14,2) NOT NULL,
+            units BIGINT NOT NULL,
+            PRIMARY KEY (customer_id, month)
+        );
+        """,
+        # Sums per month x country x gender x age x churn probability percentile;
+        # filled by churn_cube.py, sliced by /api/churn_cube
+        """
+        CREATE TABLE IF NOT EXISTS churn_cube (
+            month DATE NOT NULL,
+            country VARCHAR(50) NOT NULL,
+            gender VARCHAR(20) NOT NULL,
+            age INTEGER NOT NULL,
+            risk_pct SMALLINT NOT NULL,
+            customers INTEGER NOT NULL DEFAULT 0,
+            churners INTEGER NOT NULL DEFAULT 0,
+            orders INTEGER NOT NULL DEFAULT 0,
+            revenue DECIMAL(16,2) NOT NULL DEFAULT 0,
+            units BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (month, country, gender, age, risk_pct)
+        );
+        """,
+    ]),
+    (8, "Add signup cohort tables", [
+        """
+        CREATE TABLE IF NOT EXISTS cohort_sizes (
+            cohort DATE NOT NULL,
+            country VARCHAR(50) NOT NULL,
+            customers INTEGER NOT NULL,
+            PRIMARY KEY (cohort, country)
+        );
+        """,
+        # active[N + 1]: customers of the cohort and country who ordered in the
+        # category ('*' for any) N months after signup; filled by cohorts.py
+        """
+        CREATE TABLE IF NOT EXISTS cohort_activity (
+            cohort DATE NOT NULL,
+            country VARCHAR(50) NOT NULL,
+            category VARCHAR(100) NOT NULL,
+            active INTEGER[] NOT NULL,
+            PRIMARY KEY (cohort, country, category)
+        );
+        """,
+    ]),
+    (9, "Add RFM scores", [
+        # Each customer's recency, frequency and monetary value, the sketch
+        # bucket of each, and the 1-5 scores; filled by rfm.py
+        """
+        CREATE TABLE IF NOT EXISTS customer_rfm (
+            customer_id VARCHAR(50) PRIMARY KEY REFERENCES customers(customer_id) ON DELETE CASCADE,
+            last_purchase_date DATE,
+            purchase_count INTEGER NOT NULL,
+            total_spend DECIMAL(14,2),
+            recency_bucket INTEGER NOT NULL,
+            frequency_bucket INTEGER NOT NULL,
+            monetary_bucket INTEGER NOT NULL,
+            r SMALLINT NOT NULL DEFAULT 0,
+            f SMALLINT NOT NULL DEFAULT 0,
+            m SMALLINT NOT NULL DEFAULT 0,
+            scored_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_customer_rfm_code ON customer_rfm (r, f, m);",
+        # A shifted quintile boundary rescores only the customers between its old and new bucket
+        "CREATE INDEX IF NOT EXISTS idx_customer_rfm_recency ON customer_rfm (recency_bucket);",
+        "CREATE INDEX IF NOT EXISTS idx_customer_rfm_frequency ON customer_rfm (frequency_bucket);",
+        "CREATE INDEX IF NOT EXISTS idx_customer_rfm_monetary ON customer_rfm (monetary_bucket);",
+        # Customers per bucket of each dimension: the quantile sketches
+        """
+        CREATE TABLE IF NOT EXISTS rfm_sketch (
+            dimension VARCHAR(10) NOT NULL,
+            bucket INTEGER NOT NULL,
+            customers BIGINT NOT NULL,
+            PRIMARY KEY (dimension, bucket)
+        );
+        """,
+        # The quintile boundaries the stored scores were given with
+        """
+        CREATE TABLE IF NOT EXISTS rfm_cuts (
+            dimension VARCHAR(10) PRIMARY KEY,
+            cuts INTEGER[] NOT NULL,
+            updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS rfm_segments (
+            r SMALLINT NOT NULL,
+            f SMALLINT NOT NULL,
+            m SMALLINT NOT NULL,
+            customers INTEGER NOT NULL,
+            PRIMARY KEY (r, f, m)
+        );
+        """,
+    ]),
+]
+
+def ensure_migrations_table(conn):
+    """Creates the table that records applied migrations."""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description VARCHAR(200),
+                applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+            );
+        """)
+    conn.commit()
+
+def get_applied_versions(conn):
+    """Returns the set of migration versions already applied."""
+    ensure_migrations_table(conn)
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT version FROM schema_migrations;")
+        return {row[0] for row in cursor.fetchall()}
+
+def apply_migrations(conn, target_version=None):
+    """
+    Applies pending migrations in order, up to target_version if given.
+    Returns the list of versions applied by this call.
+    """
+    ensure_migrations_table(conn)
+    applied_now = []
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_lock(%s);", (MIGRATION_LOCK_ID,))
+    try:
+        applied = get_applied_versions(conn)
+        for version, description, statements in MIGRATIONS:
+            if version in applied or (target_version is not None and version > target_version):
+                continue
+            try:
+                with conn.cursor() as cursor:
+                    for statement in statements:
+                        cursor.execute(statement)
+                    cursor.execute(
+                        "INSERT INTO schema_migrations (version, description) VALUES (%s, %s);",
+                        (version, description)
+                    )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            print(f"-> Applied migration {version}: {description}")
+            applied_now.append(version)
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s);", (MIGRATION_LOCK_ID,))
+        conn.commit()
+    return applied_now
+
+# --- Main Execution Block ---
+if __name__ == '__main__':
+    import sys
+    target = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    conn = psycopg2.connect(
+        database=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT
+    )
+    try:
+        versions = apply_migrations(conn, target)
+        if not versions:
+            print("Database schema is up to date.")
+    finally:
+        conn.close()
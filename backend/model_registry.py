@@ -0,0 +1,411 @@
+"""
+Versioned churn model registry with hot swap.
+
+Every trained model is stored in its own directory under REGISTRY_DIR
+(models/churn/v0001, v0002, ...) holding the model package (model.pkl) and
+its metadata (meta.json: feature columns, metrics, training time). The
+deployed version is recorded in registry.json, with the versions deployed
+before it for rollback and the shadow candidate, if any.
+
+In the API, `registry` holds the active model. A new version is loaded in
+a background thread and swapped in with a single reference assignment, so
+requests keep scoring with the old model until the new one is ready and
+none of them sees a half-loaded model. A candidate can also be loaded as a
+shadow: it scores the same customers as the active model, off the request
+path, and its agreement and latency are reported next to the active one's.
+Every API worker watches registry.json (ModelRegistry.sync), so a swap
+made through one worker reaches the others.
+
+List, register and deploy versions from the command line with:
+    python model_registry.py list
+    python model_registry.py import churn_model.pkl
+    python model_registry.py activate v0002
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import joblib
+from profiling import LatencyStats
+
+REGISTRY_DIR = os.path.join('models', 'churn')
+REGISTRY_PATH = os.path.join(REGISTRY_DIR, 'registry.json')
+MODEL_FILE = 'model.pkl'
+META_FILE = 'meta.json'
+# Model file of the API before the registry; imported as the first version
+LEGACY_MODEL_PATH = 'churn_model.pkl'
+
+VERSION_PATTERN = re.compile(r'^v\d{4,}$')
+# Versions kept for rollback in registry.json
+HISTORY_LENGTH = 10
+
+# --- Artifacts on disk ---
+def list_versions():
+    """Returns the registered versions, oldest first."""
+    if not os.path.isdir(REGISTRY_DIR):
+        return []
+    return sorted(
+        name for name in os.listdir(REGISTRY_DIR)
+        if VERSION_PATTERN.match(name) and os.path.isfile(os.path.join(REGISTRY_DIR, name, META_FILE))
+    )
+
+def version_dir(version):
+    return os.path.join(REGISTRY_DIR, version)
+
+def load_meta(version):
+    with open(os.path.join(version_dir(version), META_FILE)) as f:
+        return json.load(f)
+
+def write_json(path, data):
+    """Writes JSON to `path`, replacing the old file atomically."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+def read_registry():
+    """Returns {"current": version or None, "history": [previous versions, latest last], "shadow": version or None}."""
+    try:
+        with open(REGISTRY_PATH) as f:
+            return dict({"shadow": None}, **json.load(f))
+    except FileNotFoundError:
+        return {"current": None, "history": [], "shadow": None}
+
+def registry_mtime():
+    try:
+        return os.path.getmtime(REGISTRY_PATH)
+    except OSError:
+        return None
+
+def set_current(version):
+    """Records `version` as deployed, pushing the previous one onto the rollback history."""
+    state = read_registry()
+    if state['current'] == version:
+        return
+    if state['current'] is not None:
+        state['history'] = (state['history'] + [state['current']])[-HISTORY_LENGTH:]
+    state['current'] = version
+    write_json(REGISTRY_PATH, state)
+
+def previous_version():
+    """The version deployed before the current one, or None."""
+    history = read_registry()['history']
+    return history[-1] if history else None
+
+def pop_previous(version):
+    """Records `version`, the latest in the rollback history, as deployed again."""
+    state = read_registry()
+    if state['current'] == version:
+        return
+    if state['history'] and state['history'][-1] == version:
+        state['history'].pop()
+    state['current'] = version
+    write_json(REGISTRY_PATH, state)
+
+def set_shadow(version):
+    """Records the shadow candidate (None for no shadow)."""
+    state = read_registry()
+    if state['shadow'] == version:
+        return
+    state['shadow'] = version
+    write_json(REGISTRY_PATH, state)
+
+def register_version(package, meta, model_path=None):
+    """
+    Stores a model package (or copies the file at `model_path`) and its
+    metadata as a new version. The directory is written under a temporary
+    name and renamed into place, so a version is never seen half-written.
+    Returns the new version.
+    """
+    os.makedirs(REGISTRY_DIR, exist_ok=True)
+    versions = list_versions()
+    version = f"v{int(versions[-1][1:]) + 1 if versions else 1:04d}"
+    tmp_dir = os.path.join(REGISTRY_DIR, f".{version}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    if model_path is not None:
+        shutil.copy2(model_path, os.path.join(tmp_dir, MODEL_FILE))
+    else:
+        joblib.dump(package, os.path.join(tmp_dir, MODEL_FILE))
+    write_json(os.path.join(tmp_dir, META_FILE), dict(meta, version=version))
+    os.rename(tmp_dir, version_dir(version))
+    return version
+
+def import_legacy_model(path=LEGACY_MODEL_PATH):
+    """Registers a model file saved before the registry existed. Returns the version, or None if missing."""
+    if not os.path.isfile(path):
+        return None
+    package = joblib.load(path)
+    meta = {
+        'numeric_columns': list(package['numeric_columns']),
+        'model_columns': list(package['model_columns']),
+        'metrics': {},
+        'trained_at': datetime.datetime.fromtimestamp(os.path.getmtime(path)).isoformat(),
+        'source': os.path.basename(path),
+    }
+    return register_version(package, meta, model_path=path)
+
+def load_version(version):
+    """Loads a registered version into memory."""
+    if version not in list_versions():
+        raise KeyError(f"Unknown model version '{version}'.")
+    package = joblib.load(os.path.join(version_dir(version), MODEL_FILE))
+    return {
+        'version': version,
+        'model': package['model'],
+        'scaler': package['scaler'],
+        'numeric_columns': package['numeric_columns'],
+        'model_columns': package['model_columns'],
+        'meta': load_meta(version),
+    }
+
+# --- Serving ---
+class ModelRegistry:
+    """
+    The models loaded in this process: the active one, the one it replaced
+    (kept for an instant rollback) and an optional shadow candidate.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = None
+        self.previous = None
+        self.shadow = None
+        self.loading = {}
+        self.latency = {}
+        self.comparison = None
+        self.on_swap = []
+        # registry.json as of the last sync()
+        self.synced_mtime = None
+        # One shadow pass at a time; batches arriving meanwhile are skipped
+        self.shadow_executor = ThreadPoolExecutor(max_workers=1)
+        self.shadow_busy = threading.Lock()
+
+    def load_current(self):
+        """Loads the deployed version, registering the legacy model file on first use. Returns it or None."""
+        self.synced_mtime = registry_mtime()
+        version = read_registry()['current']
+        if version is None:
+            version = list_versions()[-1] if list_versions() else import_legacy_model()
+            if version is None:
+                return None
+            set_current(version)
+        self.swap(load_version(version), notify=False)
+        return self.active
+
+    def swap(self, loaded, notify=True):
+        """Makes a loaded model the active one, then tells the on_swap callbacks (unless notify=False)."""
+        with self.lock:
+            if self.active is not None and self.active['version'] != loaded['version']:
+                self.previous = self.active
+            self.active = loaded
+            if self.shadow is not None and self.shadow['version'] == loaded['version']:
+                self.shadow, self.comparison = None, None
+        if not notify:
+            return
+        for callback in self.on_swap:
+            callback(loaded['version'])
+
+    def load_in_background(self, version, ready):
+        """Loads `version` in a thread and hands it to ready(loaded). Returns False if it is already loading."""
+        with self.lock:
+            if self.loading.get(version) == 'loading':
+                return False
+            self.loading[version] = 'loading'
+
+        def load():
+            try:
+                loaded = load_version(version)
+                ready(loaded)
+                status = 'ready'
+            except Exception as e:
+                status = f"failed: {e}"
+            with self.lock:
+                self.loading[version] = status
+
+        threading.Thread(target=load, daemon=True).start()
+        return True
+
+    def activate(self, version):
+        """Deploys `version` once it has loaded in the background."""
+        if version not in list_versions():
+            raise KeyError(f"Unknown model version '{version}'.")
+
+        def ready(loaded):
+            set_current(version)
+            self.swap(loaded)
+
+        return self.load_in_background(version, ready)
+
+    def rollback(self):
+        """Redeploys the previous version. Returns it, or None if there is none."""
+        version = previous_version()
+        if version is None:
+            return None
+
+        def ready(loaded):
+            pop_previous(version)
+            self.swap(loaded)
+
+        with self.lock:
+            previous = self.previous if self.previous is not None and self.previous['version'] == version else None
+        if previous is not None:
+            ready(previous)
+        else:
+            self.load_in_background(version, ready)
+        return version
+
+    def set_shadow_model(self, loaded):
+        with self.lock:
+            self.shadow = loaded
+            self.comparison = {"batches": 0, "customers": 0, "agreements": 0, "abs_difference": 0.0, "skipped": 0}
+
+    def start_shadow(self, version):
+        """Loads `version` in the background as the shadow candidate."""
+        if version not in list_versions():
+            raise KeyError(f"Unknown model version '{version}'.")
+
+        def ready(loaded):
+            set_shadow(version)
+            self.set_shadow_model(loaded)
+
+        return self.load_in_background(version, ready)
+
+    def stop_shadow(self):
+        set_shadow(None)
+        with self.lock:
+            self.shadow, self.comparison = None, None
+
+    def sync(self):
+        """
+        Follows a swap made by another process: when registry.json has
+        changed, loads the deployed and shadow versions it names in the
+        background. The process that made the swap already rescored the
+        churn history, so on_swap callbacks are not run.
+        """
+        mtime = registry_mtime()
+        if mtime is None or mtime == self.synced_mtime:
+            return
+        with self.lock:
+            if mtime == self.synced_mtime:
+                return
+            self.synced_mtime = mtime
+            active, previous, shadow = self.active, self.previous, self.shadow
+        state = read_registry()
+
+        current = state['current']
+        if current is not None and (active is None or active['version'] != current):
+            if previous is not None and previous['version'] == current:
+                self.swap(previous, notify=False)
+            else:
+                def ready(loaded):
+                    # A later swap may have landed while this one was loading
+                    if read_registry()['current'] == loaded['version']:
+                        self.swap(loaded, notify=False)
+                    else:
+                        self.synced_mtime = None
+                self.load_in_background(current, ready)
+
+        if state['shadow'] is None:
+            if shadow is not None:
+                with self.lock:
+                    self.shadow, self.comparison = None, None
+        elif shadow is None or shadow['version'] != state['shadow']:
+            self.load_in_background(state['shadow'], self.set_shadow_model)
+
+    def record_latency(self, version, milliseconds):
+        with self.lock:
+            self.latency.setdefault(version, LatencyStats()).add(milliseconds)
+
+    def submit_shadow(self, score, active_probabilities, active_predictions):
+        """
+        Scores the shadow candidate off the request path with score(model) ->
+        (probabilities, predictions) and compares it with the active model.
+        """
+        shadow = self.shadow
+        if shadow is None:
+            return
+        if not self.shadow_busy.acquire(blocking=False):
+            with self.lock:
+                if self.comparison is not None:
+                    self.comparison['skipped'] += 1
+            return
+
+        def run():
+            try:
+                start = time.perf_counter()
+                probabilities, predictions = score(shadow)
+                self.record_latency(shadow['version'], (time.perf_counter() - start) * 1000)
+                with self.lock:
+                    if self.shadow is not shadow:
+                        return
+                    self.comparison['batches'] += 1
+                    self.comparison['customers'] += len(predictions)
+                    self.comparison['agreements'] += int((predictions == active_predictions).sum())
+                    self.comparison['abs_difference'] += float(np.abs(probabilities - active_probabilities).sum())
+            except Exception as e:
+                print(f"Error: Shadow scoring with {shadow['version']} failed: {e}")
+            finally:
+                self.shadow_busy.release()
+
+        self.shadow_executor.submit(run)
+
+    def status(self):
+        """The loaded versions, background loads and side-by-side latency of the active and shadow models."""
+        with self.lock:
+            active, previous, shadow = self.active, self.previous, self.shadow
+            latency = {version: stats.summary() for version, stats in self.latency.items()}
+            comparison = dict(self.comparison) if self.comparison else None
+            loading = dict(self.loading)
+        shadow_status = None
+        if shadow is not None:
+            customers = comparison['customers']
+            shadow_status = {
+                "version": shadow['version'],
+                "batches": comparison['batches'],
+                "batches_skipped": comparison['skipped'],
+                "customers_compared": customers,
+                "prediction_agreement": round(comparison['agreements'] / customers, 4) if customers else None,
+                "mean_abs_probability_difference": round(comparison['abs_difference'] / customers, 4) if customers else None,
+                "latency": {
+                    "active": latency.get(active['version'], {"count": 0}) if active else None,
+                    "shadow": latency.get(shadow['version'], {"count": 0}),
+                },
+            }
+        return {
+            "active": active['version'] if active else None,
+            "previous": previous['version'] if previous else None,
+            "shadow": shadow_status,
+            "loading": loading,
+            "latency": latency,
+        }
+
+registry = ModelRegistry()
+
+# --- Main Execution Block ---
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'list'
+    if command == 'list':
+        current = read_registry()['current']
+        for version in list_versions():
+            meta = load_meta(version)
+            marker = '*' if version == current else ' '
+            print(f"{marker} {version}  trained {meta.get('trained_at')}  metrics {meta.get('metrics')}")
+    elif command == 'import':
+        version = import_legacy_model(sys.argv[2] if len(sys.argv) > 2 else LEGACY_MODEL_PATH)
+        print(f"Success: Registered model as {version}." if version else "Error: Model file not found.")
+    elif command == 'activate':
+        if sys.argv[2] not in list_versions():
+            print(f"Error: Unknown model version '{sys.argv[2]}'.")
+        else:
+            set_current(sys.argv[2])
+            print(f"Success: {sys.argv[2]} deployed; running servers swap it in on their next churn request.")
+    else:
+        print("Usage: python model_registry.py [list | import <path> | activate <version>]")
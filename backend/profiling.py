@@ -0,0 +1,251 @@
+"""
+On-demand request profiling.
+
+A request is profiled when it carries the header `X-Profile: 1`, or at
+random with probability PROFILE_SAMPLE_RATE (default 0, also settable at
+runtime through the admin endpoint). Unprofiled requests pay one header
+lookup and, with a non-zero rate, one random draw.
+
+A profiled request runs under cProfile (deterministic call counts and
+times, for pstats) while a sampler thread records its stacks every
+PROFILE_INTERVAL_MS (collapsed stacks, for flamegraphs). Work the request
+hands to an executor is followed with propagate(), which profiles the
+worker thread for the duration of the task. Results are merged per
+endpoint (the route pattern, e.g. /api/predict_churn).
+
+LatencyStats is the always-on counterpart: the count and recent-window
+percentiles of a latency, kept per churn model version (model_registry.py)
+and per database backend (db_router.py).
+
+Configure with the environment variables:
+    PROFILE_SAMPLE_RATE   fraction of requests to profile (default 0)
+    PROFILE_INTERVAL_MS   stack sampling interval (default 5)
+"""
+
+import os
+import sys
+import time
+import random
+import marshal
+import pstats
+import cProfile
+import threading
+import contextvars
+from collections import Counter, deque
+import numpy as np
+
+PROFILE_HEADER = 'X-Profile'
+MAX_STACK_DEPTH = 128
+# Latency samples kept per LatencyStats for the percentiles
+LATENCY_WINDOW = 1000
+
+current = contextvars.ContextVar('profile_session', default=None)
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+def collapsed_stack(frame):
+    """'root;...;leaf' for a frame, as flamegraph.pl and speedscope read it."""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+class Session:
+    """The profile of one request, across the threads that work on it."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+        self.threads = {}
+        self.profiles = []
+        self.stacks = Counter()
+
+    def attach(self):
+        """Profiles the calling thread. Returns False if it already is."""
+        thread_id = threading.get_ident()
+        with self.lock:
+            if thread_id in self.threads:
+                return False
+            profile = cProfile.Profile()
+            self.threads[thread_id] = profile
+        profile.enable()
+        return True
+
+    def detach(self):
+        thread_id = threading.get_ident()
+        with self.lock:
+            profile = self.threads.pop(thread_id, None)
+        if profile is not None:
+            profile.disable()
+            with self.lock:
+                self.profiles.append(profile)
+
+    def sample(self, frames):
+        with self.lock:
+            for thread_id in self.threads:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.stacks[collapsed_stack(frame)] += 1
+
+class Profiler:
+    """Decides which requests to profile, samples them and keeps per-endpoint results."""
+
+    def __init__(self, sample_rate=0.0, interval_ms=5.0):
+        self.sample_rate = sample_rate
+        self.interval = interval_ms / 1000
+        self.lock = threading.Lock()
+        self.active = set()
+        self.sampler = None
+        self.endpoints = {}
+
+    def wanted(self, header_value=None):
+        """True if a request with this X-Profile header value should be profiled."""
+        if header_value and header_value.lower() in ('1', 'true', 'yes'):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def begin(self, endpoint, attach=True):
+        """Starts profiling a request; with attach=False only its propagated work is profiled."""
+        session = Session(endpoint)
+        session.token = current.set(session)
+        with self.lock:
+            self.active.add(session)
+            if self.sampler is None:
+                self.sampler = threading.Thread(target=self.sample_loop, daemon=True)
+                self.sampler.start()
+        if attach:
+            session.attach()
+        return session
+
+    def end(self, session):
+        session.detach()
+        elapsed_ms = (time.perf_counter() - session.start) * 1000
+        try:
+            current.reset(session.token)
+        except ValueError:
+            # Ended from another context (e.g. an ASGI send callback)
+            current.set(None)
+        with self.lock:
+            self.active.discard(session)
+            result = self.endpoints.setdefault(session.endpoint, {
+                'requests': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'stats': None, 'stacks': Counter(),
+            })
+            result['requests'] += 1
+            result['total_ms'] += elapsed_ms
+            result['max_ms'] = max(result['max_ms'], elapsed_ms)
+            result['stacks'].update(session.stacks)
+            for profile in session.profiles:
+                if result['stats'] is None:
+                    result['stats'] = pstats.Stats(profile)
+                else:
+                    result['stats'].add(profile)
+
+    def sample_loop(self):
+        while True:
+            with self.lock:
+                sessions = list(self.active)
+                if not sessions:
+                    self.sampler = None
+                    return
+            frames = sys._current_frames()
+            for session in sessions:
+                session.sample(frames)
+            del frames
+            time.sleep(self.interval)
+
+    def propagate(self, function):
+        """Wraps work handed to another thread so it is profiled with the request that submitted it."""
+        session = current.get()
+        if session is None:
+            return function
+
+        def run(*args, **kwargs):
+            token = current.set(session)
+            attached = session.attach()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                if attached:
+                    session.detach()
+                current.reset(token)
+        return run
+
+    def summary(self, top=10):
+        """Per endpoint: profiled requests, wall times and the functions with the most cumulative time."""
+        with self.lock:
+            endpoints = {}
+            for endpoint, result in self.endpoints.items():
+                functions = []
+                if result['stats'] is not None:
+                    rows = sorted(result['stats'].stats.items(), key=lambda item: -item[1][3])[:top]
+                    functions = [
+                        {
+                            'function': f"{os.path.basename(filename)}:{line}({name})",
+                            'calls': calls,
+                            'total_ms': round(total * 1000, 1),
+                            'cumulative_ms': round(cumulative * 1000, 1),
+                        }
+                        for (filename, line, name), (_, calls, total, cumulative, _) in rows
+                    ]
+                endpoints[endpoint] = {
+                    'requests': result['requests'],
+                    'mean_ms': round(result['total_ms'] / result['requests'], 1),
+                    'max_ms': round(result['max_ms'], 1),
+                    'samples': sum(result['stacks'].values()),
+                    'top_functions': functions,
+                }
+            return {'sample_rate': self.sample_rate, 'interval_ms': self.interval * 1000, 'endpoints': endpoints}
+
+    def collapsed(self, endpoint):
+        """Collapsed stacks ('frame;frame;frame count' per line), or None for an unknown endpoint."""
+        with self.lock:
+            result = self.endpoints.get(endpoint)
+            if result is None:
+                return None
+            return ''.join(f"{stack} {count}\n" for stack, count in result['stacks'].most_common())
+
+    def pstats_dump(self, endpoint):
+        """The merged stats in the binary pstats format (pstats.Stats(path), snakeviz), or None."""
+        with self.lock:
+            result = self.endpoints.get(endpoint)
+            if result is None or result['stats'] is None:
+                return None
+            return marshal.dumps(result['stats'].stats)
+
+    def reset(self):
+        with self.lock:
+            self.endpoints.clear()
+
+class LatencyStats:
+    """Count and recent-window percentiles of latencies."""
+
+    def __init__(self):
+        self.count = 0
+        self.samples = deque(maxlen=LATENCY_WINDOW)
+
+    def add(self, milliseconds):
+        self.count += 1
+        self.samples.append(milliseconds)
+
+    def summary(self):
+        if not self.samples:
+            return {"count": self.count}
+        samples = np.array(self.samples)
+        return {
+            "count": self.count,
+            "mean_ms": round(float(samples.mean()), 2),
+            "p50_ms": round(float(np.percentile(samples, 50)), 2),
+            "p95_ms": round(float(np.percentile(samples, 95)), 2),
+        }
+
+def from_environment():
+    return Profiler(
+        sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+        interval_ms=float(os.environ.get('PROFILE_INTERVAL_MS', 5)),
+    )
+
+profiler = from_environment()
@@ -0,0 +1,185 @@
+"""
+Versioned cache of query results.
+
+Results (DataFrames) are keyed by SQL text, parameters and the data version
+they were read at. The tables only change through uploads, which bump the
+data version, so an entry stays valid until the next bump and is never
+served after it: nothing expires on a timer. Entries of older versions are
+dropped as soon as a newer version is seen.
+
+The in-process cache is an LRU capped in bytes. With a directory set
+(QUERY_CACHE_DIR), results are also written there as pickles, so every
+worker process on the host reuses a result read by any one of them; the
+directory has its own byte cap, evicting the least recently used files.
+
+Configure with the environment variables:
+    QUERY_CACHE_BYTES       in-process cap (default 256 MB, 0 disables)
+    QUERY_CACHE_DIR         shared directory (default: none)
+    QUERY_CACHE_DIR_BYTES   directory cap (default 1 GB)
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+DEFAULT_MAX_BYTES = 256 * 2**20
+DEFAULT_DIR_MAX_BYTES = 2**30
+
+def frame_bytes(df):
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+def key_digest(sql_query, params):
+    return hashlib.sha256(repr((sql_query, params)).encode()).hexdigest()
+
+class DiskStore:
+    """Result pickles in a directory shared by worker processes, named <data version>-<digest>.pkl."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, data_version, digest):
+        return os.path.join(self.directory, f"{data_version}-{digest}.pkl")
+
+    def get(self, data_version, digest):
+        path = self.path(data_version, digest)
+        try:
+            df = pd.read_pickle(path)
+            os.utime(path)
+            return df
+        except (FileNotFoundError, EOFError):
+            return None
+
+    def put(self, data_version, digest, df):
+        path = self.path(data_version, digest)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        df.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def files(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.pkl'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        return entries
+
+    def evict(self):
+        """Removes the least recently used files until the directory is under its cap."""
+        entries = sorted(self.files())
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            self.remove(name)
+            total -= size
+
+    def drop_before(self, data_version):
+        for _, _, name in self.files():
+            version = name.split('-', 1)[0]
+            if version.isdigit() and int(version) < data_version:
+                self.remove(name)
+
+    def remove(self, name):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+class QueryCache:
+    """Byte-capped LRU of query results, optionally backed by a shared DiskStore."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, directory=None, dir_max_bytes=DEFAULT_DIR_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.disk = DiskStore(directory, dir_max_bytes) if directory else None
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.latest_version = None
+        self.counts = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0, 'too_large': 0}
+
+    def observe_version(self, data_version):
+        """Drops the entries of versions older than `data_version`."""
+        with self.lock:
+            if self.latest_version is not None and data_version <= self.latest_version:
+                return
+            self.latest_version = data_version
+            stale = [key for key in self.entries if key[0] < data_version]
+            for key in stale:
+                self.bytes -= self.entries.pop(key)[1]
+            self.counts['invalidations'] += len(stale)
+        if self.disk is not None:
+            self.disk.drop_before(data_version)
+
+    def get(self, sql_query, params, data_version):
+        """Returns the cached result, or None. Callers must not modify it."""
+        if data_version is None:
+            return None
+        self.observe_version(data_version)
+        digest = key_digest(sql_query, params)
+        key = (data_version, digest)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.counts['hits'] += 1
+                return entry[0]
+        df = self.disk.get(data_version, digest) if self.disk is not None else None
+        with self.lock:
+            self.counts['disk_hits' if df is not None else 'misses'] += 1
+        if df is not None:
+            self.remember(key, df)
+        return df
+
+    def put(self, sql_query, params, data_version, df):
+        if data_version is None:
+            return
+        digest = key_digest(sql_query, params)
+        self.remember((data_version, digest), df)
+        if self.disk is not None:
+            self.disk.put(data_version, digest, df)
+
+    def remember(self, key, df):
+        size = frame_bytes(df)
+        with self.lock:
+            if key[0] < (self.latest_version or 0):
+                return
+            if size > self.max_bytes:
+                self.counts['too_large'] += 1
+                return
+            if key in self.entries:
+                self.bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (df, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.counts['evictions'] += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counts['hits'] + self.counts['disk_hits'] + self.counts['misses']
+            return dict(
+                self.counts,
+                hit_rate=round((self.counts['hits'] + self.counts['disk_hits']) / lookups, 4) if lookups else None,
+                entries=len(self.entries),
+                bytes=self.bytes,
+                max_bytes=self.max_bytes,
+                data_version=self.latest_version,
+                shared_directory=self.disk.directory if self.disk is not None else None,
+            )
+
+def from_environment():
+    return QueryCache(
+        max_bytes=int(os.environ.get('QUERY_CACHE_BYTES', DEFAULT_MAX_BYTES)),
+        directory=os.environ.get('QUERY_CACHE_DIR') or None,
+        dir_max_bytes=int(os.environ.get('QUERY_CACHE_DIR_BYTES', DEFAULT_DIR_MAX_BYTES)),
+    )
@@ -0,0 +1,345 @@
+"""
+Incremental RFM (recency, frequency, monetary) scoring.
+
+Every customer gets a 1-5 score per dimension, by quintile of all
+customers: the last purchase date (recency, 5 = most recent), the number
+of orders (frequency) and the total spend (monetary). The code '545' is
+R=5, F=4, M=5, and the R and F scores name the marketing segment.
+
+The quintiles come from one quantile sketch per dimension, stored as the
+number of customers per bucket (table rfm_sketch). Recency is bucketed by
+day, so its quantiles are exact; frequency and spend by powers of GAMMA,
+so a quantile is off by at most RELATIVE_ACCURACY of its value (as in
+DDSketch). Unlike a sampling sketch, a bucket count can be decremented,
+which lets a customer whose values change be taken out again.
+
+After an upload only the uploaded customers' values are recomputed and
+moved between buckets. The quintile boundaries are then read from the
+sketch; when one moves, only the customers between its old and new
+bucket are rescored (an indexed range). Segment counts are kept per code
+(rfm_segments) and updated by the same deltas.
+
+Rebuild everything with:
+    python rfm.py
+"""
+
+import math
+import datetime
+import numpy as np
+import psycopg2
+
+# --- Database Connection Details ---
+DB_NAME = "hackathon"
+DB_USER = "postgres"
+DB_PASS = "Post@7070" # <-- IMPORTANT: Change this
+DB_HOST = "localhost"
+DB_PORT = "5432"
+
+# Arbitrary key so rebuilds and incremental refreshes apply one at a time
+RFM_LOCK_ID = 7074
+
+SCORES = 5
+DIMENSIONS = ('recency', 'frequency', 'monetary')
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+
+# Recency buckets are days since this date
+RECENCY_EPOCH = datetime.date(2000, 1, 1)
+
+# Bucket of a missing purchase date, or of no spend: below every other
+EMPTY_BUCKET = -1000000
+
+# Named segments by R and F score ranges; together they cover all 25 pairs
+SEGMENTS = [
+    ('Champions', (5, 5), (4, 5)),
+    ('Loyal Customers', (3, 4), (4, 5)),
+    ('Potential Loyalists', (4, 5), (2, 3)),
+    ('New Customers', (5, 5), (1, 1)),
+    ('Promising', (4, 4), (1, 1)),
+    ('Need Attention', (3, 3), (3, 3)),
+    ('About to Sleep', (3, 3), (1, 2)),
+    ("Can't Lose Them", (1, 2), (5, 5)),
+    ('At Risk', (1, 2), (3, 4)),
+    ('Hibernating', (1, 2), (1, 2)),
+]
+
+def log_bucket(column):
+    """SQL for the sketch bucket of a positive value: the i with GAMMA^(i-1) < value <= GAMMA^i."""
+    return f"CASE WHEN {column} > 0 THEN CEIL(LN({column}) / {math.log(GAMMA)!r})::int ELSE {EMPTY_BUCKET} END"
+
+# Values and buckets of the customers with orders, or of %(customer_ids)s only
+CUSTOMER_VALUES_SQL = f"""
+    SELECT customer_id, last_purchase_date, purchase_count, total_spend,
+           COALESCE(last_purchase_date - DATE '{RECENCY_EPOCH}', {EMPTY_BUCKET}) AS recency_bucket,
+           {log_bucket('purchase_count')} AS frequency_bucket,
+           {log_bucket('total_spend')} AS monetary_bucket
+    FROM (
+        SELECT customer_id,
+               MAX(last_purchase_date) AS last_purchase_date,
+               COUNT(order_id) AS purchase_count,
+               SUM(unit_price * quantity) AS total_spend
+        FROM orders
+        WHERE %(customer_ids)s::text[] IS NULL OR customer_id = ANY(%(customer_ids)s)
+        GROUP BY customer_id
+    ) customer_values
+"""
+
+# Takes the given customers' previous buckets out of the sketches and puts the new ones in
+SKETCH_DELTA_SQL = """
+    INSERT INTO rfm_sketch (dimension, bucket, customers)
+    SELECT d.dimension, d.bucket, SUM(d.customers)
+    FROM (
+        SELECT -1 AS customers, recency_bucket, frequency_bucket, monetary_bucket
+        FROM customer_rfm WHERE customer_id = ANY(%(customer_ids)s)
+        UNION ALL
+        SELECT 1, recency_bucket, frequency_bucket, monetary_bucket FROM new_values
+    ) v
+    CROSS JOIN LATERAL (VALUES
+        ('recency', v.recency_bucket, v.customers),
+        ('frequency', v.frequency_bucket, v.customers),
+        ('monetary', v.monetary_bucket, v.customers)
+    ) d(dimension, bucket, customers)
+    GROUP BY d.dimension, d.bucket
+    HAVING SUM(d.customers) <> 0
+    ON CONFLICT (dimension, bucket) DO UPDATE SET customers = rfm_sketch.customers + EXCLUDED.customers;
+"""
+
+# Drops the given customers left without orders, and their segment counts
+REMOVE_SQL = """
+    WITH removed AS (
+        DELETE FROM customer_rfm
+        WHERE customer_id = ANY(%(customer_ids)s) AND customer_id NOT IN (SELECT customer_id FROM new_values)
+        RETURNING r, f, m
+    )
+    UPDATE rfm_segments s SET customers = s.customers - old.customers
+    FROM (SELECT r, f, m, COUNT(*) AS customers FROM removed GROUP BY r, f, m) old
+    WHERE (s.r, s.f, s.m) = (old.r, old.f, old.m);
+"""
+
+UPSERT_VALUES_SQL = """
+    INSERT INTO customer_rfm (customer_id, last_purchase_date, purchase_count, total_spend,
+                              recency_bucket, frequency_bucket, monetary_bucket)
+    SELECT customer_id, last_purchase_date, purchase_count, total_spend,
+           recency_bucket, frequency_bucket, monetary_bucket
+    FROM new_values
+    ON CONFLICT (customer_id) DO UPDATE SET
+        last_purchase_date = EXCLUDED.last_purchase_date,
+        purchase_count = EXCLUDED.purchase_count,
+        total_spend = EXCLUDED.total_spend,
+        recency_bucket = EXCLUDED.recency_bucket,
+        frequency_bucket = EXCLUDED.frequency_bucket,
+        monetary_bucket = EXCLUDED.monetary_bucket;
+"""
+
+# A score is 1 plus the number of boundaries its bucket lies above
+RESCORE_SQL = """
+    UPDATE customer_rfm SET
+        r = 1 + width_bucket(recency_bucket, %(recency)s::int[]),
+        f = 1 + width_bucket(frequency_bucket, %(frequency)s::int[]),
+        m = 1 + width_bucket(monetary_bucket, %(monetary)s::int[]),
+        scored_at = NOW()
+    WHERE customer_id IN (SELECT customer_id FROM rescored);
+"""
+
+RESCORED_CODES_SQL = """
+    SELECT r, f, m, COUNT(*) AS customers
+    FROM customer_rfm
+    WHERE customer_id IN (SELECT customer_id FROM rescored)
+    GROUP BY r, f, m
+"""
+
+HAS_SCORES_SQL = "SELECT EXISTS (SELECT 1 FROM customer_rfm);"
+
+def has_scores(conn):
+    """True once the customers have been scored."""
+    with conn.cursor() as cursor:
+        cursor.execute(HAS_SCORES_SQL)
+        return cursor.fetchone()[0]
+
+def quantile_cuts(buckets, counts):
+    """
+    The bucket of each quintile boundary of a sketch: the first bucket
+    holding the 20%, 40%, 60% and 80% ranks.
+    """
+    cumulative = np.cumsum(counts)
+    ranks = np.ceil(cumulative[-1] * np.arange(1, SCORES) / SCORES)
+    return [int(bucket) for bucket in np.asarray(buckets)[np.searchsorted(cumulative, ranks)]]
+
+def read_cuts(cursor):
+    cursor.execute("SELECT dimension, cuts FROM rfm_cuts;")
+    return dict(cursor.fetchall())
+
+def refresh(conn, customer_ids=None):
+    """
+    Brings the RFM scores up to date, in one transaction. With customer ids
+    (the customers of an upload), only those customers' values are
+    recomputed, and those left without orders dropped; otherwise everything
+    is rebuilt. Returns how many customers
+    were (re)scored.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s);", (RFM_LOCK_ID,))
+        if customer_ids is None:
+            cursor.execute("TRUNCATE customer_rfm, rfm_sketch, rfm_cuts, rfm_segments;")
+        params = {'customer_ids': None if customer_ids is None else list(customer_ids)}
+        cursor.execute(f"CREATE TEMP TABLE new_values ON COMMIT DROP AS {CUSTOMER_VALUES_SQL};", params)
+        cursor.execute(SKETCH_DELTA_SQL, params)
+        cursor.execute("DELETE FROM rfm_sketch WHERE customers <= 0;")
+        cursor.execute(REMOVE_SQL, params)
+
+        cursor.execute("SELECT dimension, bucket, customers FROM rfm_sketch ORDER BY dimension, bucket;")
+        sketches = {}
+        for dimension, bucket, customers in cursor.fetchall():
+            sketches.setdefault(dimension, ([], []))
+            sketches[dimension][0].append(bucket)
+            sketches[dimension][1].append(customers)
+        if not sketches:
+            conn.commit()
+            return 0
+        cuts = {dimension: quantile_cuts(*sketches[dimension]) for dimension in DIMENSIONS}
+        old_cuts = read_cuts(cursor)
+
+        # The uploaded customers, and those a moved boundary puts on its other side
+        cursor.execute("CREATE TEMP TABLE rescored (customer_id VARCHAR(50) PRIMARY KEY) ON COMMIT DROP;")
+        cursor.execute("INSERT INTO rescored SELECT customer_id FROM new_values;")
+        for dimension in DIMENSIONS:
+            previous = old_cuts.get(dimension)
+            if previous is None and customer_ids is not None:
+                cursor.execute("INSERT INTO rescored SELECT customer_id FROM customer_rfm ON CONFLICT DO NOTHING;")
+                continue
+            for old, new in zip(previous or [], cuts[dimension]):
+                if old != new:
+                    cursor.execute(f"""
+                        INSERT INTO rescored
+                        SELECT customer_id FROM customer_rfm
+                        WHERE {dimension}_bucket > %(low)s AND {dimension}_bucket <= %(high)s
+                        ON CONFLICT DO NOTHING;
+                    """, {'low': min(old, new), 'high': max(old, new)})
+
+        cursor.execute(f"""
+            UPDATE rfm_segments s SET customers = s.customers - old.customers
+            FROM ({RESCORED_CODES_SQL}) old
+            WHERE (s.r, s.f, s.m) = (old.r, old.f, old.m);
+        """)
+        cursor.execute(UPSERT_VALUES_SQL)
+        # width_bucket counts the thresholds at or below a bucket; a score needs those strictly below
+        cursor.execute(RESCORE_SQL, {dimension: [cut + 1 for cut in cuts[dimension]] for dimension in DIMENSIONS})
+        cursor.execute(f"""
+            INSERT INTO rfm_segments (r, f, m, customers)
+            {RESCORED_CODES_SQL}
+            ON CONFLICT (r, f, m) DO UPDATE SET customers = rfm_segments.customers + EXCLUDED.customers;
+        """)
+        cursor.execute("DELETE FROM rfm_segments WHERE customers <= 0;")
+        for dimension in DIMENSIONS:
+            cursor.execute("""
+                INSERT INTO rfm_cuts (dimension, cuts) VALUES (%s, %s)
+                ON CONFLICT (dimension) DO UPDATE SET cuts = EXCLUDED.cuts, updated_at = NOW();
+            """, (dimension, cuts[dimension]))
+        cursor.execute("SELECT COUNT(*) FROM rescored;")
+        rescored = cursor.fetchone()[0]
+    conn.commit()
+    return rescored
+
+# --- Lookups ---
+def segment_of(r, f):
+    for name, (r_low, r_high), (f_low, f_high) in SEGMENTS:
+        if r_low <= r <= r_high and f_low <= f <= f_high:
+            return name
+    return None
+
+def segment_ranges(name):
+    """The (R, F) score ranges of a named segment, or None if there is no such segment."""
+    for segment, r_range, f_range in SEGMENTS:
+        if segment == name:
+            return r_range, f_range
+    return None
+
+def bucket_value(dimension, bucket):
+    """The largest value of a sketch bucket: a date for recency, a count or amount otherwise."""
+    if bucket == EMPTY_BUCKET:
+        return None
+    if dimension == 'recency':
+        return (RECENCY_EPOCH + datetime.timedelta(days=bucket)).isoformat()
+    if dimension == 'frequency':
+        return math.floor(GAMMA ** bucket + 1e-9)
+    return round(GAMMA ** bucket, 2)
+
+def segment_counts(conn, codes=False):
+    """
+    Customers per named segment (and per code if `codes`), with the
+    quintile boundaries: a customer scores above k in a dimension when
+    their value is above the k-th boundary.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT r, f, m, customers FROM rfm_segments ORDER BY r DESC, f DESC, m DESC;")
+        rows = cursor.fetchall()
+        cuts = read_cuts(cursor)
+
+    total = sum(row[3] for row in rows)
+    by_segment = dict.fromkeys((name for name, _, _ in SEGMENTS), 0)
+    for r, f, m, customers in rows:
+        by_segment[segment_of(r, f)] += customers
+    result = {
+        'customers': total,
+        'boundaries': {
+            dimension: [bucket_value(dimension, bucket) for bucket in cuts.get(dimension, [])]
+            for dimension in DIMENSIONS
+        },
+        'segments': [
+            {'segment': name, 'customers': customers,
+             'share': round(customers / total * 100, 2) if total else 0}
+            for name, customers in by_segment.items()
+        ],
+    }
+    if codes:
+        result['codes'] = [
+            {'code': f"{r}{f}{m}", 'r': r, 'f': f, 'm': m, 'segment': segment_of(r, f), 'customers': customers}
+            for r, f, m, customers in rows
+        ]
+    return result
+
+CUSTOMER_RFM_SQL = """
+    SELECT customer_id, r, f, m, last_purchase_date, purchase_count, total_spend, scored_at
+    FROM customer_rfm
+    {where}
+"""
+
+def customer_record(row):
+    customer_id, r, f, m, last_purchase_date, purchase_count, total_spend, scored_at = row
+    return {
+        'customer_id': customer_id,
+        'code': f"{r}{f}{m}",
+        'r': r, 'f': f, 'm': m,
+        'segment': segment_of(r, f),
+        'last_purchase_date': last_purchase_date.isoformat() if last_purchase_date else None,
+        'purchase_count': purchase_count,
+        'total_spend': float(total_spend) if total_spend is not None else None,
+        'scored_at': scored_at.isoformat(),
+    }
+
+def customer_scores(conn, customer_id):
+    """A customer's RFM code and values, or None if the customer has no orders."""
+    with conn.cursor() as cursor:
+        cursor.execute(CUSTOMER_RFM_SQL.format(where="WHERE customer_id = %s"), (customer_id,))
+        row = cursor.fetchone()
+    return customer_record(row) if row else None
+
+def customers_in(conn, r_range, f_range, m_range=(1, SCORES), limit=100):
+    """The customers whose scores fall in the given ranges, highest spend first."""
+    with conn.cursor() as cursor:
+        cursor.execute(CUSTOMER_RFM_SQL.format(where="""
+            WHERE r BETWEEN %s AND %s AND f BETWEEN %s AND %s AND m BETWEEN %s AND %s
+            ORDER BY total_spend DESC NULLS LAST, customer_id
+            LIMIT %s
+        """), (*r_range, *f_range, *m_range, limit))
+        return [customer_record(row) for row in cursor.fetchall()]
+
+# --- Main Execution Block ---
+if __name__ == '__main__':
+    conn = psycopg2.connect(database=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT)
+    try:
+        count = refresh(conn)
+        print(f"Success: RFM scores rebuilt for {count} customers.")
+    finally:
+        conn.close()
@@ -9,6 +9,7 @@ import sys
 import subprocess
 import psycopg2
 from psycopg2 import sql
+from migrations import apply_migrations
 
 # Database configuration
 DB_CONFIG = {
@@ -32,7 +33,7 @@ def run_command(command, description):
         return False
 
 def create_database_tables():
-    """Create the required database tables."""
+    """Create the required database tables and indexes via migrations."""
     print("\n🗄️  Setting up database tables...")
     
     try:
@@ -43,47 +44,9 @@ def create_database_tables():
             host=DB_CONFIG['DB_HOST'],
             port=DB_CONFIG['DB_PORT']
         )
-        cursor = conn.cursor()
+        # Apply any pending schema migrations (tables, then indexes)
+        apply_migrations(conn)
         
-        # Create tables
-        tables = [
-            """
-            CREATE TABLE IF NOT EXISTS customers (
-                customer_id VARCHAR(50) PRIMARY KEY,
-                age INTEGER,
-                gender VARCHAR(20),
-                country VARCHAR(50),
-                signup_date DATE
-            );
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS products (
-                product_id VARCHAR(50) PRIMARY KEY,
-                product_name VARCHAR(200),
-                category VARCHAR(100)
-            );
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS orders (
-                order_id VARCHAR(50) PRIMARY KEY,
-                customer_id VARCHAR(50) REFERENCES customers(customer_id),
-                product_id VARCHAR(50) REFERENCES products(product_id),
-                last_purchase_date DATE,
-                cancellations_count INTEGER,
-                subscription_status VARCHAR(50),
-                unit_price DECIMAL(10,2),
-                quantity INTEGER,
-                purchase_frequency DECIMAL(10,2),
-                ratings DECIMAL(3,2)
-            );
-            """
-        ]
-        
-        for table_sql in tables:
-            cursor.execute(table_sql)
-        
-        conn.commit()
-        cursor.close()
         conn.close()
         print("✅ Database tables created successfully")
         return True
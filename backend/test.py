@@ -1,6 +1,8 @@
 import pandas as pd
 import psycopg2
 from psycopg2 import extras
+from data_importer import INSERT_CUSTOMERS_SQL, INSERT_ORDERS_SQL, BUMP_DATA_VERSION_SQL
+import excel_stream
 
 # --- Database Connection Details ---
 DB_NAME = "hackathon"
@@ -28,11 +30,10 @@ def insert_data(conn, df):
     try:
         customers = df[['customer_id', 'age', 'gender', 'country', 'signup_date']].drop_duplicates(subset=['customer_id'])
         customer_tuples = [tuple(x) for x in customers.to_numpy()]
-        # Using lowercase "customers" table name
-        extras.execute_values(cursor, 
-            "INSERT INTO customers (customer_id, age, gender, country, signup_date) VALUES %s ON CONFLICT (customer_id) DO NOTHING", 
-            customer_tuples)
-        print("-> {} customers inserted.".format(cursor.rowcount))
+        # Using lowercase "customers" table name; also updates the customer sample
+        # and returns the customers inserted, one count per page
+        pages = extras.execute_values(cursor, INSERT_CUSTOMERS_SQL, customer_tuples, fetch=True)
+        print("-> {} customers inserted.".format(sum(page[0] for page in pages)))
 
         products = df[['product_id', 'product_name', 'category']].drop_duplicates(subset=['product_id'])
         product_tuples = [tuple(x) for x in products.to_numpy()]
@@ -44,11 +45,12 @@ def insert_data(conn, df):
 
         orders = df[['order_id', 'customer_id', 'product_id', 'last_purchase_date', 'cancellations_count', 'subscription_status', 'unit_price', 'quantity', 'purchase_frequency', 'Ratings']]
         order_tuples = [tuple(x) for x in orders.to_numpy()]
-        # Using lowercase "orders" table name
-        extras.execute_values(cursor, 
-            "INSERT INTO orders (order_id, customer_id, product_id, last_purchase_date, cancellations_count, subscription_status, unit_price, quantity, purchase_frequency, ratings) VALUES %s ON CONFLICT (order_id) DO NOTHING", 
-            order_tuples)
-        print("-> {} orders inserted.".format(cursor.rowcount))
+        # Using lowercase "orders" table name; also updates the product_sales leaderboard
+        # and returns the orders inserted, one count per page
+        pages = extras.execute_values(cursor, INSERT_ORDERS_SQL, order_tuples, fetch=True)
+        print("-> {} orders inserted.".format(sum(page[0] for page in pages)))
+        cursor.execute(BUMP_DATA_VERSION_SQL)
+        print("-> Data version is now {}.".format(cursor.fetchone()[0]))
         conn.commit()
     except Exception as e:
         print("Error: An error occurred during insertion: {}".format(e))
@@ -59,11 +61,11 @@ def insert_data(conn, df):
 def main():
     """Main function to run the entire data import process."""
     try:
-        df = pd.read_excel(EXCEL_FILE_PATH)
-        df = clean_data(df)
         conn = psycopg2.connect(database=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT)
         print("Success: Database connection successful.")
-        insert_data(conn, df)
+        # Large workbooks are read and inserted in chunks
+        for df in excel_stream.iter_excel_chunks(EXCEL_FILE_PATH):
+            insert_data(conn, clean_data(df))
         conn.close()
         print("\nData import complete and connection closed.")
     except IOError: 
@@ -1,8 +1,12 @@
+import os
+import sys
+import json
+import datetime
+import threading
 import pandas as pd
 import psycopg2
 import joblib
 import warnings
-from statsmodels.tsa.statespace.sarimax import SARIMAX
 
 warnings.filterwarnings('ignore')
 
@@ -13,8 +17,27 @@ DB_PASS = "Post@7070" # <-- IMPORTANT: Change this
 DB_HOST = "localhost"
 DB_PORT = "5432"
 
-def get_sales_data():
-    """Fetches raw order data to create a sales time-series."""
+# --- Forecaster Artifacts ---
+FORECASTER_PATH = 'sales_forecaster.pkl'
+FORECASTER_META_PATH = 'sales_forecaster_meta.json'
+
+# A full refit happens at least this often; in between, new days are appended
+# to the saved results while keeping the fitted parameters.
+FULL_REFIT_INTERVAL_DAYS = 30
+# Refit early if the mean absolute one-step error on the new days exceeds this
+# many training residual standard deviations.
+DRIFT_THRESHOLD = 3.0
+
+# Updates run one at a time: threads through update_lock, processes (API
+# workers, `--update` runs) through an arbitrary advisory lock key
+update_lock = threading.Lock()
+FORECASTER_LOCK_ID = 7075
+
+def get_sales_data(since=None):
+    """Fetches raw order data to create a sales time-series.
+
+    If `since` is given, only orders dated after it are returned.
+    """
     conn = None
     try:
         conn = psycopg2.connect(
@@ -28,10 +51,14 @@ def get_sales_data():
                 last_purchase_date,
                 (unit_price * quantity) as order_amount
             FROM
-                orders;
+                orders
         """
+        params = None
+        if since is not None:
+            sql_query += " WHERE last_purchase_date > %s"
+            params = (since,)
         
-        df = pd.read_sql(sql_query, conn)
+        df = pd.read_sql(sql_query, conn, params=params)
         print("Success: Sales data loaded from database.")
         return df
 
@@ -42,37 +69,140 @@ def get_sales_data():
         if conn is not None:
             conn.close()
 
+def prepare_daily_sales(df):
+    """Aggregates raw order amounts into a daily sales series, leaving `df` as it was."""
+    df = df.assign(last_purchase_date=pd.to_datetime(df['last_purchase_date'], errors='coerce'))
+    df = df.dropna(subset=['last_purchase_date', 'order_amount']).copy()
+    df['order_amount'] = df['order_amount'].astype(float)
+    return df.groupby('last_purchase_date')['order_amount'].sum().asfreq('D').fillna(0)
+
+def load_forecaster_meta():
+    """Loads the metadata saved alongside the forecaster, or None if missing."""
+    try:
+        with open(FORECASTER_META_PATH) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def save_forecaster(results, meta):
+    """Saves the results and metadata, replacing the old files atomically."""
+    tmp_path = FORECASTER_PATH + '.tmp'
+    joblib.dump(results, tmp_path)
+    os.replace(tmp_path, FORECASTER_PATH)
+
+    tmp_meta_path = FORECASTER_META_PATH + '.tmp'
+    with open(tmp_meta_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_meta_path, FORECASTER_META_PATH)
+
 def train_and_save_forecaster(df):
     """Prepares time-series data and trains and saves a SARIMAX model."""
     
     # 1. Prepare the time-series data
-    df['last_purchase_date'] = pd.to_datetime(df['last_purchase_date'], errors='coerce')
-    df = df.dropna(subset=['last_purchase_date', 'order_amount'])
-    
-    # Aggregate sales by day
-    sales_daily = df.groupby('last_purchase_date')['order_amount'].sum().asfreq('D').fillna(0)
+    sales_daily = prepare_daily_sales(df)
     
     if len(sales_daily) < 14:
         print("Error: Not enough daily data to train the forecasting model.")
-        return
+        return None
 
     # 2. Train the SARIMAX model (using parameters from the notebook)
     print("Training SARIMAX model... this may take a moment.")
     try:
+        # Imported here: statsmodels is slow to import and the API only needs it to fit
+        from statsmodels.tsa.statespace.sarimax import SARIMAX
         # The model uses weekly seasonality (m=7)
         model = SARIMAX(sales_daily, order=(1, 1, 1), seasonal_order=(1, 1, 1, 7))
         results = model.fit(disp=False)
         
         # 3. Save the trained model
-        joblib.dump(results, 'sales_forecaster.pkl')
-        print("\nSuccess: Sales forecasting model trained and saved to 'sales_forecaster.pkl'")
+        meta = {
+            'last_full_fit': datetime.datetime.now().isoformat(),
+            'last_observation': sales_daily.index[-1].strftime('%Y-%m-%d'),
+            'n_observations': int(len(sales_daily)),
+            'resid_std': float(results.resid.std()),
+        }
+        save_forecaster(results, meta)
+        print(f"\nSuccess: Sales forecasting model trained and saved to '{FORECASTER_PATH}'")
+        return results
 
     except Exception as e:
         print(f"Error during model training: {e}")
+        return None
+
+def full_refit_due(meta):
+    """Returns True if the scheduled full refit interval has elapsed."""
+    last_full_fit = datetime.datetime.fromisoformat(meta['last_full_fit'])
+    return datetime.datetime.now() - last_full_fit >= datetime.timedelta(days=FULL_REFIT_INTERVAL_DAYS)
+
+def update_forecaster():
+    """Appends new daily sales to the saved forecaster without refitting.
+
+    Falls back to a full refit when no forecaster exists yet, when the refit
+    interval has elapsed, or when the new days drift from the fitted model.
+    Only days after the last modelled day are appended; corrections to
+    earlier days are picked up by the next full refit. Concurrent updates
+    wait for each other, so each starts from the files the last one saved.
+    """
+    with update_lock:
+        conn = psycopg2.connect(
+            database=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT
+        )
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                # Held until the connection closes
+                cursor.execute("SELECT pg_advisory_lock(%s);", (FORECASTER_LOCK_ID,))
+            return append_new_days()
+        finally:
+            conn.close()
+
+def append_new_days():
+    """The body of update_forecaster, run while holding its locks."""
+    meta = load_forecaster_meta()
+    try:
+        results = joblib.load(FORECASTER_PATH)
+    except FileNotFoundError:
+        results = None
+
+    if results is None or meta is None or full_refit_due(meta):
+        print("Info: Running a full refit of the sales forecaster.")
+        sales_df = get_sales_data()
+        return train_and_save_forecaster(sales_df) if sales_df is not None else None
+
+    last_date = results.fittedvalues.index[-1]
+    new_df = get_sales_data(since=last_date.date())
+    if new_df is None:
+        return None
+
+    new_daily = prepare_daily_sales(new_df)
+    if new_daily.empty:
+        print("Info: No new daily observations; forecaster is up to date.")
+        return results
+
+    # Keep the series contiguous, with zero sales on days without orders.
+    new_index = pd.date_range(last_date + pd.Timedelta(days=1), new_daily.index.max(), freq='D')
+    new_daily = new_daily.reindex(new_index, fill_value=0)
+
+    updated = results.append(new_daily, refit=False)
+
+    new_errors = updated.resid.iloc[-len(new_daily):].abs().mean()
+    if new_errors > DRIFT_THRESHOLD * meta['resid_std']:
+        print(f"Info: Drift detected (mean abs error {new_errors:.2f}); running a full refit.")
+        sales_df = get_sales_data()
+        return train_and_save_forecaster(sales_df) if sales_df is not None else None
+
+    meta['last_observation'] = new_index[-1].strftime('%Y-%m-%d')
+    meta['n_observations'] = int(meta['n_observations'] + len(new_daily))
+    save_forecaster(updated, meta)
+    print(f"Success: Appended {len(new_daily)} new days to the sales forecaster.")
+    return updated
 
 # --- Main Execution Block ---
 if __name__ == '__main__':
-    sales_df = get_sales_data()
-    
-    if sales_df is not None:
-        train_and_save_forecaster(sales_df)
\ No newline at end of file
+    if '--update' in sys.argv:
+        update_forecaster()
+    else:
+        sales_df = get_sales_data()
+
+        if sales_df is not None:
+            train_and_save_forecaster(sales_df)
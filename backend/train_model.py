@@ -2,7 +2,7 @@ import pandas as pd
 import psycopg2
 import numpy as np
 from datetime import datetime
-import joblib
+import model_registry
 import warnings
 
 warnings.filterwarnings('ignore')
@@ -153,15 +153,32 @@ def train_and_save_model(df):
     print(f"\nModel Evaluation (Random Forest) ROC-AUC: {auc:.4f}")
     print("Classification Report:\n", classification_report(y_test, model.predict(X_test)))
 
-    # 8. Save the model, scaler, and columns
+    # 8. Register the model, scaler, and columns as a new version
     model_data_package = {
         'model': model,
         'scaler': scaler,
         'numeric_columns': features_to_use,
         'model_columns': final_feature_columns
     }
-    joblib.dump(model_data_package, 'churn_model.pkl')
-    print("\nSuccess: New Random Forest model saved to 'churn_model.pkl'")
+    meta = {
+        'numeric_columns': features_to_use,
+        'model_columns': final_feature_columns,
+        'metrics': {
+            'roc_auc': round(float(auc), 4),
+            'train_rows': int(len(X_train)),
+            'test_rows': int(len(X_test)),
+            'churn_rate': round(float(y.mean()), 4),
+        },
+        'trained_at': datetime.now().isoformat(),
+        'n_estimators': model.n_estimators,
+    }
+    version = model_registry.register_version(model_data_package, meta)
+    print(f"\nSuccess: New Random Forest model registered as {version} in '{model_registry.REGISTRY_DIR}'")
+    if model_registry.read_registry()['current'] is None:
+        model_registry.set_current(version)
+        print(f"Success: {version} deployed as the first model version.")
+    else:
+        print(f"To deploy it, POST /api/models/{version}/activate (or /api/models/{version}/shadow to try it first).")
 
 # --- Main Execution Block ---
 if __name__ == '__main__':